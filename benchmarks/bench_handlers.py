@@ -0,0 +1,211 @@
+# Benchmark offline cho các handler thật (play, đoán số, daily, mua đồ,
+# bảng xếp hạng, PvP): N người chơi mô phỏng chạy đồng thời trên một event
+# loop, update giả đi qua Application.process_update như khi chạy thật, Bot
+# API được thay bằng fake_telegram nên không cần mạng hay BOT_TOKEN.
+# Báo cáo p50/p99 theo handler, thông lượng, chi phí ghi dữ liệu và bộ nhớ
+# cho mỗi người chơi. Dùng được trong CI:
+#   python benchmarks/bench_handlers.py --players 500 --games 3 --max-p99-ms 20 --json out.json
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from fake_telegram import (  # noqa: E402
+    FAKE_TOKEN, FakeTelegramRequest, make_message_update, make_callback_update
+)
+
+FIRST_USER_ID = 10**9
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Driver:
+    def __init__(self, bot, app):
+        self.bot = bot
+        self.app = app
+        self.timings = {}
+        self.updates = 0
+
+    async def send(self, kind, data):
+        from telegram import Update
+        update = Update.de_json(data, self.app.bot)
+        started = time.perf_counter()
+        await self.app.process_update(update)
+        self.timings.setdefault(kind, []).append(time.perf_counter() - started)
+        self.updates += 1
+
+    async def solo_game(self, user_id):
+        # Người chơi đoán theo tìm kiếm nhị phân, đọc gợi ý cao/thấp từ chính ván chơi
+        await self.send("play", make_message_update(user_id, "/play"))
+        game = self.bot.user_games.solo(user_id)
+        low, high = game.low, game.high
+        while self.bot.user_games.solo(user_id) is game:
+            guess = (low + high) // 2
+            await self.send("guess", make_message_update(user_id, str(guess)))
+            if guess < game.secret:
+                low = guess + 1
+            else:
+                high = guess - 1
+
+    async def pvp_match(self, a, b):
+        await self.send("pvp", make_message_update(a, f"/pvp {b}"))
+        await self.send("pvp", make_message_update(b, "/pvp accept"))
+        game = self.bot.user_games.pvp(a)
+        if game is None:
+            return
+        bounds = {a: [game.low, game.high], b: [game.low, game.high]}
+        turn = 0
+        while self.bot.user_games.pvp(a) is game:
+            player = (a, b)[turn % 2]
+            turn += 1
+            low, high = bounds[player]
+            guess = random.randint(low, high) if low <= high else low
+            await self.send("pvp_guess", make_message_update(player, str(guess)))
+            if guess < game.secret:
+                bounds[player][0] = guess + 1
+            else:
+                bounds[player][1] = guess - 1
+
+    async def player(self, user_id, games):
+        await self.send("daily", make_message_update(user_id, "/daily"))
+        for _ in range(games):
+            await self.solo_game(user_id)
+        await self.send("buy", make_callback_update(user_id, "buy_hint_type"))
+        await self.send("stats", make_message_update(user_id, "/stats"))
+        await self.send("leaderboard", make_message_update(user_id, "/leaderboard"))
+
+
+async def run_load(bot, players, games):
+    app = bot.build_application(FAKE_TOKEN, request=FakeTelegramRequest(), polling=False)
+    await app.initialize()
+    await bot.on_startup(app)
+    driver = Driver(bot, app)
+    save_time = [0.0]
+    observer = bot.flusher.observer
+
+    def observe_save(seconds, records, size):
+        save_time[0] += seconds
+        if observer is not None:
+            observer(seconds, records, size)
+    bot.flusher.observer = observe_save
+
+    users = range(FIRST_USER_ID, FIRST_USER_ID + players)
+    started = time.perf_counter()
+    await asyncio.gather(*(driver.player(uid, games) for uid in users))
+    # Các cặp người chơi liền nhau đấu PvP với nhau
+    await asyncio.gather(*(driver.pvp_match(uid, uid + 1) for uid in users[:players - 1:2]))
+    await bot.flusher.flush()
+    elapsed = time.perf_counter() - started
+
+    await bot.on_shutdown(app)
+    await app.shutdown()
+    bot.flusher.observer = observer
+    return driver, elapsed, save_time[0]
+
+
+def measure_memory(bot, players):
+    # Bộ nhớ cho mỗi bản ghi người chơi trong cache (kèm chỉ mục xếp hạng).
+    # on_shutdown đã đóng store nên mở lại trước khi đo, và đóng lại khi xong
+    bot.players_data.load()
+    users = range(FIRST_USER_ID * 2, FIRST_USER_ID * 2 + players)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for uid in users:
+        player = bot.get_player(uid)
+        bot.add_score(uid, player, uid % 1000)
+        player["wins"] = uid % 7
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Bản ghi dùng để đo không cần lưu
+    bot.flusher.dirty.clear()
+    bot.store.close()
+    return (after - before) / players
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline các handler của bot")
+    parser.add_argument("--players", type=int, default=300)
+    parser.add_argument("--games", type=int, default=3, help="số ván chơi đơn mỗi người")
+    parser.add_argument("--memory-players", type=int, default=20000)
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    parser.add_argument("--max-p99-ms", type=float, help="thoát với mã lỗi nếu p99 của handler nào vượt ngưỡng")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["SCORE_FILE"] = os.path.join(tmp, "score_data.json")
+    os.environ["SQLITE_FILE"] = os.path.join(tmp, "score_data.db")
+    # Bot API giả và người chơi mô phỏng không bị giới hạn tốc độ
+    os.environ.setdefault("OUTBOX_GLOBAL_RATE", "1000000")
+    os.environ.setdefault("OUTBOX_CHAT_RATE", "1000000")
+    os.environ.setdefault("FLOOD_RATE", "1000000")
+    random.seed(1)
+    import guess_number_bot as bot
+    logging.disable(logging.WARNING)
+    bot.load_data()
+
+    driver, elapsed, save_time = asyncio.run(run_load(bot, args.players, args.games))
+    data_size = sum(
+        os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp)
+    )
+    memory = measure_memory(bot, args.memory_players)
+
+    result = {
+        "players": args.players,
+        "updates": driver.updates,
+        "seconds": elapsed,
+        "updates_per_second": driver.updates / elapsed,
+        "handlers": {
+            kind: {
+                "count": len(samples),
+                "p50_ms": percentile(samples, 0.5) * 1000,
+                "p99_ms": percentile(samples, 0.99) * 1000,
+            }
+            for kind, samples in sorted(driver.timings.items())
+        },
+        "persistence": {
+            "flushes": bot.flusher.flush_count,
+            "records": bot.flusher.records_written,
+            "bytes": bot.flusher.bytes_written,
+            "seconds": save_time,
+            "bytes_on_disk": data_size,
+        },
+        "bytes_per_player": memory,
+    }
+
+    print(f"{args.players} người chơi, {driver.updates} update trong {elapsed:.2f}s "
+          f"({result['updates_per_second']:.0f} update/s)")
+    print(f"{'handler':<12} {'số lần':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind, stats in result["handlers"].items():
+        print(f"{kind:<12} {stats['count']:>8} {stats['p50_ms']:>8.3f} {stats['p99_ms']:>8.3f}")
+    p = result["persistence"]
+    print(f"ghi dữ liệu: {p['flushes']} lô, {p['records']} bản ghi, {p['bytes']} byte, "
+          f"{p['seconds'] * 1000:.1f}ms; trên đĩa {p['bytes_on_disk']} byte")
+    print(f"bộ nhớ: {memory:.0f} byte/người chơi")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.max_p99_ms is not None:
+        slow = {k: s["p99_ms"] for k, s in result["handlers"].items() if s["p99_ms"] > args.max_p99_ms}
+        if slow:
+            print(f"❌ p99 vượt {args.max_p99_ms}ms: {slow}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
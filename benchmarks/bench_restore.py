@@ -0,0 +1,85 @@
+# Đo thời gian khôi phục các ván đang chơi khi khởi động lại: ghi sẵn file
+# SESSIONS_FILE với N ván (90% ván đơn, 8% trận PvP, 2% lời mời), gồm một
+# snapshot đã nén và một đoạn log chưa nén, rồi gọi restore_sessions().
+# Chạy: python benchmarks/bench_restore.py [số_ván ...]
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+DEFAULT_SIZES = (10_000, 100_000)
+LOG_SHARE = 0.1  # phần ván nằm trong log (thay đổi sau lần nén cuối)
+
+
+def write_sessions(path, n, timeout, pvp_timeout, challenge_timeout):
+    # Bản ghi được tạo bằng to_record() của chính các lớp ván, với thời điểm
+    # hoạt động cuối ngẫu nhiên để hạn chót rải đều trên bánh xe hẹn giờ
+    from levels import LevelTable
+    from sessions import GameSession, PvPChallenge, PvPGame, wall_offset
+
+    rng = random.Random(n)
+    level = LevelTable()[2]
+    offset = wall_offset()
+    now = time.monotonic()
+    records = {}
+    uid = 10**9
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.9:
+            game = GameSession(uid, rng.randint(level.low, level.high), level)
+            game.attempts = rng.randint(0, level.attempts - 1)
+            game.used_hints = rng.randint(0, 3)
+            game.last_active = now - rng.uniform(0, timeout - 1)
+            records[f"game:{uid}"] = game.to_record(offset, timeout)
+            uid += 1
+        elif kind < 0.98:
+            game = PvPGame(uid, uid + 1, level)
+            game.challenger_attempts = rng.randint(0, level.attempts - 1)
+            game.last_active = now - rng.uniform(0, pvp_timeout - 1)
+            records[f"pvp:{uid}:{uid + 1}"] = game.to_record(offset, pvp_timeout)
+            uid += 2
+        else:
+            challenge = PvPChallenge(uid, uid + 1)
+            challenge.created = now - rng.uniform(0, challenge_timeout - 1)
+            records[f"challenge:{uid + 1}"] = challenge.to_record(offset, challenge_timeout)
+            uid += 2
+    keys = list(records)
+    split = int(len(keys) * (1 - LOG_SHARE))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({key: records[key] for key in keys[:split]}, f, separators=(',', ':'))
+    with open(path + '.wal', 'w', encoding='utf-8') as f:
+        for key in keys[split:]:
+            f.write(json.dumps({"u": key, "d": records[key]}, separators=(',', ':')) + '\n')
+
+
+def main(sizes):
+    tmp = tempfile.mkdtemp(prefix="bench_restore_")
+    os.environ["SCORE_FILE"] = os.path.join(tmp, "score_data.json")
+    os.environ["SESSIONS_FILE"] = os.path.join(tmp, "sessions.json")
+    import guess_number_bot as bot
+
+    print(f"{'số ván':>10} | {'file':>9} | {'khôi phục':>10} | {'hẹn giờ':>8}")
+    for n in sizes:
+        bot.user_games = bot.SessionIndex()
+        bot.pvp_challenges.clear()
+        bot.outgoing_challenges.clear()
+        bot.timers = bot.TimerWheel()
+        bot.session_store.close()
+        bot.session_store = bot.WalStore(bot.SESSIONS_FILE, prune_empty=True)
+        write_sessions(bot.SESSIONS_FILE, n, bot.TIMEOUT_SECONDS, bot.PVP_TIMEOUT, bot.CHALLENGE_TIMEOUT)
+        size = os.path.getsize(bot.SESSIONS_FILE) + os.path.getsize(bot.SESSIONS_FILE + '.wal')
+
+        started = time.perf_counter()
+        restored = bot.restore_sessions()
+        elapsed = time.perf_counter() - started
+        assert restored == n, (restored, n)
+        print(f"{n:>10} | {size / 1e6:>7.1f}MB | {elapsed * 1000:>8.0f}ms | {bot.timers.pending:>8}")
+    bot.session_store.close()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,61 @@
+# Đo số byte bộ nhớ cho mỗi ván đang chơi (GameSession + chỉ mục) ở các quy mô khác nhau.
+# Chạy: python benchmarks/bench_sessions.py [số_ván ...]
+import os
+import sys
+import random
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from levels import LevelTable  # noqa: E402
+from sessions import GameSession, SessionIndex  # noqa: E402
+
+LEVEL = LevelTable()[2]
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+
+def build_sessions(n):
+    index = SessionIndex()
+    for user_id in range(10**9, 10**9 + n):
+        index.add(GameSession(user_id, random.randint(10, 90), LEVEL))
+    return index
+
+
+def build_legacy_dicts(n):
+    # Cấu trúc cũ: dict 8 khóa cho mỗi ván, có datetime và list gợi ý
+    games = {}
+    for user_id in range(10**9, 10**9 + n):
+        games[user_id] = {
+            "secret": random.randint(10, 90),
+            "attempts": 0,
+            "max_attempts": LEVEL.attempts,
+            "range": (LEVEL.low, LEVEL.high),
+            "timeout_task": None,
+            "level": 2,
+            "start_time": datetime.now(),
+            "used_hints": [],
+        }
+    return games
+
+
+def measure(builder, n):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = builder(n)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return (after - before) / n
+
+
+def main(sizes):
+    print(f"{'số ván':>10} | {'GameSession':>12} | {'dict cũ':>10}")
+    for n in sizes:
+        slotted = measure(build_sessions, n)
+        legacy = measure(build_legacy_dicts, n)
+        print(f"{n:>10} | {slotted:>10.0f} B | {legacy:>8.0f} B")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,120 @@
+# Đo thời gian khởi động của bot với snapshot dữ liệu lớn, hoàn toàn offline.
+# Mỗi lần đo chạy trong một process mới (import lạnh) và ghi lại:
+#   import      - import guess_number_bot
+#   first reply - từ lúc process bắt đầu tới khi /start được trả lời
+#   data ready  - tới khi /stats (cần dữ liệu người chơi) được trả lời
+# Chế độ "blocking" đọc hết dữ liệu trước khi nhận update như trước đây,
+# chế độ "background" đọc dữ liệu nền trong lúc bot đã trả lời được.
+# Chạy: python benchmarks/bench_startup.py [số_người_chơi ...]
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import tempfile
+import subprocess
+
+STARTED = time.perf_counter()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+USER_ID = 42
+MODES = ("blocking", "background")
+
+
+def write_snapshot(path, players):
+    rng = random.Random(players)
+    data = {
+        str(uid): {
+            "score": rng.randint(0, 3000), "wins": rng.randint(0, 50), "losses": rng.randint(0, 50),
+            "games_played": rng.randint(0, 100), "inventory": {"hint_type": rng.randint(0, 3)},
+            "current_streak": 0, "max_streak": rng.randint(0, 10),
+            "last_reward_date": None, "reward_streak": 0, "completed_quests": {},
+            "pvp_wins": 0, "pvp_losses": 0,
+        }
+        for uid in range(10**6, 10**6 + players)
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+async def child(mode):
+    before_import = time.perf_counter()
+    import guess_number_bot as bot
+    imported = time.perf_counter()
+    from telegram import Update
+    from fake_telegram import FAKE_TOKEN, FakeTelegramRequest, make_message_update
+
+    replies = []
+    request = FakeTelegramRequest(
+        sink=lambda method, params: replies.append((time.perf_counter(), params.get("text", "")))
+    )
+    if mode == "blocking":
+        bot.load_data()
+    app = bot.build_application(FAKE_TOKEN, request=request, polling=False)
+    await app.initialize()
+    await bot.on_startup(app)
+
+    async def answered(text, count):
+        await app.process_update(Update.de_json(make_message_update(USER_ID, text), app.bot))
+        while len(replies) < count:
+            await asyncio.sleep(0.001)
+        return replies[count - 1]
+
+    first_reply, _ = await answered("/start", 1)
+    # /stats trả lời "đang khởi động" nếu dữ liệu chưa xong thì gửi lại
+    count = 2
+    while True:
+        at, text = await answered("/stats", count)
+        if "khởi động" not in text:
+            break
+        count += 1
+    ready = at
+
+    await bot.on_shutdown(app)
+    await app.shutdown()
+    print(json.dumps({
+        "import": imported - before_import,
+        "first_reply": first_reply - STARTED,
+        "data_ready": ready - STARTED,
+        "retries": count - 2,
+    }))
+
+
+def measure(players, mode, tmp):
+    env = dict(os.environ)
+    env.pop("BOT_TOKEN", None)
+    env["SCORE_FILE"] = os.path.join(tmp, f"score_data.{players}.json")
+    env["OUTBOX_GLOBAL_RATE"] = env["OUTBOX_CHAT_RATE"] = env["FLOOD_RATE"] = "1000000"
+    env["READY_TIMEOUT"] = "0.05"
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode],
+        env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        import logging
+        logging.disable(logging.WARNING)
+        asyncio.run(child(sys.argv[2]))
+        return
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print(f"{'người chơi':>10} {'chế độ':>11} {'import ms':>10} {'trả lời đầu ms':>15} {'dữ liệu sẵn ms':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for players in sizes:
+            snapshot = os.path.join(tmp, f"score_data.{players}.json")
+            for mode in MODES:
+                # Mỗi lần đo bắt đầu từ đúng snapshot ban đầu (lần chạy trước đã nén log vào)
+                write_snapshot(snapshot, players)
+                result = measure(players, mode, tmp)
+                print(f"{players:>10} {mode:>11} {result['import'] * 1000:>10.0f} "
+                      f"{result['first_reply'] * 1000:>15.0f} {result['data_ready'] * 1000:>15.0f}")
+
+
+if __name__ == '__main__':
+    main()
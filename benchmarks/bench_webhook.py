@@ -0,0 +1,109 @@
+# Chạy bot ở chế độ webhook hoàn toàn offline: update giả được POST qua HTTP
+# như Telegram. Tin trả lời đi qua outbox nên handler không chờ mạng; để thấy
+# lợi ích của xử lý song song, mỗi update chờ thêm một độ trễ giả (như một lời
+# gọi Bot API hay CSDL ngay trong handler), Bot API giả cũng có cùng độ trễ.
+# Đo thông lượng theo số luồng xử lý và kiểm tra update của cùng người chơi
+# được xử lý đúng thứ tự (ghi lại thứ tự update_id của từng người).
+# Chạy: python benchmarks/bench_webhook.py [số_người_chơi] [độ_trễ_ms]
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from fake_telegram import FAKE_TOKEN, FakeTelegramRequest, FakeUpdateSource  # noqa: E402
+
+CONCURRENCY_LEVELS = (1, 8, 32)
+CONNECTIONS = 40  # như max_connections mặc định của Telegram
+
+
+async def post_all(port, path, updates):
+    # Chia update cho CONNECTIONS kết nối keep-alive; mỗi kết nối gửi tuần tự
+    # như Telegram (update của cùng người chơi luôn trên cùng kết nối và theo thứ tự)
+    lanes = [[] for _ in range(CONNECTIONS)]
+    for data in updates:
+        user_id = data["message"]["from"]["id"]
+        lanes[user_id % CONNECTIONS].append(data)
+
+    async def send_lane(lane):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for data in lane:
+            body = json.dumps(data).encode()
+            writer.write(
+                f"POST {path} HTTP/1.1\r\nHost: localhost\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+            status = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            assert b" 200 " in status, status
+        writer.close()
+
+    await asyncio.gather(*(send_lane(lane) for lane in lanes if lane))
+
+
+async def run(bot, concurrency, players, latency, first_user_id):
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from webhook import serve_webhook
+    request = FakeTelegramRequest(latency=latency)
+    app = bot.build_application(FAKE_TOKEN, request=request, polling=False)
+    handled = {}  # user_id -> các update_id theo thứ tự được xử lý
+
+    async def slow_handler(update, context):
+        handled.setdefault(update.effective_user.id, []).append(update.update_id)
+        await asyncio.sleep(latency)
+
+    app.add_handler(TypeHandler(Update, slow_handler), group=-10)
+    updates = list(FakeUpdateSource(players, 3, first_user_id=first_user_id, seed=concurrency))
+    stop = asyncio.Event()
+    ready = asyncio.get_running_loop().create_future()
+    task = asyncio.create_task(serve_webhook(
+        app, listen="127.0.0.1", port=0, path="/webhook",
+        concurrency=concurrency, max_pending=256, stop_event=stop,
+        on_ready=lambda server, pipeline: ready.set_result(server.port)
+    ))
+    port = await ready
+    started = time.perf_counter()
+    await post_all(port, "/webhook", updates)
+    stop.set()
+    stats = await task
+    elapsed = time.perf_counter() - started
+    out_of_order = sum(1 for ids in handled.values() if ids != sorted(ids))
+    return len(updates) / elapsed, stats, out_of_order
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+    # Đo đường xử lý update, không đo giới hạn tốc độ của outbox hay chống spam
+    os.environ.setdefault("OUTBOX_GLOBAL_RATE", "1000000")
+    os.environ.setdefault("OUTBOX_CHAT_RATE", "1000000")
+    os.environ.setdefault("FLOOD_RATE", "1000000")
+    os.environ["SCORE_FILE"] = os.path.join(tmp, "score_data.json")
+    os.environ["SQLITE_FILE"] = os.path.join(tmp, "score_data.db")
+    import guess_number_bot as bot
+    import logging
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    bot.load_data()
+
+    print(f"{players} người chơi, {players * 4} update, độ trễ mỗi update {latency * 1000:.0f}ms")
+    print(f"{'luồng':>6} {'update/s':>10} {'đã xử lý':>9} {'lỗi':>5} {'sai thứ tự':>11}")  # số người chơi bị xử lý sai thứ tự
+    for i, concurrency in enumerate(CONCURRENCY_LEVELS):
+        rate, stats, out_of_order = asyncio.run(
+            run(bot, concurrency, players, latency, 10**6 * (i + 1))
+        )
+        print(f"{concurrency:>6} {rate:>10.0f} {stats['processed']:>9} {stats['failed']:>5} {out_of_order:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import json
+import random
+import asyncio
+import itertools
+
+from telegram.request import BaseRequest, RequestData
+
+# ========== TELEGRAM GIẢ LẬP ==========
+# Dùng để chạy bot hoàn toàn offline: thay lớp HTTP của python-telegram-bot
+# bằng FakeTelegramRequest (trả lời ngay các method Bot API mà bot dùng) và
+# sinh update giả bằng make_message_update / FakeUpdateSource.
+
+FAKE_TOKEN = "123456:fake-token"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "GuessBot", "username": "guess_bot"}
+
+
+class FakeTelegramRequest(BaseRequest):
+    def __init__(self, sink=None, latency=0.0):
+        # sink(method, params) được gọi cho mọi lời gọi API (trừ getMe)
+        self.sink = sink
+        self.latency = latency
+        self.calls = []
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data: RequestData = None,
+                         read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if api_method != "getMe":
+            self.calls.append((api_method, params))
+            if self.sink is not None:
+                self.sink(api_method, params)
+        result = self._result(api_method, params)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def _result(self, api_method, params):
+        if api_method == "getMe":
+            return BOT_USER
+        if api_method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id") or 0)
+            return {
+                "message_id": params.get("message_id") or next(self._message_ids),
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        if api_method == "getChat":
+            chat_id = int(params["chat_id"])
+            return {"id": chat_id, "type": "private", "first_name": f"Người chơi {chat_id}"}
+        return True
+
+    def sent_messages(self, chat_id=None):
+        return [
+            params.get("text") for method, params in self.calls
+            if method == "sendMessage" and (chat_id is None or int(params["chat_id"]) == chat_id)
+        ]
+
+
+# ========== UPDATE GIẢ ==========
+_update_ids = itertools.count(1)
+
+
+def make_user(user_id):
+    return {
+        "id": user_id, "is_bot": False,
+        "first_name": f"Người chơi {user_id}", "username": f"player{user_id}",
+    }
+
+
+def make_message_update(user_id, text, chat_id=None, chat_type="private", reply_to_user=None):
+    update_id = next(_update_ids)
+    entities = []
+    if text.startswith("/"):
+        entities.append({"type": "bot_command", "offset": 0, "length": len(text.split()[0])})
+    message = {
+        "message_id": update_id,
+        "date": 0,
+        "chat": {"id": chat_id if chat_id is not None else user_id, "type": chat_type},
+        "from": make_user(user_id),
+        "text": text,
+        "entities": entities,
+    }
+    if reply_to_user is not None:
+        message["reply_to_message"] = {
+            "message_id": update_id - 1 or 1, "date": 0,
+            "chat": message["chat"], "from": make_user(reply_to_user), "text": "",
+        }
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback_update(user_id, data):
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": make_user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": update_id, "date": 0,
+                "chat": {"id": user_id, "type": "private"}, "from": BOT_USER, "text": "",
+            },
+        },
+    }
+
+
+class FakeUpdateSource:
+    # Sinh kịch bản: mỗi người chơi /play rồi đoán ngẫu nhiên; xen kẽ giữa
+    # các người chơi để giống lưu lượng thật
+    def __init__(self, players, guesses_per_player=5, first_user_id=1000, seed=None,
+                 commands=("/play",)):
+        self.players = players
+        self.guesses_per_player = guesses_per_player
+        self.first_user_id = first_user_id
+        self.commands = commands
+        self.rng = random.Random(seed)
+
+    def __iter__(self):
+        users = range(self.first_user_id, self.first_user_id + self.players)
+        for command in self.commands:
+            for user_id in users:
+                yield make_message_update(user_id, command)
+        for _ in range(self.guesses_per_player):
+            for user_id in users:
+                yield make_message_update(user_id, str(self.rng.randint(1, 50)))
+
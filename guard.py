@@ -0,0 +1,69 @@
+import time
+
+from outbox import TokenBucket
+
+# ========== CẤU HÌNH ==========
+FLOOD_RATE = 3.0           # update/giây mỗi người dùng được xử lý
+FLOOD_BURST = 8            # số update dồn dập tối đa trước khi bị giới hạn
+FLOOD_SUMMARY_DELAY = 10   # giây, gom các tin bị bỏ thành một thông báo
+SWEEP_EVERY = 4096         # số lần gọi allow() giữa hai lần dọn bucket rảnh
+MAX_GUESS_DIGITS = 7       # tin dài hơn chắc chắn ngoài phạm vi mọi cấp
+
+
+# ========== CHỐNG SPAM ==========
+# Mỗi người dùng có một token bucket; update vượt giới hạn bị bỏ ngay ở lớp
+# ngoài cùng, trước khi chạm tới dữ liệu người chơi hay outbox. Số tin bị bỏ
+# được đếm để gửi một thông báo tổng hợp thay vì trả lời từng tin. Bucket đã
+# đầy lại (người dùng ngừng gửi) được dọn định kỳ nên bảng chỉ lớn theo số
+# người đang hoạt động.
+class FloodGuard:
+    def __init__(self, rate=FLOOD_RATE, burst=FLOOD_BURST, sweep_every=SWEEP_EVERY):
+        self.rate = rate
+        self.burst = burst
+        self.sweep_every = sweep_every
+        self._buckets = {}
+        self._calls = 0
+        self.dropped = {}  # user_id -> số update bị bỏ chưa được báo
+        self.total_dropped = 0
+
+    def allow(self, user_id, now=None):
+        now = now or time.monotonic()
+        self._calls += 1
+        if self._calls >= self.sweep_every:
+            self.sweep(now)
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        if bucket.wait_time(now) > 0:
+            self.dropped[user_id] = self.dropped.get(user_id, 0) + 1
+            self.total_dropped += 1
+            return False
+        bucket.take(now)
+        return True
+
+    def take_dropped(self, user_id):
+        return self.dropped.pop(user_id, 0)
+
+    def sweep(self, now=None):
+        now = now or time.monotonic()
+        self._calls = 0
+        refill = self.burst / self.rate
+        idle = [uid for uid, bucket in self._buckets.items()
+                if now - bucket.updated >= refill and uid not in self.dropped]
+        for uid in idle:
+            del self._buckets[uid]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def parse_guess(text, low, high):
+    # Trả về (số, None) nếu hợp lệ, ngược lại (None, lý do): "nan" hoặc "range".
+    # Chỉ nhận chữ số ASCII: str.isdigit() chấp nhận cả "²" mà int() không đọc được
+    text = text.strip()
+    if not text or len(text) > MAX_GUESS_DIGITS or not (text.isascii() and text.isdigit()):
+        return None, "range" if text.isascii() and text.isdigit() else "nan"
+    value = int(text)
+    if not low <= value <= high:
+        return None, "range"
+    return value, None
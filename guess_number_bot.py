@@ -1,223 +1,613 @@
+from __future__ import annotations
+
 import os
-import random
-import json
+import time
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import (
-    ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler,
-    ContextTypes, filters
+import functools
+import gc
+import threading
+from datetime import timedelta
+from typing import TYPE_CHECKING
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter, TelegramError
+from guard import FloodGuard, parse_guess, FLOOD_RATE, FLOOD_BURST, FLOOD_SUMMARY_DELAY
+from history import HistoryCache, HISTORY_SIZE, HISTORY_CACHE_SIZE
+from levels import SecretPool, load_levels
+from locks import PlayerLocks
+from matchmaking import MatchmakingQueue, WIDEN_EVERY
+from metrics import (
+    MetricsRegistry, MetricsServer, LoopLagMonitor, SamplingProfiler, timed,
+    BYTES_BUCKETS, PROFILE_INTERVAL
+)
+from names import NameCache, display_name
+from outbox import Outbox, NOTIFY, GLOBAL_RATE, CHAT_RATE, GROUP_RATE
+from periods import PeriodBoards, load_timezone
+from quests import apply_event
+from ranking import RankIndex, StoreRanking
+from scheduler import TimerWheel
+from scoring import calculate_points
+from tournament import Tournament, WIN, TOURNAMENT_DURATION, STATUS_INTERVAL
+from sessions import GameSession, PvPChallenge, PvPGame, SessionIndex, HINT_TYPE, HINT_RANGE, wall_offset
+from shop import (
+    ITEMS, ITEMS_BY_CATEGORY, SHOP_CATEGORIES, MAX_BUY_QUANTITY,
+    quote, grant, consume, has_bonus, use_bonus, total_items
+)
+from storage import (
+    PlayerCache, WriteBehindFlusher, WalStore, open_backend,
+    CACHE_SIZE, FLUSH_INTERVAL, FLUSH_BATCH_SIZE
 )
 
+if TYPE_CHECKING:
+    # Chỉ dùng cho chú thích kiểu; telegram.ext được import khi dựng ứng dụng
+    from telegram import Update
+    from telegram.ext import ContextTypes
+
 # ========== CẤU HÌNH ==========
+# Chỉ bắt buộc khi dựng ứng dụng thật, để benchmark/công cụ import được module mà không cần token
 TOKEN = os.getenv("BOT_TOKEN")
-if not TOKEN:
-    raise ValueError("Vui lòng cung cấp BOT_TOKEN trong biến môi trường")
 
-SCORE_FILE = 'score_data.json'
+SCORE_FILE = os.getenv("SCORE_FILE", 'score_data.json')
+SQLITE_FILE = os.getenv("SQLITE_FILE", 'score_data.db')
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")  # json | sqlite
+PLAYER_CACHE_SIZE = int(os.getenv("PLAYER_CACHE_SIZE", CACHE_SIZE))
+HISTORY_SIZE = int(os.getenv("HISTORY_SIZE", HISTORY_SIZE))  # số ván gần nhất dùng cho /stats
+# Mỗi kỳ đã kết thúc của bảng xếp hạng ngày/tuần/mùa là một dòng trong file này
+PERIODS_ARCHIVE_FILE = os.getenv("PERIODS_ARCHIVE_FILE", os.path.splitext(SCORE_FILE)[0] + ".periods.jsonl")
+# Ván đang chơi và lời mời PvP, để khởi động lại không làm mất ván (WAL riêng)
+SESSIONS_FILE = os.getenv("SESSIONS_FILE", os.path.splitext(SCORE_FILE)[0] + ".sessions.json")
+BOT_TIMEZONE = os.getenv("BOT_TIMEZONE")  # vd. Asia/Ho_Chi_Minh; mặc định giờ của máy chủ
+LEVELS_FILE = os.getenv("LEVELS_FILE")  # file JSON cấu hình cấp độ, mặc định dùng bảng có sẵn
 TIMEOUT_SECONDS = 300  # 5 phút
+PVP_TIMEOUT = TIMEOUT_SECONDS * 2  # trận PvP được chờ lâu hơn
+RESTART_DELAY = 3  # giây, tự bắt đầu ván mới sau khi thắng
+CHALLENGE_TIMEOUT = 120  # giây, lời mời PvP hết hạn nếu không được chấp nhận
 DAILY_REWARD_BASE = 20
 MAX_DAILY_STREAK = 7
+SAVE_INTERVAL = float(os.getenv("SAVE_INTERVAL", FLUSH_INTERVAL))  # giây
+SAVE_BATCH_SIZE = int(os.getenv("SAVE_BATCH_SIZE", FLUSH_BATCH_SIZE))
+# Chế độ webhook: bật khi có WEBHOOK_URL, ngược lại dùng long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "32"))  # update xử lý song song
+PIPELINE_MAX_PENDING = int(os.getenv("PIPELINE_MAX_PENDING", "1000"))  # quá số này thì chờ
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "1"))  # chế độ polling
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", FLOOD_RATE))  # update/giây mỗi người dùng
+FLOOD_BURST = int(os.getenv("FLOOD_BURST", FLOOD_BURST))
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", GLOBAL_RATE))  # tin/giây cho cả bot
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", CHAT_RATE))  # tin/giây cho mỗi chat
+OUTBOX_GROUP_RATE = float(os.getenv("OUTBOX_GROUP_RATE", GROUP_RATE))  # tin/giây cho mỗi nhóm
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT")  # đặt cổng để bật /metrics
+PROFILER = os.getenv("PROFILER", "0") == "1"  # bật profiler lấy mẫu, xem tại /profile
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", PROFILE_INTERVAL))
+# Dữ liệu được tải nền khi khởi động; handler cần dữ liệu chờ tối đa chừng này
+# giây rồi báo "đang khởi động" thay vì để người chơi không nhận được gì
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
 
-# Cấu hình logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+def configure_logging():
+    # Chỉ gọi ở điểm chạy chính; import module không đụng tới cấu hình logging
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
 # ========== TRẠNG THÁI TRÒ CHƠI ==========
-user_games = {}
-players_data = {}
-pvp_challenges = {}
+user_games = SessionIndex()  # user_id -> ván đang chơi (đơn hoặc PvP)
+pvp_challenges = {}  # opponent_id -> PvPChallenge đang chờ chấp nhận
+outgoing_challenges = {}  # challenger_id -> PvPChallenge đã gửi
+matchmaker = MatchmakingQueue()  # hàng chờ /pvp queue
+tournaments = {}  # chat_id nhóm -> Tournament đang diễn ra
+player_locks = PlayerLocks()  # mọi thay đổi dữ liệu của một người chơi chạy tuần tự
+guest_players = set()  # người chơi của shard khác đang tạm ở đây (chế độ nhiều worker)
+claim_user = None  # hook async(user_id) -> bool do sharding.py gắn vào
+query_shards = None  # hook async(kind, period, value) -> câu trả lời của các shard khác
+tournament_router = None  # hook(chat_id, active): báo front nhóm nào đang có giải đấu ở đây
+is_home = None  # hook(user_id) -> bool: người chơi có shard nhà là shard này không
+store = open_backend(STORAGE_BACKEND, SCORE_FILE, SQLITE_FILE)
+players_data = PlayerCache(
+    store, PLAYER_CACHE_SIZE,
+    is_pinned=lambda uid: uid in flusher.dirty or uid in flusher.in_flight or uid in guest_players
+)
+flusher = WriteBehindFlusher(
+    store, lambda uid: None if uid in guest_players else players_data.peek(uid),
+    interval=SAVE_INTERVAL, batch_size=SAVE_BATCH_SIZE,
+    on_flushed=lambda: after_flush()
+)
+session_store = WalStore(SESSIONS_FILE, prune_empty=True)
+session_flusher = WriteBehindFlusher(
+    session_store, lambda key: session_record(key),
+    interval=SAVE_INTERVAL, batch_size=SAVE_BATCH_SIZE
+)
+# JSON giữ mọi người chơi trong RAM nên xếp hạng bằng chỉ mục trong bộ nhớ;
+# SQLite chỉ giữ số người chơi theo mức điểm, top lấy từ chỉ mục điểm của bảng
+rank_index = RankIndex() if store.in_memory else StoreRanking(store, lambda uid: players_data.peek(uid) is not None)
+name_cache = NameCache()
+period_boards = PeriodBoards(PERIODS_ARCHIVE_FILE, load_timezone(BOT_TIMEZONE))  # top ngày/tuần/mùa
+history_cache = HistoryCache(HISTORY_CACHE_SIZE, HISTORY_SIZE)  # lịch sử ván gần đây đã giải mã
+timers = TimerWheel()
+leaderboard_memo = {"key": None, "text": None}
+data_ready = threading.Event()  # load_data() đã chạy xong
+data_loader = {"future": None}  # lần tải nền do on_startup khởi chạy
+outbox = Outbox(OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_RATE, group_rate=OUTBOX_GROUP_RATE)  # mọi tin gửi đi đều qua đây
+flood_guard = FloodGuard(FLOOD_RATE, FLOOD_BURST)  # giới hạn số update mỗi người dùng
+
+# ========== SỐ ĐO ==========
+metrics = MetricsRegistry("guessbot_")
+handler_seconds = metrics.histogram("handler_seconds", "Thời gian xử lý mỗi handler (kể cả chờ khoá)", ("handler",))
+save_seconds = metrics.histogram("save_seconds", "Thời gian mã hoá và ghi một lô người chơi")
+save_bytes = metrics.histogram("save_bytes", "Số byte ghi mỗi lô", buckets=BYTES_BUCKETS)
+save_records = metrics.counter("save_records_total", "Số bản ghi người chơi đã ghi")
+outbound_send_seconds = metrics.histogram("outbound_send_seconds", "Thời gian gọi Bot API khi gửi tin", ("method",))
+outbound_queue_seconds = metrics.histogram("outbound_queue_seconds", "Thời gian tin nằm trong outbox trước khi gửi")
+loop_lag_seconds = metrics.histogram("event_loop_lag_seconds", "Độ trễ đánh thức của event loop")
+metrics.gauge("active_games", "Số ván chơi đơn đang diễn ra", lambda: user_games.solo_count)
+metrics.gauge("active_pvp_games", "Số trận PvP đang diễn ra", lambda: user_games.pvp_count)
+metrics.gauge("active_tournaments", "Số giải đấu nhóm đang diễn ra", lambda: len(tournaments))
+metrics.gauge("pending_challenges", "Số lời mời PvP đang chờ", lambda: len(pvp_challenges))
+metrics.gauge("matchmaking_queue", "Số người trong hàng chờ /pvp queue", lambda: len(matchmaker))
+metrics.gauge("pending_timers", "Số hẹn giờ đang chờ trên bánh xe", lambda: timers.pending)
+metrics.gauge("outbox_pending", "Số tin chưa gửi trong outbox", lambda: outbox.pending)
+metrics.gauge("outbox_sent_total", "Số tin đã gửi", lambda: outbox.sent)
+metrics.gauge("outbox_failed_total", "Số tin gửi thất bại", lambda: outbox.failed)
+metrics.gauge("outbox_retry_after_total", "Số lần bị Telegram bắt chờ (429)", lambda: outbox.retry_after)
+metrics.gauge("flood_dropped_total", "Số update bị bỏ vì gửi quá nhanh", lambda: flood_guard.total_dropped)
+metrics.gauge("flood_buckets", "Số người dùng đang được theo dõi tốc độ gửi", lambda: len(flood_guard))
+metrics.gauge("dirty_players", "Số người chơi chờ ghi", lambda: len(flusher.dirty))
+metrics.gauge("cached_players", "Số người chơi trong cache", lambda: len(players_data))
+metrics.gauge("player_locks", "Số khoá người chơi đang dùng", lambda: len(player_locks))
+metrics.gauge("event_loop_lag_max_seconds", "Độ trễ event loop lớn nhất", lambda: loop_lag.max)
+loop_lag = LoopLagMonitor(loop_lag_seconds)
+profiler = SamplingProfiler(PROFILE_INTERVAL) if PROFILER else None
+metrics_server = MetricsServer(metrics, METRICS_HOST, int(METRICS_PORT), profiler) if METRICS_PORT else None
+
+def observe_save(seconds, records, size):
+    save_seconds.observe(seconds)
+    save_bytes.observe(size)
+    save_records.inc(records)
+
+def observe_send(method, queued, sent):
+    outbound_queue_seconds.observe(queued)
+    outbound_send_seconds.observe(sent, method)
+
+flusher.observer = observe_save
+outbox.observer = observe_send
 
 # ========== XỬ LÝ DỮ LIỆU ==========
 def load_data():
-    global players_data
+    # JSON: đọc snapshot rồi phát lại log; SQLite: chỉ đọc cột điểm để xếp hạng,
+    # bản ghi người chơi được đọc khi cần
     try:
-        if os.path.exists(SCORE_FILE):
-            with open(SCORE_FILE, 'r') as f:
-                players_data = json.load(f)
+        players_data.load()
+        if store.in_memory:
+            rank_index.load(players_data.scores())
+        else:
+            rank_index.load(store.iter_scores())
+        period_boards.load(players_data.records("period_points"))
     except Exception as e:
         logger.error(f"Lỗi khi đọc file dữ liệu: {e}")
-        players_data = {}
+    finally:
+        data_ready.set()
 
-def save_data():
+async def wait_ready(timeout=READY_TIMEOUT):
+    if data_ready.is_set():
+        return True
+    loader = data_loader["future"]
+    if loader is None:
+        return False
     try:
-        with open(SCORE_FILE, 'w') as f:
-            json.dump(players_data, f, indent=2)
-    except Exception as e:
-        logger.error(f"Lỗi khi lưu file dữ liệu: {e}")
+        await asyncio.wait_for(asyncio.shield(loader), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+def when_ready(handler):
+    # Handler đụng tới dữ liệu người chơi chỉ chạy khi dữ liệu đã tải xong;
+    # quá READY_TIMEOUT thì trả lời ngay để bot luôn phản hồi trong lúc khởi động
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        if not await wait_ready():
+            if update.callback_query is not None:
+                await update.callback_query.answer("⏳ Bot đang khởi động, thử lại sau giây lát")
+            else:
+                reply(update, "⏳ Bot đang khởi động, vui lòng thử lại sau giây lát.")
+            return
+        return await handler(update, context)
+    return wrapper
+
+def after_flush():
+    players_data.trim()
+    if not store.in_memory:
+        # Người chơi vừa rời cache đã có điểm đúng trong CSDL
+        rank_index.prune()
+
+def save_data(*uids):
+    # Chỉ đánh dấu "bẩn"; flusher nền sẽ gom và ghi thêm các bản ghi này vào log
+    for uid in uids:
+        flusher.mark_dirty(str(uid))
+
+def new_player():
+    return {
+        "score": 0,
+        "wins": 0,
+        "losses": 0,
+        "games_played": 0,
+        "inventory": {},
+        "current_streak": 0,
+        "max_streak": 0,
+        "last_reward_date": None,
+        "reward_streak": 0,
+        "completed_quests": {},
+        "pvp_wins": 0,
+        "pvp_losses": 0
+    }
 
 def get_player(uid):
+    # Tạo bản ghi nếu chưa có: chỉ gọi từ hành động thật của trò chơi (chơi,
+    # nhận quà, mua đồ...), để người chỉ nhắn tin linh tinh không có bản ghi
     uid_str = str(uid)
-    if uid_str not in players_data:
-        players_data[uid_str] = {
-            "score": 0,
-            "wins": 0,
-            "losses": 0,
-            "games_played": 0,
-            "inventory": {},
-            "current_streak": 0,
-            "max_streak": 0,
-            "last_reward_date": None,
-            "reward_streak": 0,
-            "completed_quests": {},
-            "pvp_wins": 0,
-            "pvp_losses": 0
-        }
-    return players_data[uid_str]
+    # Người gọi có thể sửa trực tiếp dict trả về nên luôn coi là đã thay đổi
+    flusher.mark_dirty(uid_str)
+    player = players_data.get(uid_str)
+    if player is None:
+        player = new_player()
+        players_data.put(uid_str, player)
+        rank_index.update(uid_str, 0)
+    return player
 
-# ========== ĐỘ KHÓ TRÒ CHƠI ==========
-def get_level(score):
-    if score < 100: return 1
-    elif score < 300: return 2
-    elif score < 600: return 3
-    elif score < 1000: return 4
-    elif score < 1500: return 5
-    elif score < 2500: return 6
-    return 7
+def read_player(uid):
+    # Chỉ đọc: không đánh dấu thay đổi và không tạo bản ghi (người chơi mới
+    # nhận một bản ghi mặc định không được lưu). Muốn sửa thì dùng get_player
+    player = players_data.get(str(uid))
+    return player if player is not None else new_player()
 
-def get_difficulty(level):
-    return {
-        1: {"range": (1, 50), "attempts": 7, "penalty": 5},
-        2: {"range": (1, 100), "attempts": 6, "penalty": 10},
-        3: {"range": (1, 200), "attempts": 6, "penalty": 15},
-        4: {"range": (1, 300), "attempts": 5, "penalty": 20},
-        5: {"range": (1, 500), "attempts": 5, "penalty": 25},
-        6: {"range": (1, 750), "attempts": 4, "penalty": 30},
-        7: {"range": (1, 1000), "attempts": 4, "penalty": 40},
-    }[level]
+# ========== CHUYỂN NGƯỜI CHƠI GIỮA CÁC SHARD ==========
+async def ensure_local(user_id):
+    # Chạy một process: mọi người chơi đều ở đây. Chạy nhiều shard: mượn người
+    # chơi từ shard sở hữu trước khi đụng tới dữ liệu của họ
+    if claim_user is None:
+        return True
+    return await claim_user(user_id)
 
-# ========== CỬA HÀNG ==========
-SHOP_ITEMS = {
-    "extra_attempt": {"price": 30, "desc": "+1 lượt đoán", "type": "game"},
-    "hint_type": {"price": 20, "desc": "Gợi ý chẵn/lẻ", "type": "hint"},
-    "hint_range": {"price": 40, "desc": "Gợi ý khoảng ±50", "type": "hint"},
-    "change_secret": {"price": 50, "desc": "Đổi số bí mật", "type": "game"},
-    "streak_protector": {"price": 100, "desc": "Bảo vệ streak khi thua", "type": "bonus"},
-    "double_points": {"price": 150, "desc": "Nhận 2x điểm trong 3 ván", "type": "bonus"},
-}
+def is_idle(user_id):
+    return (
+        user_id not in user_games
+        and user_id not in pvp_challenges
+        and user_id not in outgoing_challenges
+        and user_id not in matchmaker
+        and ("restart", user_id) not in timers
+    )
 
-# ========== NHIỆM VỤ ==========
-QUESTS = {
-    "win_3_games": {"goal": 3, "reward": 50, "desc": "Thắng 3 trò chơi"},
-    "reach_1000": {"goal": 1000, "reward": 100, "desc": "Đạt 1000 điểm"},
-    "win_5_pvp": {"goal": 5, "reward": 150, "desc": "Thắng 5 trận PvP"},
-    "daily_streak_7": {"goal": 7, "reward": 200, "desc": "Nhận quà 7 ngày liên tiếp"},
-}
+def export_player(user_id):
+    # Gỡ người chơi khỏi shard này và trả về bản ghi để chuyển đi
+    uid_str = str(user_id)
+    flusher.dirty.discard(uid_str)
+    rank_index.remove(uid_str)
+    period_boards.remove(uid_str)
+    guest_players.discard(uid_str)
+    return players_data.pop(uid_str)
 
-# ========== HỆ THỐNG PvP ==========
-class PvPGame:
-    def __init__(self, challenger_id, opponent_id, difficulty):
-        self.challenger_id = challenger_id
-        self.opponent_id = opponent_id
-        self.difficulty = difficulty
-        self.secret = random.randint(*difficulty["range"])
-        self.challenger_attempts = 0
-        self.opponent_attempts = 0
-        self.max_attempts = difficulty["attempts"]
-        self.winner = None
-        self.start_time = datetime.now()
-        
-    def make_guess(self, player_id, guess):
-        if player_id == self.challenger_id:
-            self.challenger_attempts += 1
-        else:
-            self.opponent_attempts += 1
-            
-        if guess == self.secret:
-            self.winner = player_id
-            return "win"
-        elif guess < self.secret:
-            return "higher"
-        else:
-            return "lower"
+def import_player(user_id, record, guest):
+    uid_str = str(user_id)
+    if record is None:
+        return
+    players_data.put(uid_str, record)
+    rank_index.update(uid_str, record.get("score", 0))
+    period_boards.restore(uid_str, record)
+    if guest:
+        guest_players.add(uid_str)
+    else:
+        guest_players.discard(uid_str)
+        flusher.mark_dirty(uid_str)
 
-# ========== TÍNH ĐIỂM ==========
-def calculate_points(attempts_used, max_attempts, streak=0, difficulty_level=1, is_pvp=False):
-    base_points = max(10, (100 - attempts_used * 10) * difficulty_level)
-    streak_bonus = streak * 5
-    
-    # Điểm thưởng cho PvP
-    if is_pvp:
-        base_points *= 1.5
-    
-    # Áp dụng double points nếu có
-    return int(base_points + streak_bonus)
+def record_game(uid, player, game, won, points=0):
+    # Ghi ván vừa kết thúc vào lịch sử gần đây (vòng đệm cố định trong player["history"])
+    pvp = game.kind == "pvp"
+    attempts = game.attempts_of(uid) if pvp else game.attempts
+    history_cache.record(
+        str(uid), player, won, pvp, game.level, attempts, points, time.monotonic() - game.started
+    )
+
+def add_score(uid, player, delta):
+    # Mọi thay đổi điểm đều đi qua đây để bảng xếp hạng luôn được cập nhật
+    player["score"] = max(0, player["score"] + delta)
+    rank_index.update(str(uid), player["score"])
+
+def award(uid, player, points):
+    # Điểm thưởng (thắng ván, nhiệm vụ, quà hàng ngày) còn được cộng vào bảng
+    # xếp hạng ngày/tuần/mùa; điểm phạt và tiền mua đồ thì không
+    add_score(uid, player, points)
+    period_boards.add(str(uid), player, points)
+    return player["score"]
+
+# ========== ĐỘ KHÓ TRÒ CHƠI ==========
+level_table = load_levels(LEVELS_FILE)
+secret_pool = SecretPool()
+
+def get_level(score):
+    return level_table.for_score(score).level
+
+def get_difficulty(level):
+    return level_table[level]
 
 # ========== KIỂM TRA NHIỆM VỤ ==========
-async def check_quests(user_id, context, quest_type, progress):
+async def check_quests(user_id, context, *events):
+    # events: các cặp (sự kiện, giá trị). Mọi lần cộng điểm đều đi qua đây nên
+    # nhiệm vụ mốc điểm (reach_1000) được xét lại ở cuối theo điểm mới
     player = get_player(user_id)
-    completed = False
-    
-    for quest_id, quest in QUESTS.items():
-        if quest_id.startswith(quest_type):
-            current_progress = player.get("quest_progress", {}).get(quest_id, 0)
-            new_progress = min(current_progress + progress, quest["goal"])
-            
-            player.setdefault("quest_progress", {})[quest_id] = new_progress
-            
-            if new_progress >= quest["goal"] and not player.get("completed_quests", {}).get(quest_id, False):
-                player["score"] += quest["reward"]
-                player.setdefault("completed_quests", {})[quest_id] = True
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=f"🎯 Hoàn thành nhiệm vụ: {quest['desc']}! +{quest['reward']} điểm"
-                )
-                completed = True
-                save_data()
+    completed = []
+    now = period_boards.now()
+    for event, amount in events + (("score", player["score"]),):
+        completed += apply_event(player, event, amount, now)
+    
+    # Thưởng nhiệm vụ có thể đưa điểm vượt mốc của nhiệm vụ khác
+    rewarded = 0
+    while rewarded < len(completed):
+        for _, quest in completed[rewarded:]:
+            award(user_id, player, quest["reward"])
+        rewarded = len(completed)
+        completed += apply_event(player, "score", player["score"], now)
     
+    if completed:
+        # Một tin nhắn cho tất cả nhiệm vụ vừa hoàn thành trong lượt này
+        notify_players((user_id,), "\n".join(
+            f"🎯 Hoàn thành nhiệm vụ: {quest['desc']}! +{quest['reward']} điểm"
+            for _, quest in completed
+        ))
     return completed
 
 # ========== HẸN GIỜ ==========
+# Hết giờ được quản lý bởi bánh xe hẹn giờ dùng chung thay vì một task sleep cho mỗi ván
+def arm_game_timeout(user_id, context, delay=TIMEOUT_SECONDS):
+    timers.arm(("game", user_id), delay, lambda: timeout_game(user_id, context))
+
+def arm_pvp_timeout(game, context, delay=PVP_TIMEOUT):
+    timers.arm(("pvp", game.game_id), delay, lambda: timeout_pvp_game(game, context))
+
+def arm_challenge_timeout(challenge, context, delay=CHALLENGE_TIMEOUT):
+    timers.arm(("challenge", challenge.opponent_id), delay, lambda: expire_challenge(challenge, context))
+
 async def timeout_game(user_id, context):
-    await asyncio.sleep(TIMEOUT_SECONDS)
-    if user_id in user_games:
+    # Ván được khôi phục lúc khởi động có thể hết giờ trước khi dữ liệu người chơi tải xong
+    await wait_ready(None)
+    async with player_locks.hold(user_id):
+        await end_timed_out_game(user_id, context)
+
+async def end_timed_out_game(user_id, context):
+    game = user_games.solo(user_id)
+    if game is not None:
         player = get_player(user_id)
         player["losses"] += 1
         player["current_streak"] = 0
-        save_data()
+        record_game(user_id, player, game, False)
+        save_data(user_id)
         
-        del user_games[user_id]
-        await context.bot.send_message(
-            chat_id=user_id,
-            text="⌛ Hết thời gian! Trò chơi kết thúc. Gõ /play để bắt đầu lại."
-        )
+        user_games.remove(game)
+        save_session(game_key(user_id))
+        notify_players((user_id,), "⌛ Hết thời gian! Trò chơi kết thúc. Gõ /play để bắt đầu lại.")
 
-async def timeout_pvp_game(game_id, context):
-    await asyncio.sleep(TIMEOUT_SECONDS * 2)  # Thời gian dài hơn cho PvP
-    if game_id in pvp_challenges:
-        game = pvp_challenges[game_id]
+async def timeout_pvp_game(game, context):
+    await wait_ready(None)
+    async with game.lock:
+        if game.winner is not None or not user_games.remove(game):
+            return
         challenger = get_player(game.challenger_id)
         opponent = get_player(game.opponent_id)
         
         challenger["pvp_losses"] += 1
         opponent["pvp_losses"] += 1
-        save_data()
-        
-        del pvp_challenges[game_id]
-        await context.bot.send_message(
-            chat_id=game.challenger_id,
-            text="⌛ Trận đấu PvP đã hết thời gian mà không có người chiến thắng!"
-        )
-        await context.bot.send_message(
-            chat_id=game.opponent_id,
-            text="⌛ Trận đấu PvP đã hết thời gian mà không có người chiến thắng!"
+        record_game(game.challenger_id, challenger, game, False)
+        record_game(game.opponent_id, opponent, game, False)
+        save_data(game.challenger_id, game.opponent_id)
+        save_session(pvp_key(game))
+    
+    notify_players(
+        game.players(),
+        "⌛ Trận đấu PvP đã hết thời gian mà không có người chiến thắng!"
+    )
+
+async def expire_challenge(challenge, context):
+    if pvp_challenges.get(challenge.opponent_id) is not challenge:
+        return
+    drop_challenge(challenge)
+    notify_players(
+        (challenge.challenger_id,),
+        "⌛ Lời mời PvP đã hết hạn vì không được chấp nhận."
+    )
+
+# ========== LƯU VÁN ĐANG CHƠI ==========
+# Ván đơn, trận PvP và lời mời đang chờ được ghi vào WAL riêng (SESSIONS_FILE)
+# bằng cùng cơ chế ghi trễ như người chơi: handler chỉ đánh dấu khoá của ván,
+# flusher lấy trạng thái hiện tại lúc ghi. Ván đã kết thúc được ghi thành bản
+# ghi rỗng và bị bỏ khi nén log. Khi khởi động, mọi ván được nạp lại một lượt
+# và hẹn giờ được đặt theo thời gian còn lại tới hạn chót đã lưu.
+def game_key(user_id):
+    return f"game:{user_id}"
+
+def pvp_key(game):
+    return f"pvp:{game.challenger_id}:{game.opponent_id}"
+
+def challenge_key(challenge):
+    return f"challenge:{challenge.opponent_id}"
+
+def save_session(*keys):
+    for key in keys:
+        session_flusher.mark_dirty(key)
+
+def session_record(key):
+    kind, _, ids = key.partition(":")
+    if kind == "game":
+        game = user_games.solo(int(ids))
+        if game is not None:
+            return game.to_record(wall_offset(), TIMEOUT_SECONDS)
+    elif kind == "pvp":
+        challenger_id, opponent_id = map(int, ids.split(":"))
+        game = user_games.pvp(challenger_id)
+        if game is not None and game.game_id == (challenger_id, opponent_id):
+            return game.to_record(wall_offset(), PVP_TIMEOUT)
+    elif kind == "challenge":
+        challenge = pvp_challenges.get(int(ids))
+        if challenge is not None:
+            return challenge.to_record(wall_offset(), CHALLENGE_TIMEOUT)
+    return ""
+
+def restore_sessions():
+    # Chạy trên event loop trước khi nhận update. Ván đã quá hạn trong lúc bot
+    # tắt hết giờ ở tick đầu tiên qua đường xử lý hết giờ thông thường.
+    started = time.perf_counter()
+    # Các ván vừa tạo không có vòng tham chiếu: tắt gc trong lúc nạp để không
+    # quét đi quét lại cả trăm nghìn object mới
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        try:
+            records = session_store.load_all()
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc file ván đang chơi: {e}")
+            return 0
+        offset = wall_offset()
+        now = time.monotonic()
+        restored = 0
+        for key, record in records.items():
+            if not record:
+                continue
+            try:
+                restored += restore_session(key, record, offset, now)
+            except ValueError as e:
+                logger.warning(f"Bỏ qua ván {key} không đọc được: {e}")
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if restored:
+        logger.info(f"Đã khôi phục {restored} ván đang chơi ({time.perf_counter() - started:.3f}s)")
+    return restored
+
+def homed_here(*user_ids):
+    # Người chơi được mượn không được ghi lại: sau khi khởi động lại họ đã về
+    # shard nhà, nên ván có họ không thể tiếp tục ở shard này
+    return is_home is None or all(is_home(user_id) for user_id in user_ids)
+
+def restore_session(key, record, offset, now):
+    # Người chơi đã có ván khác (bản ghi cũ chưa kịp được xoá) hoặc không còn ở
+    # shard này thì ghi đè bằng bản ghi rỗng. Callback hết giờ không dùng
+    # context nên truyền None.
+    kind = key.partition(":")[0]
+    if kind == "game":
+        game = GameSession.from_record(record, offset, TIMEOUT_SECONDS)
+        if game.user_id in user_games or not homed_here(game.user_id):
+            save_session(key)
+            return 0
+        user_games.add(game)
+        arm_game_timeout(game.user_id, None, game.last_active + TIMEOUT_SECONDS - now)
+    elif kind == "pvp":
+        game = PvPGame.from_record(record, offset, PVP_TIMEOUT)
+        if (game.challenger_id in user_games or game.opponent_id in user_games
+                or not homed_here(game.challenger_id, game.opponent_id)):
+            save_session(key)
+            return 0
+        user_games.add(game)
+        arm_pvp_timeout(game, None, game.last_active + PVP_TIMEOUT - now)
+    elif kind == "challenge":
+        challenge = PvPChallenge.from_record(record, offset, CHALLENGE_TIMEOUT)
+        if (challenge.opponent_id in pvp_challenges or challenge.challenger_id in outgoing_challenges
+                or not homed_here(challenge.challenger_id, challenge.opponent_id)):
+            save_session(key)
+            return 0
+        pvp_challenges[challenge.opponent_id] = challenge
+        outgoing_challenges[challenge.challenger_id] = challenge
+        arm_challenge_timeout(challenge, None, challenge.created + CHALLENGE_TIMEOUT - now)
+    else:
+        return 0
+    return 1
+
+# ========== LỌC UPDATE ==========
+# Hai lớp chạy trước mọi handler khác và chỉ đọc trạng thái trong bộ nhớ:
+# guard_flood bỏ update của người gửi quá nhanh, filter_guess bỏ tin không
+# phải lượt đoán hợp lệ. Tin bị bỏ không tạo bản ghi người chơi, không ghi dữ
+# liệu và (trừ vài câu trả lời ngắn trong chat riêng) không gửi gì ra ngoài.
+def stop_update():
+    from telegram.ext import ApplicationHandlerStop
+    raise ApplicationHandlerStop
+
+async def guard_flood(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if user is None or flood_guard.allow(user.id):
+        return
+    if flood_guard.dropped[user.id] == 1:
+        # Tin đầu tiên bị bỏ: hẹn một thông báo tổng hợp thay vì trả lời từng tin
+        chat = update.effective_chat
+        private = chat is not None and chat.type == "private"
+        timers.arm(("flood", user.id), FLOOD_SUMMARY_DELAY, lambda: flood_summary(user.id, private))
+    stop_update()
+
+async def flood_summary(user_id, private):
+    dropped = flood_guard.take_dropped(user_id)
+    if dropped and private:
+        outbox.send(
+            user_id,
+            f"🚫 Bạn gửi tin quá nhanh: {dropped} tin đã bị bỏ qua. Hãy đoán chậm lại nhé!",
+            NOTIFY, merge=True
         )
 
+async def filter_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    chat = update.effective_chat
+    session = tournaments.get(chat.id) or user_games.get(user_id)
+    if session is None:
+        if ("restart", user_id) in timers:
+            return  # handle_guess bắt đầu ván mới ngay
+        if chat.type == "private":
+            reply(update, "⚠️ Gõ /play để bắt đầu trò chơi.")
+        stop_update()
+    
+    _, problem = parse_guess(update.message.text, session.low, session.high)
+    if problem is None:
+        return
+    # Giải đấu nhóm không trả lời từng tin; ván riêng thì nhắc, lượt không bị tính
+    if session.kind != "tournament":
+        if problem == "nan":
+            reply(update, "❌ Vui lòng nhập một số nguyên.")
+        else:
+            reply(update, f"❌ Số phải nằm trong khoảng {session.low} - {session.high}, lượt này không bị tính.")
+    stop_update()
+
+# ========== TÊN HIỂN THỊ ==========
+async def remember_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Chạy trước mọi handler khác: ghi nhận tên người gửi để bảng xếp hạng khỏi gọi get_chat
+    user = update.effective_user
+    if user is not None:
+        name_cache.remember(str(user.id), display_name(user), user.username)
+
+async def fetch_display_name(context, uid):
+    try:
+        chat = await context.bot.get_chat(int(uid))
+    except RetryAfter as e:
+        logger.warning(f"Bị giới hạn tốc độ khi lấy tên người chơi {uid}, thử lại sau {e.retry_after}s")
+        return None
+    except TelegramError as e:
+        logger.debug(f"Không lấy được tên người chơi {uid}: {e}")
+        return None
+    return chat.username or chat.first_name
+
 # ========== LỆNH CƠ BẢN ==========
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    await update.message.reply_text(
+    reply(
+        update,
         f"👋 Chào {user.first_name}! Tôi là bot đoán số thông minh.\n\n"
         "🎮 Các lệnh chính:\n"
         "/play - Bắt đầu trò chơi mới\n"
         "/pvp - Thách đấu người khác\n"
+        "/tournament - Giải đấu cả nhóm (trong nhóm)\n"
         "/shop - Cửa hàng vật phẩm\n"
         "/daily - Nhận quà hàng ngày\n"
-        "/leaderboard - Bảng xếp hạng\n"
+        "/leaderboard - Bảng xếp hạng (thêm today/week/season)\n"
         "/stats - Thống kê cá nhân"
     )
 
@@ -226,289 +616,679 @@ async def play(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     if user_id in user_games:
-        await update.message.reply_text("⚠️ Bạn đang có trò chơi hoạt động! Gõ /giveup nếu muốn bỏ cuộc.")
+        reply(update, "⚠️ Bạn đang có trò chơi hoạt động! Gõ /giveup nếu muốn bỏ cuộc.")
         return
     
+    # Gõ /play trong lúc chờ tự bắt đầu lại thì bắt đầu ngay
+    timers.cancel(("restart", user_id))
+    await start_game(user_id, update.effective_chat.id, context)
+
+async def start_game(user_id, chat_id, context):
+    matchmaker.leave(user_id)
     player = get_player(user_id)
-    level = get_level(player["score"])
-    diff = get_difficulty(level)
+    diff = level_table.for_score(player["score"])
     
-    # Tạo số bí mật tránh các số gần biên
-    secret = random.randint(
-        diff["range"][0] + int(0.1 * (diff["range"][1] - diff["range"][0])),
-        diff["range"][1] - int(0.1 * (diff["range"][1] - diff["range"][0]))
-    )
+    # Số bí mật đã tránh các số gần biên (cận tính sẵn trong bảng cấp độ)
+    secret = secret_pool.solo(diff)
     
-    task = asyncio.create_task(timeout_game(user_id, context))
-    user_games[user_id] = {
-        "secret": secret,
-        "attempts": 0,
-        "max_attempts": diff["attempts"],
-        "range": diff["range"],
-        "timeout_task": task,
-        "level": level,
-        "start_time": datetime.now(),
-        "used_hints": []
-    }
+    arm_game_timeout(user_id, context)
+    user_games.add(GameSession(user_id, secret, diff))
+    save_session(game_key(user_id))
     
-    await update.message.reply_text(
-        f"🎮 Bắt đầu trò chơi cấp {level}!\n"
-        f"🔢 Phạm vi số: {diff['range'][0]} - {diff['range'][1]}\n"
-        f"💡 Số lượt đoán: {diff['attempts']}\n\n"
+    outbox.send(
+        chat_id,
+        f"🎮 Bắt đầu trò chơi cấp {diff.level}!\n"
+        f"🔢 Phạm vi số: {diff.low} - {diff.high}\n"
+        f"💡 Số lượt đoán: {diff.attempts}\n\n"
         f"Gửi số bạn đoán ngay bây giờ!"
     )
 
+async def auto_restart(user_id, chat_id, context):
+    # Người chơi có thể đã tự bắt đầu ván mới trong lúc chờ
+    async with player_locks.hold(user_id):
+        if user_id not in user_games:
+            await start_game(user_id, chat_id, context)
+
 async def handle_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Tin đã qua filter_guess nên thường là một lượt đoán hợp lệ; kiểm tra lại
+    # với ván hiện tại vì ván có thể vừa kết thúc giữa hai bước (không trả lời thêm)
     user_id = update.effective_user.id
-    message = update.message.text.strip()
+    message = update.message.text
+    
+    tournament = tournaments.get(update.effective_chat.id)
+    if tournament is not None:
+        guess, _ = parse_guess(message, tournament.low, tournament.high)
+        if guess is not None:
+            await tournament_guess(update, context, tournament, guess)
+        return
     
-    if user_id not in user_games:
-        await update.message.reply_text("⚠️ Gõ /play để bắt đầu trò chơi.")
+    session = user_games.get(user_id)
+    if session is None:
+        if timers.cancel(("restart", user_id)):
+            # Đang chờ ván mới: bắt đầu luôn, lượt đoán này không tính vì chưa biết phạm vi
+            await start_game(user_id, update.effective_chat.id, context)
         return
     
-    if not message.isdigit():
-        await update.message.reply_text("❌ Vui lòng nhập một số nguyên.")
+    guess, _ = parse_guess(message, session.low, session.high)
+    if guess is None:
+        return
+    if session.kind == "pvp":
+        await handle_pvp_guess(update, context, session, guess)
         return
     
-    guess = int(message)
-    game = user_games[user_id]
+    game = session
     player = get_player(user_id)
-    secret = game["secret"]
-    game["attempts"] += 1
+    secret = game.secret
+    game.attempts += 1
+    game.last_active = time.monotonic()
+    # Hết giờ tính theo thời gian không hoạt động: mỗi lượt đoán đặt lại đồng hồ
+    timers.rearm(("game", user_id), TIMEOUT_SECONDS)
+    save_session(game_key(user_id))
     
     # Kiểm tra xem có double points không
-    is_double_points = "double_points" in player.get("active_bonuses", {})
+    is_double_points = has_bonus(player, "double_points")
     
     if guess < secret:
-        await update.message.reply_text(
-            f"🔼 Cao hơn! ({game['max_attempts'] - game['attempts']} lượt còn lại)" +
+        reply(
+            update,
+            f"🔼 Cao hơn! ({game.attempts_left} lượt còn lại)" +
             (" 🎯 2x ĐIỂM!" if is_double_points else "")
         )
     elif guess > secret:
-        await update.message.reply_text(
-            f"🔽 Thấp hơn! ({game['max_attempts'] - game['attempts']} lượt còn lại)" +
+        reply(
+            update,
+            f"🔽 Thấp hơn! ({game.attempts_left} lượt còn lại)" +
             (" 🎯 2x ĐIỂM!" if is_double_points else "")
         )
     else:
         # Xử lý khi đoán đúng
         points = calculate_points(
-            game["attempts"],
-            game["max_attempts"],
+            game.attempts,
+            game.max_attempts,
             player.get("current_streak", 0),
-            game["level"]
+            game.level
         )
         
-        if is_double_points:
+        if use_bonus(player, "double_points"):
             points *= 2
-            player["active_bonuses"]["double_points"] -= 1
-            if player["active_bonuses"]["double_points"] <= 0:
-                del player["active_bonuses"]["double_points"]
         
-        player["score"] += points
+        award(user_id, player, points)
         player["wins"] += 1
         player["games_played"] += 1
         player["current_streak"] = player.get("current_streak", 0) + 1
         player["max_streak"] = max(player.get("max_streak", 0), player["current_streak"])
-        player["last_win_time"] = datetime.now().isoformat()
+        player["last_win_time"] = period_boards.now().isoformat()
+        record_game(user_id, player, game, True, points)
         
         # Kiểm tra nhiệm vụ
-        await check_quests(user_id, context, "win_games", 1)
+        await check_quests(user_id, context, ("solo_win", 1))
         
-        game["timeout_task"].cancel()
-        del user_games[user_id]
-        save_data()
+        timers.cancel(("game", user_id))
+        user_games.remove(game)
+        save_data(user_id)
         
-        await update.message.reply_text(
+        reply(
+            update,
             f"🎉 Chính xác! Số là {secret}.\n"
             f"🏆 Điểm: +{points} | Tổng: {player['score']}\n"
             f"🔥 Streak: {player['current_streak']}\n"
-            f"⏳ Bắt đầu ván mới sau 3 giây..."
+            f"⏳ Bắt đầu ván mới sau {RESTART_DELAY} giây..."
         )
         
-        await asyncio.sleep(3)
-        await play(update, context)
+        # Hẹn giờ bắt đầu lại trên bánh xe dùng chung để handler trả về ngay
+        chat_id = update.effective_chat.id
+        timers.arm(("restart", user_id), RESTART_DELAY, lambda: auto_restart(user_id, chat_id, context))
         return
     
-    if game["attempts"] >= game["max_attempts"]:
+    if game.attempts >= game.max_attempts:
         # Xử lý khi hết lượt
-        penalty = game.get("penalty", 20)
+        penalty = game.penalty
         
         # Kiểm tra streak protector
-        if "streak_protector" in player.get("inventory", {}) and player["inventory"]["streak_protector"] > 0:
-            player["inventory"]["streak_protector"] -= 1
+        if consume(player, "streak_protector"):
             penalty = 0
-            await update.message.reply_text("🛡️ Bạn đã sử dụng streak protector!")
+            reply(update, "🛡️ Bạn đã sử dụng streak protector!")
         else:
             player["current_streak"] = 0
         
-        player["score"] = max(0, player["score"] - penalty)
+        add_score(user_id, player, -penalty)
         player["losses"] += 1
         player["games_played"] += 1
-        save_data()
+        record_game(user_id, player, game, False, -penalty)
+        save_data(user_id)
         
-        await update.message.reply_text(
+        reply(
+            update,
             f"😢 Bạn đã hết lượt. Số đúng là {secret}.\n"
             f"❌ Trừ {penalty} điểm. Tổng điểm: {player['score']}\n"
             f"🔁 Gõ /play để chơi lại."
         )
         
-        game["timeout_task"].cancel()
-        del user_games[user_id]
+        timers.cancel(("game", user_id))
+        user_games.remove(game)
 
-# ========== TRÒ CHƠI PvP ==========
-async def pvp(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def give_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    
+    game = user_games.get(user_id)
+    if game is None:
+        reply(update, "⚠️ Bạn không có trò chơi đang hoạt động")
+        return
+    if game.kind == "pvp":
+        await forfeit_pvp(update, context, game)
+        return
+    
+    user_games.remove(game)
+    timers.cancel(("game", user_id))
+    save_session(game_key(user_id))
+    
+    player = get_player(user_id)
+    player["losses"] += 1
+    player["games_played"] += 1
+    player["current_streak"] = 0
+    record_game(user_id, player, game, False)
+    save_data(user_id)
+    
+    reply(
+        update,
+        f"🏳️ Bạn đã bỏ cuộc. Số đúng là {game.secret}.\n"
+        f"🔁 Gõ /play để chơi lại."
+    )
+
+async def forfeit_pvp(update: Update, context: ContextTypes.DEFAULT_TYPE, game):
     user_id = update.effective_user.id
+    opponent_id = game.opponent_of(user_id)
     
-    if len(context.args) < 1:
-        await update.message.reply_text(
+    async with game.lock:
+        if game.winner is not None or not user_games.remove(game):
+            return
+        timers.cancel(("pvp", game.game_id))
+        save_session(pvp_key(game))
+        game.winner = opponent_id
+        winner = get_player(opponent_id)
+        loser = get_player(user_id)
+        winner["pvp_wins"] = winner.get("pvp_wins", 0) + 1
+        loser["pvp_losses"] = loser.get("pvp_losses", 0) + 1
+        record_game(opponent_id, winner, game, True)
+        record_game(user_id, loser, game, False)
+        save_data(user_id, opponent_id)
+    
+    reply(update, f"🏳️ Bạn đã bỏ cuộc trận PvP. Số đúng là {game.secret}.")
+    notify_players((opponent_id,), "🏆 Đối thủ đã bỏ cuộc. Bạn thắng trận PvP!")
+
+# ========== GỬI TIN ==========
+# Handler chỉ xếp tin vào outbox rồi trả về; outbox tự gửi theo giới hạn tốc độ
+def reply(update, text, **kwargs):
+    outbox.send(update.effective_chat.id, text, **kwargs)
+
+def edit(query, text, **kwargs):
+    outbox.edit(query.message.chat_id, query.message.message_id, text, **kwargs)
+
+def notify_players(chat_ids, text):
+    # Thông báo đi làn ưu tiên thấp và được gộp nếu chat còn thông báo chưa gửi
+    for chat_id in chat_ids:
+        outbox.send(chat_id, text, NOTIFY, merge=True)
+
+# ========== TRÒ CHƠI PvP ==========
+
+def drop_challenge(challenge):
+    timers.cancel(("challenge", challenge.opponent_id))
+    if pvp_challenges.get(challenge.opponent_id) is challenge:
+        del pvp_challenges[challenge.opponent_id]
+        save_session(challenge_key(challenge))
+    if outgoing_challenges.get(challenge.challenger_id) is challenge:
+        del outgoing_challenges[challenge.challenger_id]
+
+def resolve_pvp_target(update, arg):
+    # Trả lời tin nhắn của đối thủ, hoặc dùng @username / user id
+    reply = update.message.reply_to_message
+    if reply is not None and reply.from_user is not None and not reply.from_user.is_bot:
+        return reply.from_user.id
+    if arg.isdigit():
+        return int(arg)
+    if arg.startswith("@"):
+        uid = name_cache.find_username(arg)
+        return int(uid) if uid is not None else None
+    return None
+
+async def pvp(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) < 1 and update.message.reply_to_message is None:
+        reply(
+            update,
             "🎮 Chế độ PvP - Thách đấu người khác\n\n"
             "Cách sử dụng:\n"
             "/pvp @username - Thách đấu người chơi khác\n"
+            "/pvp queue - Tự động tìm đối thủ cùng trình độ\n"
             "/pvp accept - Chấp nhận thách đấu\n"
-            "/pvp cancel - Hủy thách đấu"
+            "/pvp cancel - Hủy thách đấu hoặc rời hàng chờ"
         )
         return
     
-    if context.args[0] == "accept":
-        if user_id not in pvp_challenges:
-            await update.message.reply_text("⚠️ Không có lời mời PvP nào đang chờ bạn.")
-            return
-            
-        game_id, challenge = next((k, v) for k, v in pvp_challenges.items() if v.opponent_id == user_id)
-        challenger_id = challenge.challenger_id
-        
-        # Tạo game PvP
-        level = min(
-            get_level(get_player(challenger_id)["score"]),
-            get_level(get_player(user_id)["score"])
-        )
-        diff = get_difficulty(level)
-        
-        pvp_game = PvPGame(challenger_id, user_id, diff)
-        pvp_challenges[game_id] = pvp_game
-        task = asyncio.create_task(timeout_pvp_game(game_id, context))
-        
-        await context.bot.send_message(
-            chat_id=challenger_id,
-            text=f"🎮 Trận đấu PvP đã bắt đầu!\n"
-                 f"🔢 Phạm vi số: {diff['range'][0]} - {diff['range'][1]}\n"
-                 f"💡 Số lượt đoán mỗi người: {diff['attempts']}\n\n"
-                 f"Gửi số bạn đoán ngay bây giờ!"
+    action = context.args[0] if context.args else ""
+    if action == "accept":
+        await pvp_accept(update, context)
+    elif action == "cancel":
+        await pvp_cancel(update, context)
+    elif action == "queue":
+        await pvp_queue(update, context)
+    else:
+        await pvp_challenge(update, context, action)
+
+async def pvp_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE, target):
+    user_id = update.effective_user.id
+    opponent_id = resolve_pvp_target(update, target)
+    
+    if opponent_id is None:
+        reply(
+            update,
+            "⚠️ Không tìm thấy người chơi này. Hãy trả lời tin nhắn của họ bằng /pvp, "
+            "hoặc nhờ họ nhắn cho bot trước."
         )
-        
+        return
+    if opponent_id == user_id:
+        reply(update, "⚠️ Bạn không thể tự thách đấu chính mình.")
+        return
+    if user_id in user_games:
+        reply(update, "⚠️ Bạn đang có trò chơi hoạt động! Gõ /giveup nếu muốn bỏ cuộc.")
+        return
+    if user_id in outgoing_challenges:
+        reply(update, "⚠️ Bạn đã có một lời mời đang chờ. Gõ /pvp cancel để hủy.")
+        return
+    if opponent_id in user_games or opponent_id in pvp_challenges:
+        reply(update, "⚠️ Người chơi này đang bận, hãy thử lại sau.")
+        return
+    if not await ensure_local(opponent_id):
+        reply(update, "⚠️ Người chơi này đang bận, hãy thử lại sau.")
+        return
+    
+    challenge = PvPChallenge(user_id, opponent_id)
+    try:
+        # Gửi trực tiếp, không qua outbox: cần biết đối thủ có nhận được lời mời không
         await context.bot.send_message(
-            chat_id=user_id,
-            text=f"🎮 Trận đấu PvP đã bắt đầu!\n"
-                 f"🔢 Phạm vi số: {diff['range'][0]} - {diff['range'][1]}\n"
-                 f"💡 Số lượt đoán mỗi người: {diff['attempts']}\n\n"
-                 f"Gửi số bạn đoán ngay bây giờ!"
+            chat_id=opponent_id,
+            text=f"⚔️ {display_name(update.effective_user)} thách đấu bạn một trận PvP!\n"
+                 f"Gõ /pvp accept để chấp nhận hoặc /pvp cancel để từ chối "
+                 f"(hết hạn sau {CHALLENGE_TIMEOUT // 60} phút)."
         )
-        
+    except TelegramError as e:
+        logger.info(f"Không gửi được lời mời PvP tới {opponent_id}: {e}")
+        reply(update, "⚠️ Không gửi được lời mời. Đối thủ cần nhắn /start cho bot trước.")
         return
     
-    elif context.args[0] == "cancel":
-        # Hủy thách đấu
-        pass
+    # Kiểm tra lại sau await: có thể đã có người khác mời trong lúc gửi tin
+    if user_id in user_games or user_id in outgoing_challenges or opponent_id in pvp_challenges:
+        reply(update, "⚠️ Người chơi này đang bận, hãy thử lại sau.")
+        return
+    pvp_challenges[opponent_id] = challenge
+    outgoing_challenges[user_id] = challenge
+    arm_challenge_timeout(challenge, context)
+    save_session(challenge_key(challenge))
     
-    else:
-        # Thách đấu người khác
-        pass
+    reply(update, "📨 Đã gửi lời mời PvP! Đang chờ đối thủ chấp nhận...")
 
-# ========== CỬA HÀNG ==========
-async def show_shop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def pvp_accept(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    player = get_player(user_id)
     
-    keyboard = [
-        [InlineKeyboardButton("Vật phẩm trò chơi", callback_data="shop_game")],
-        [InlineKeyboardButton("Gợi ý", callback_data="shop_hint")],
-        [InlineKeyboardButton("Bonus", callback_data="shop_bonus")],
-    ]
+    # Lời mời được lưu theo người được mời nên chỉ cần một lần tra cứu
+    challenge = pvp_challenges.get(user_id)
+    if challenge is None:
+        reply(update, "⚠️ Không có lời mời PvP nào đang chờ bạn.")
+        return
+    
+    challenger_id = challenge.challenger_id
+    if user_id in user_games or challenger_id in user_games:
+        reply(update, "⚠️ Một trong hai người đang có trò chơi hoạt động. Hãy kết thúc trước.")
+        return
+    drop_challenge(challenge)
+    await start_pvp_match(challenger_id, user_id, context)
+
+async def start_pvp_match(challenger_id, opponent_id, context):
+    for uid in (challenger_id, opponent_id):
+        matchmaker.leave(uid)
+    
+    # Tạo game PvP
+    level = min(
+        get_level(get_player(challenger_id)["score"]),
+        get_level(get_player(opponent_id)["score"])
+    )
+    diff = get_difficulty(level)
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    pvp_game = PvPGame(challenger_id, opponent_id, diff)
+    user_games.add(pvp_game)
+    arm_pvp_timeout(pvp_game, context)
+    save_session(pvp_key(pvp_game))
     
-    await update.message.reply_text(
-        f"🛒 CỬA HÀNG - Điểm hiện có: {player['score']}\n"
-        "Chọn danh mục:",
-        reply_markup=reply_markup
+    notify_players(
+        pvp_game.players(),
+        f"🎮 Trận đấu PvP đã bắt đầu!\n"
+        f"🔢 Phạm vi số: {diff.low} - {diff.high}\n"
+        f"💡 Số lượt đoán mỗi người: {diff.attempts}\n\n"
+        f"Gửi số bạn đoán ngay bây giờ!"
     )
 
-async def shop_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
+async def pvp_queue(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
     
-    user_id = query.from_user.id
-    player = get_player(user_id)
-    category = query.data.split("_")[1]
+    if user_id in user_games:
+        reply(update, "⚠️ Bạn đang có trò chơi hoạt động! Gõ /giveup nếu muốn bỏ cuộc.")
+        return
+    if user_id in outgoing_challenges or user_id in pvp_challenges:
+        reply(update, "⚠️ Bạn đang có lời mời PvP. Gõ /pvp cancel để hủy trước.")
+        return
+    if user_id in matchmaker:
+        reply(update, f"⏳ Bạn đã ở trong hàng chờ ({len(matchmaker)} người đang chờ).")
+        return
+    # Chạy nhiều shard: hàng chờ chỉ nằm ở một shard, người chơi được mượn về đây
+    if not await ensure_local(user_id):
+        reply(update, "⚠️ Bạn đang có trò chơi hoặc lời mời PvP chưa xong. Hãy kết thúc trước.")
+        return
     
-    items = {k: v for k, v in SHOP_ITEMS.items() if v["type"] == category}
+    score = get_player(user_id)["score"]
+    partner = matchmaker.enqueue(user_id, score, get_level(score))
+    if partner is not None:
+        await start_pvp_match(partner.user_id, user_id, context)
+        return
     
-    if not items:
-        await query.edit_message_text("⚠️ Không có vật phẩm nào trong danh mục này.")
+    # Cửa sổ điểm của người chờ nới dần nên cần quét lại định kỳ
+    if ("matchmaking",) not in timers:
+        timers.arm(("matchmaking",), WIDEN_EVERY, lambda: run_matchmaking(context))
+    reply(
+        update,
+        f"🔎 Đang tìm đối thủ cùng trình độ... ({len(matchmaker)} người đang chờ)\n"
+        f"Gõ /pvp cancel để rời hàng chờ."
+    )
+
+async def run_matchmaking(context):
+    pairs, expired = matchmaker.sweep()
+    if len(matchmaker):
+        timers.arm(("matchmaking",), WIDEN_EVERY, lambda: run_matchmaking(context))
+    for a, b in pairs:
+        await start_pvp_match(a.user_id, b.user_id, context)
+    notify_players(
+        [t.user_id for t in expired],
+        "⌛ Không tìm được đối thủ phù hợp. Gõ /pvp queue để thử lại."
+    )
+
+async def pvp_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    
+    if matchmaker.leave(user_id):
+        reply(update, "❎ Đã rời hàng chờ PvP.")
         return
     
-    buttons = []
-    for item_id, item in items.items():
-        buttons.append([
-            InlineKeyboardButton(
-                f"{item['desc']} - {item['price']} điểm",
-                callback_data=f"buy_{item_id}"
-            )
-        ])
+    # Hủy lời mời mình đã gửi, hoặc từ chối lời mời đang chờ mình
+    challenge = outgoing_challenges.get(user_id) or pvp_challenges.get(user_id)
+    if challenge is None:
+        reply(update, "⚠️ Bạn không có lời mời PvP nào.")
+        return
     
-    buttons.append([InlineKeyboardButton("🔙 Quay lại", callback_data="shop_back")])
+    drop_challenge(challenge)
+    other_id = challenge.opponent_id if challenge.challenger_id == user_id else challenge.challenger_id
+    reply(update, "❎ Đã hủy lời mời PvP.")
+    notify_players((other_id,), "❎ Lời mời PvP đã bị hủy.")
+
+async def handle_pvp_guess(update: Update, context: ContextTypes.DEFAULT_TYPE, game, guess):
+    user_id = update.effective_user.id
+    opponent_id = game.opponent_of(user_id)
     
-    await query.edit_message_text(
-        f"🛒 Danh mục {category.capitalize()} - Điểm hiện có: {player['score']}",
-        reply_markup=InlineKeyboardMarkup(buttons)
+    # Khoá theo trận: lượt đoán đồng thời của hai người được xử lý lần lượt
+    async with game.lock:
+        if game.winner is not None or user_games.pvp(user_id) is not game:
+            reply(update, "⚠️ Trận đấu PvP này đã kết thúc.")
+            return
+        if game.attempts_left(user_id) <= 0:
+            reply(update, "⏳ Bạn đã hết lượt. Đang chờ đối thủ...")
+            return
+        
+        result = game.make_guess(user_id, guess)
+        timers.rearm(("pvp", game.game_id), PVP_TIMEOUT)
+        save_session(pvp_key(game))
+        
+        if result == "win":
+            points = calculate_points(game.attempts_of(user_id), game.max_attempts, 0, game.level, is_pvp=True)
+            winner = get_player(user_id)
+            loser = get_player(opponent_id)
+            award(user_id, winner, points)
+            winner["pvp_wins"] = winner.get("pvp_wins", 0) + 1
+            loser["pvp_losses"] = loser.get("pvp_losses", 0) + 1
+            record_game(user_id, winner, game, True, points)
+            record_game(opponent_id, loser, game, False)
+            save_data(user_id, opponent_id)
+            user_games.remove(game)
+            timers.cancel(("pvp", game.game_id))
+        elif game.exhausted:
+            user_games.remove(game)
+            timers.cancel(("pvp", game.game_id))
+    
+    if result == "win":
+        winner_name = display_name(update.effective_user)
+        reply(
+            update,
+            f"🏆 Bạn thắng trận PvP! Số là {game.secret}.\n"
+            f"💰 +{points} điểm | Tổng: {winner['score']}"
+        )
+        notify_players(
+            (opponent_id,),
+            f"😢 {winner_name} đã đoán đúng số {game.secret} trước bạn. Bạn thua trận PvP!"
+        )
+        await check_quests(user_id, context, ("pvp_win", 1))
+        return
+    
+    hint = "🔼 Cao hơn!" if result == "higher" else "🔽 Thấp hơn!"
+    reply(update, f"{hint} ({game.attempts_left(user_id)} lượt còn lại)")
+    if game.exhausted:
+        notify_players(
+            game.players(),
+            f"🤝 Cả hai đã hết lượt! Trận PvP hòa, số đúng là {game.secret}."
+        )
+
+# ========== GIẢI ĐẤU NHÓM ==========
+# /tournament [cấp] trong nhóm: cả nhóm đoán chung một số. Lượt đoán không
+# được trả lời riêng; một tin trạng thái được sửa mỗi STATUS_INTERVAL giây
+# nếu có thay đổi, nên số tin gửi vào nhóm không phụ thuộc số lượt đoán.
+def tournament_status_text(tournament):
+    left = int(tournament.seconds_left())
+    return (
+        f"🏁 GIẢI ĐẤU NHÓM - Cấp {tournament.level} ({tournament.low} - {tournament.high})\n"
+        f"⏱️ Còn khoảng {left // 60}:{left % 60:02d} | 👥 {tournament.players} người | "
+        f"🎯 {tournament.guesses} lượt đoán\n"
+        f"🔍 Số nằm trong khoảng {tournament.lower_bound} - {tournament.upper_bound}\n"
+        f"💡 Mỗi người {tournament.quota} lượt. Gửi số để đoán, ai đúng trước sẽ thắng!"
     )
 
-async def buy_item(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def announce_tournament(chat_id, active):
+    # Chạy nhiều shard: giải đấu nằm ở shard của nhóm, front chuyển tin nhắn
+    # thường của nhóm tới đó trong lúc giải đấu diễn ra
+    if tournament_router is not None:
+        tournament_router(chat_id, active)
+
+async def start_tournament(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = update.effective_chat
+    if chat.type == "private":
+        reply(update, "⚠️ Giải đấu chỉ chơi được trong nhóm. Thêm bot vào nhóm rồi gõ /tournament.")
+        return
+    if chat.id in tournaments:
+        reply(update, "⚠️ Nhóm đang có giải đấu, hãy đoán số!")
+        return
+    
+    if context.args and context.args[0].isdigit():
+        level = min(max(1, int(context.args[0])), len(level_table))
+    else:
+        # Người gõ lệnh có thể thuộc shard khác; mượn không được thì dùng cấp mặc định
+        await ensure_local(update.effective_user.id)
+        level = get_level(read_player(update.effective_user.id)["score"])
+        if chat.id in tournaments:
+            reply(update, "⚠️ Nhóm đang có giải đấu, hãy đoán số!")
+            return
+    
+    # Đăng ký trước khi await để hai lệnh /tournament cùng lúc không tạo hai giải
+    tournament = tournaments[chat.id] = Tournament(chat.id, get_difficulty(level), TOURNAMENT_DURATION)
+    announce_tournament(chat.id, True)
+    try:
+        # Gửi trực tiếp, không qua outbox: cần message_id để sửa tin trạng thái về sau
+        message = await context.bot.send_message(chat_id=chat.id, text=tournament_status_text(tournament))
+    except TelegramError as e:
+        logger.warning(f"Không gửi được tin giải đấu vào nhóm {chat.id}: {e}")
+        tournaments.pop(chat.id, None)
+        announce_tournament(chat.id, False)
+        return
+    tournament.status_message_id = message.message_id
+    tournament.changed = False
+    
+    timers.arm(("tournament", chat.id), STATUS_INTERVAL, lambda: refresh_tournament(tournament))
+    timers.arm(("tournament_end", chat.id), TOURNAMENT_DURATION, lambda: end_tournament(tournament))
+
+async def tournament_guess(update, context, tournament, guess):
+    user_id = update.effective_user.id
+    if tournament.guess(user_id, guess) != WIN:
+        return
+    
+    # Chỉ đúng một lượt đoán nhận WIN, nên phần thưởng không thể bị cộng hai lần.
+    # Người thắng có thể thuộc shard khác: mượn về trước khi cộng điểm
+    points = calculate_points(tournament.attempts_of(user_id), tournament.quota, 0, tournament.level, is_pvp=True)
+    if await ensure_local(user_id):
+        player = get_player(user_id)
+        award(user_id, player, points)
+        await check_quests(user_id, context)
+        save_data(user_id)
+        prize = f"💰 +{points} điểm"
+    else:
+        logger.warning(f"Không cộng được điểm giải đấu cho {user_id}: người chơi đang bận ở shard khác")
+        prize = "⚠️ Không cộng được điểm vì bạn đang có ván khác"
+    await end_tournament(
+        tournament,
+        f"🏆 {display_name(update.effective_user)} đoán đúng số {tournament.secret} và thắng giải đấu!\n"
+        f"{prize} | 👥 {tournament.players} người, 🎯 {tournament.guesses} lượt đoán"
+    )
+
+async def refresh_tournament(tournament):
+    if tournaments.get(tournament.chat_id) is not tournament:
+        return
+    if tournament.changed:
+        tournament.changed = False
+        outbox.edit(tournament.chat_id, tournament.status_message_id, tournament_status_text(tournament))
+    timers.arm(("tournament", tournament.chat_id), STATUS_INTERVAL, lambda: refresh_tournament(tournament))
+
+async def end_tournament(tournament, result=None):
+    if tournaments.get(tournament.chat_id) is not tournament:
+        return
+    del tournaments[tournament.chat_id]
+    announce_tournament(tournament.chat_id, False)
+    timers.cancel(("tournament", tournament.chat_id))
+    timers.cancel(("tournament_end", tournament.chat_id))
+    
+    if result is None:
+        result = (
+            f"⌛ Giải đấu kết thúc, không ai đoán đúng! Số là {tournament.secret}.\n"
+            f"👥 {tournament.players} người, 🎯 {tournament.guesses} lượt đoán"
+        )
+    outbox.send(tournament.chat_id, result)
+
+# ========== CỬA HÀNG ==========
+# Bàn phím cửa hàng không phụ thuộc người chơi nên dựng sẵn một lần
+SHOP_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton(title, callback_data=f"shop_{category}")]
+    for category, title in SHOP_CATEGORIES
+])
+CATEGORY_MENUS = {
+    category: InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton(f"{item.desc} - {item.price} điểm", callback_data=f"buy_{item.item_id}")]
+            for item in items
+        ] + [[InlineKeyboardButton("🔙 Quay lại", callback_data="shop_back")]]
+    )
+    for category, items in ITEMS_BY_CATEGORY.items() if items
+}
+
+def shop_menu_text(player):
+    return f"🛒 CỬA HÀNG - Điểm hiện có: {player['score']}\nChọn danh mục:"
+
+async def show_shop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    player = read_player(update.effective_user.id)
+    reply(update, shop_menu_text(player), reply_markup=SHOP_MENU)
+
+async def shop_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    user_id = query.from_user.id
-    item_id = query.data.split("_")[1]
-    player = get_player(user_id)
+    player = read_player(query.from_user.id)
+    category = query.data.split("_", 1)[1]
     
-    if item_id not in SHOP_ITEMS:
-        await query.edit_message_text("⚠️ Vật phẩm không tồn tại.")
+    if category == "back":
+        edit(query, shop_menu_text(player), reply_markup=SHOP_MENU)
         return
     
-    item = SHOP_ITEMS[item_id]
-    
-    if player["score"] < item["price"]:
-        await query.edit_message_text("❌ Bạn không đủ điểm để mua vật phẩm này.")
+    menu = CATEGORY_MENUS.get(category)
+    if menu is None:
+        edit(query, "⚠️ Không có vật phẩm nào trong danh mục này.")
         return
     
-    player["score"] -= item["price"]
-    player["inventory"][item_id] = player["inventory"].get(item_id, 0) + 1
+    edit(
+        query,
+        f"🛒 Danh mục {category.capitalize()} - Điểm hiện có: {player['score']}",
+        reply_markup=menu
+    )
+
+def purchase(user_id, item_id, quantity):
+    # Kiểm tra rồi trừ điểm và cộng vật phẩm trong cùng một bước (không có
+    # await ở giữa, lại chạy dưới khoá người chơi) nên không thể mua nửa chừng
+    item = ITEMS.get(item_id)
+    if item is None:
+        return "⚠️ Vật phẩm không tồn tại."
     
-    # Xử lý vật phẩm đặc biệt
-    if item_id == "double_points":
-        player.setdefault("active_bonuses", {})["double_points"] = 3
+    cost = quote(item, quantity)
+    if cost is None:
+        return f"⚠️ Số lượng phải từ 1 đến {MAX_BUY_QUANTITY}."
     
-    save_data()
+    if read_player(user_id)["score"] < cost:
+        return "❌ Bạn không đủ điểm để mua vật phẩm này."
     
-    await query.edit_message_text(
-        f"✅ Đã mua {item['desc']} thành công!\n"
+    player = get_player(user_id)
+    add_score(user_id, player, -cost)
+    grant(player, item, quantity)
+    save_data(user_id)
+    
+    return (
+        f"✅ Đã mua {item.desc}{f' x{quantity}' if quantity > 1 else ''} thành công!\n"
         f"💰 Điểm còn lại: {player['score']}"
     )
 
+async def buy_item(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Nút mua trong menu cửa hàng: mỗi lần một vật phẩm
+    query = update.callback_query
+    await query.answer()
+    edit(query, purchase(query.from_user.id, query.data.split("_", 1)[1], 1))
+
+async def buy_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /buy <vật phẩm> [số lượng]
+    args = context.args
+    if not args or (len(args) > 1 and not args[1].isdigit()):
+        reply(
+            update,
+            "🛒 Cách dùng: /buy <vật phẩm> [số lượng]\n\n" +
+            "\n".join(f"{item.item_id} - {item.desc} ({item.price} điểm)" for item in ITEMS.values())
+        )
+        return
+    
+    quantity = int(args[1]) if len(args) > 1 else 1
+    reply(update, purchase(update.effective_user.id, args[0].lower(), quantity))
+
 # ========== QUÀ HÀNG NGÀY ==========
 async def daily_reward(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     player = get_player(user_id)
     
-    today = datetime.now().date().isoformat()
+    # Ngày tính theo BOT_TIMEZONE, cùng mốc với bảng xếp hạng ngày
+    now = period_boards.now()
+    today = now.date().isoformat()
     last_reward = player.get("last_reward_date")
     
     if last_reward == today:
-        await update.message.reply_text("⚠️ Bạn đã nhận quà hôm nay rồi!")
+        reply(update, "⚠️ Bạn đã nhận quà hôm nay rồi!")
         return
     
     # Tính streak
-    yesterday = (datetime.now() - timedelta(days=1)).date().isoformat()
+    yesterday = (now - timedelta(days=1)).date().isoformat()
     if last_reward == yesterday:
         streak = player.get("reward_streak", 0) + 1
     else:
@@ -516,16 +1296,17 @@ async def daily_reward(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Tính điểm thưởng
     reward = DAILY_REWARD_BASE + min(streak * 5, DAILY_REWARD_BASE * 2)
-    player["score"] += reward
+    award(user_id, player, reward)
     player["last_reward_date"] = today
     player["reward_streak"] = streak
     
     # Kiểm tra nhiệm vụ streak
-    await check_quests(user_id, context, "daily_streak", 1)
+    await check_quests(user_id, context, ("daily_streak", streak))
     
-    save_data()
+    save_data(user_id)
     
-    await update.message.reply_text(
+    reply(
+        update,
         f"🎁 Nhận {reward} điểm thưởng hàng ngày!\n"
         f"🔥 Streak nhận quà: {streak} ngày\n"
         f"💰 Tổng điểm: {player['score']}"
@@ -534,40 +1315,122 @@ async def daily_reward(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ========== THỐNG KÊ ==========
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    player = get_player(user_id)
+    player = read_player(user_id)
+    rank, total = await merged_rank(None, str(user_id), player["score"])
     
     win_rate = (player["wins"] / player["games_played"] * 100) if player["games_played"] > 0 else 0
     pvp_win_rate = (player["pvp_wins"] / (player["pvp_wins"] + player["pvp_losses"]) * 100) if (player["pvp_wins"] + player["pvp_losses"]) > 0 else 0
     
-    await update.message.reply_text(
+    # Số tổng hợp của các ván gần đây đã được cộng dồn sẵn, không duyệt lại lịch sử
+    history = history_cache.get(str(user_id), player)
+    recent = ""
+    if history.count:
+        attempts = " | ".join(f"C{level}: {avg:.1f}" for level, avg in history.avg_attempts().items())
+        recent = (
+            f"🕘 {history.count} ván gần nhất:\n"
+            f"📈 Tỉ lệ thắng: {history.win_rate:.1f}% | ⏱️ Giải TB: {history.avg_solve_seconds:.0f}s\n"
+            + (f"🎯 Lượt đoán TB theo cấp: {attempts}\n" if attempts else "")
+            + "\n"
+        )
+    
+    reply(
+        update,
         f"📊 THỐNG KÊ CÁ NHÂN\n\n"
         f"🏆 Điểm: {player['score']} (Cấp {get_level(player['score'])})\n"
+        f"🥇 Hạng: #{rank or '-'}/{total}\n"
         f"🎮 Tổng ván chơi: {player['games_played']}\n"
         f"✅ Thắng: {player['wins']} | ❌ Thua: {player['losses']} | 📈 Tỉ lệ: {win_rate:.1f}%\n"
         f"🔥 Streak hiện tại: {player.get('current_streak', 0)} | 🏅 Max streak: {player.get('max_streak', 0)}\n\n"
         f"⚔️ PvP:\n"
         f"🥇 Thắng: {player.get('pvp_wins', 0)} | 🥈 Thua: {player.get('pvp_losses', 0)} | 📈 Tỉ lệ: {pvp_win_rate:.1f}%\n\n"
-        f"🎒 Vật phẩm: {sum(player.get('inventory', {}).values())}\n"
+        f"{recent}"
+        f"🎒 Vật phẩm: {total_items(player)}\n"
         f"📅 Streak nhận quà: {player.get('reward_streak', 0)}/{MAX_DAILY_STREAK}"
     )
 
 # ========== BẢNG XẾP HẠNG ==========
+# /leaderboard [today|week|season]: không có tham số là bảng tổng điểm
+PERIOD_ARGS = {
+    "today": "daily", "day": "daily", "ngay": "daily",
+    "week": "weekly", "tuan": "weekly",
+    "season": "season", "mua": "season",
+}
+PERIOD_TITLES = {"daily": "HÔM NAY", "weekly": "TUẦN NÀY", "season": "MÙA GIẢI"}
+period_memo = {}  # kỳ -> (khoá top 10, tin nhắn)
+
+# Chạy nhiều shard: mỗi shard chỉ xếp hạng người chơi đang ở đó, nên top và
+# hạng được gộp với câu trả lời của các shard khác (period=None: tổng điểm)
+def ranking_index(period):
+    return rank_index if period is None else period_boards.board(period).index
+
+def leaderboard_row(uid):
+    pdata = players_data.get(uid)
+    return {key: pdata.get(key, 0) for key in ("score", "wins", "current_streak", "pvp_wins")}
+
+def local_top(period, k):
+    top = ranking_index(period).top(k)
+    if period is None:
+        return [(uid, leaderboard_row(uid)) for uid, _ in top]
+    return top
+
+def answer_query(kind, period, value):
+    # Gọi từ sharding.py khi shard khác hỏi: "top" (value = k) hoặc "rank" (value = điểm)
+    index = ranking_index(period)
+    if kind == "rank":
+        return index.count_above(value), len(index)
+    return [(uid, entry, name_cache.get(uid)) for uid, entry in local_top(period, value)]
+
+async def merged_top(period, k):
+    top = local_top(period, k)
+    if query_shards is None:
+        return top
+    for answer in await query_shards("top", period, k):
+        for uid, entry, name in answer:
+            if name:
+                name_cache.remember(uid, name)
+            top.append((uid, entry))
+    top.sort(key=lambda item: (-(item[1]["score"] if period is None else item[1]), item[0]))
+    return top[:k]
+
+async def merged_rank(period, uid, score):
+    index = ranking_index(period)
+    rank, total = index.rank(uid), len(index)
+    if query_shards is not None:
+        for above, count in await query_shards("rank", period, score):
+            total += count
+            if rank is not None:
+                rank += above
+    return rank, total
+
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Lấy top 10 người chơi
-    top_players = sorted(
-        [(uid, data) for uid, data in players_data.items() if "score" in data],
-        key=lambda x: x[1]["score"],
-        reverse=True
-    )[:10]
+    if context.args:
+        period = PERIOD_ARGS.get(context.args[0].lower())
+        if period is None:
+            reply(update, "⚠️ Dùng: /leaderboard [today|week|season]")
+            return
+        await period_leaderboard(update, context, period)
+        return
+    
+    # Lấy top 10 người chơi từ chỉ mục xếp hạng, không sắp xếp lại toàn bộ
+    top_players = await merged_top(None, 10)
+    
+    # Dùng lại tin nhắn đã dựng nếu top 10 không thay đổi
+    key = tuple(
+        (uid, pdata["score"], pdata.get("wins", 0), pdata.get("current_streak", 0), pdata.get("pvp_wins", 0))
+        for uid, pdata in top_players
+    )
+    if key == leaderboard_memo["key"]:
+        reply(update, leaderboard_memo["text"])
+        return
+    
+    names = await name_cache.resolve(
+        [uid for uid, _ in top_players],
+        lambda uid: fetch_display_name(context, uid)
+    )
     
     message = "🏆 BẢNG XẾP HẠNG TOP 10\n\n"
     for i, (uid, pdata) in enumerate(top_players, 1):
-        try:
-            user = await context.bot.get_chat(int(uid))
-            name = user.username or user.first_name
-        except:
-            name = f"Người chơi {uid[-4:]}"
-        
+        name = names.get(uid) or f"Người chơi {uid[-4:]}"
         message += (
             f"{i}. {name} - {pdata['score']} điểm\n"
             f"   ✅ {pdata.get('wins', 0)}W | "
@@ -575,66 +1438,206 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"⚔️ {pdata.get('pvp_wins', 0)}PvP\n"
         )
     
-    await update.message.reply_text(message)
+    # Chỉ ghi nhớ khi đã có đủ tên, để lần sau còn thử lấy lại tên bị thiếu
+    if len(names) == len(top_players):
+        leaderboard_memo["key"] = key
+        leaderboard_memo["text"] = message
+    
+    reply(update, message)
+
+async def period_leaderboard(update, context, period):
+    # Bảng của kỳ được cộng dồn sẵn khi thưởng điểm, ở đây chỉ cắt top 10
+    board = period_boards.board(period)
+    top_players = await merged_top(period, 10)
+    title = f"🏆 BẢNG XẾP HẠNG {PERIOD_TITLES[period]} ({board.key})\n\n"
+    if not top_players:
+        reply(update, title + "Chưa có ai ghi điểm.")
+        return
+    
+    key = (board.key, tuple(top_players))
+    memo = period_memo.get(period)
+    if memo is not None and memo[0] == key:
+        message = memo[1]
+    else:
+        names = await name_cache.resolve(
+            [uid for uid, _ in top_players],
+            lambda uid: fetch_display_name(context, uid)
+        )
+        message = title + "".join(
+            f"{i}. {names.get(uid) or f'Người chơi {uid[-4:]}'} - {points} điểm\n"
+            for i, (uid, points) in enumerate(top_players, 1)
+        )
+        if len(names) == len(top_players):
+            period_memo[period] = (key, message)
+    
+    # Người gửi lệnh chưa có trong top thì cho biết hạng của mình trong kỳ
+    user_key = str(update.effective_user.id)
+    points = board.points.get(user_key)
+    if points is not None:
+        rank, _ = await merged_rank(period, user_key, points)
+        if rank > len(top_players):
+            message += f"\n📍 Hạng của bạn: #{rank} ({points} điểm)"
+    
+    reply(update, message)
 
 # ========== GỢI Ý ==========
 async def give_hint(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
-    if user_id not in user_games:
-        await update.message.reply_text("⚠️ Bạn không có trò chơi đang hoạt động")
+    game = user_games.solo(user_id)
+    if game is None:
+        reply(update, "⚠️ Bạn không có trò chơi đang hoạt động")
         return
     
-    player = get_player(user_id)
-    game = user_games[user_id]
+    player = read_player(user_id)
     
     # Kiểm tra inventory
-    if player["inventory"].get("hint_type", 0) > 0 and "type" not in game["used_hints"]:
-        player["inventory"]["hint_type"] -= 1
-        hint = "chẵn" if game["secret"] % 2 == 0 else "lẻ"
-        game["used_hints"].append("type")
-        await update.message.reply_text(f"💡 Gợi ý: Số là {hint}")
-    elif player["inventory"].get("hint_range", 0) > 0 and "range" not in game["used_hints"]:
-        player["inventory"]["hint_range"] -= 1
-        secret = game["secret"]
-        lower = max(game["range"][0], secret - 50)
-        upper = min(game["range"][1], secret + 50)
-        game["used_hints"].append("range")
-        await update.message.reply_text(f"💡 Gợi ý: Số nằm trong khoảng {lower}-{upper}")
+    if not game.used_hints & HINT_TYPE and consume(player, "hint_type"):
+        hint = "chẵn" if game.secret % 2 == 0 else "lẻ"
+        game.used_hints |= HINT_TYPE
+        reply(update, f"💡 Gợi ý: Số là {hint}")
+    elif not game.used_hints & HINT_RANGE and consume(player, "hint_range"):
+        secret = game.secret
+        lower = max(game.low, secret - 50)
+        upper = min(game.high, secret + 50)
+        game.used_hints |= HINT_RANGE
+        reply(update, f"💡 Gợi ý: Số nằm trong khoảng {lower}-{upper}")
     else:
-        await update.message.reply_text("❌ Bạn không có gợi ý nào hoặc đã sử dụng hết. Mua tại /shop")
+        reply(update, "❌ Bạn không có gợi ý nào hoặc đã sử dụng hết. Mua tại /shop")
+        return
     
-    save_data()
+    save_data(user_id)
+    save_session(game_key(user_id))
 
-# ========== MAIN ==========
-if __name__ == '__main__':
-    load_data()
+# ========== VÒNG ĐỜI ==========
+async def on_startup(app):
+    if not data_ready.is_set() and data_loader["future"] is None:
+        # Đọc dữ liệu trong thread riêng: bot nhận update ngay, /start và /help
+        # trả lời được trong lúc snapshot lớn còn đang được đọc
+        data_loader["future"] = asyncio.get_running_loop().run_in_executor(None, load_data)
+    # Ván đang chơi chỉ cần file của chúng, không cần dữ liệu người chơi
+    restore_sessions()
+    flusher.start()
+    session_flusher.start()
+    timers.start()
+    outbox.start(app.bot)
+    loop_lag.start()
+    if profiler is not None:
+        profiler.start()
+    if metrics_server is not None:
+        await metrics_server.start()
+
+async def on_shutdown(app):
+    if data_loader["future"] is not None:
+        await data_loader["future"]
+    if metrics_server is not None:
+        await metrics_server.stop()
+    if profiler is not None:
+        profiler.stop()
+    await loop_lag.stop()
+    await timers.stop()
+    # Gửi nốt các tin còn trong hàng đợi
+    await outbox.stop()
+    # Luôn ghi nốt các thay đổi còn lại trước khi thoát
+    await flusher.stop()
+    # Ván còn đang chơi được giữ lại để khôi phục ở lần khởi động sau
+    await session_flusher.stop()
+    # Nén log vào snapshot để lần khởi động sau chỉ phải đọc một file
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, store.compact, True)
+    await loop.run_in_executor(None, session_store.compact, True)
+    store.close()
+    session_store.close()
+
+# ========== KHỞI TẠO ỨNG DỤNG ==========
+def build_application(token=None, request=None, polling=True):
+    token = token or TOKEN
+    if not token:
+        raise ValueError("Vui lòng cung cấp BOT_TOKEN trong biến môi trường")
+    from telegram.ext import ApplicationBuilder
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    if not polling:
+        builder = builder.updater(None)
+    elif CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(CONCURRENT_UPDATES)
+    app = builder.build()
+    register_handlers(app)
+    return app
+
+def register_handlers(app):
+    # Handler đụng tới dữ liệu người chơi chạy dưới khoá của người gửi, nên bật
+    # xử lý update song song không làm hỏng điểm (mua hai lần, nhận quà hai lần...).
+    # Mọi handler đều được đo thời gian theo tên.
+    # Handler cần dữ liệu người chơi chờ dữ liệu tải xong (when_ready).
+    from telegram import Update
+    from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters
     
-    app = ApplicationBuilder().token(TOKEN).build()
+    def locked(handler):
+        return timed(handler_seconds, handler.__name__, when_ready(player_locks.wrap(handler)))
+    
+    def ready(handler):
+        return timed(handler_seconds, handler.__name__, when_ready(handler))
+    
+    def plain(handler):
+        return timed(handler_seconds, handler.__name__, handler)
+    
+    # Lọc update (nhóm -3, -2) rồi ghi nhận tên hiển thị (nhóm -1), trước các handler khác
+    app.add_handler(TypeHandler(Update, guard_flood), group=-3)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, filter_guess), group=-2)
+    app.add_handler(TypeHandler(Update, remember_user), group=-1)
     
     # Lệnh cơ bản
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", start))
+    app.add_handler(CommandHandler("start", plain(start)))
+    app.add_handler(CommandHandler("help", plain(start)))
     
     # Lệnh trò chơi
-    app.add_handler(CommandHandler("play", play))
-    app.add_handler(CommandHandler("pvp", pvp))
-    app.add_handler(CommandHandler("hint", give_hint))
-    app.add_handler(CommandHandler("giveup", give_up))
+    app.add_handler(CommandHandler("play", locked(play)))
+    app.add_handler(CommandHandler("pvp", locked(pvp)))
+    app.add_handler(CommandHandler("tournament", locked(start_tournament)))
+    app.add_handler(CommandHandler("hint", locked(give_hint)))
+    app.add_handler(CommandHandler("giveup", locked(give_up)))
     
     # Lệnh cửa hàng
-    app.add_handler(CommandHandler("shop", show_shop))
-    app.add_handler(CommandHandler("buy", buy_item))
-    app.add_handler(CallbackQueryHandler(shop_category, pattern="^shop_"))
-    app.add_handler(CallbackQueryHandler(buy_item, pattern="^buy_"))
+    app.add_handler(CommandHandler("shop", locked(show_shop)))
+    app.add_handler(CommandHandler("buy", locked(buy_command)))
+    app.add_handler(CallbackQueryHandler(locked(shop_category), pattern="^shop_"))
+    app.add_handler(CallbackQueryHandler(locked(buy_item), pattern="^buy_"))
     
     # Lệnh thống kê
-    app.add_handler(CommandHandler("stats", show_stats))
-    app.add_handler(CommandHandler("leaderboard", leaderboard))
-    app.add_handler(CommandHandler("daily", daily_reward))
+    app.add_handler(CommandHandler("stats", locked(show_stats)))
+    app.add_handler(CommandHandler("leaderboard", ready(leaderboard)))
+    app.add_handler(CommandHandler("daily", locked(daily_reward)))
     
     # Xử lý tin nhắn
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_guess))
-    
-    logger.info("✅ Bot đang chạy...")
-    app.run_polling()
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, locked(handle_guess)))
+
+# ========== MAIN ==========
+if __name__ == '__main__':
+    configure_logging()
+    shards = int(os.getenv("BOT_SHARDS", "1"))
+    if shards > 1:
+        if not TOKEN:
+            raise ValueError("Vui lòng cung cấp BOT_TOKEN trong biến môi trường")
+        # Một process nhận update và chia cho nhiều worker theo user id
+        from sharding import run_front
+        run_front(shards, TOKEN)
+    elif WEBHOOK_URL:
+        # Update của cùng người chơi chạy tuần tự, người khác nhau chạy song song
+        from webhook import serve_webhook
+        app = build_application(polling=False)
+        asyncio.run(serve_webhook(
+            app, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+            concurrency=PIPELINE_CONCURRENCY, max_pending=PIPELINE_MAX_PENDING,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        ))
+    else:
+        app = build_application()
+        logger.info("✅ Bot đang chạy...")
+        app.run_polling()
@@ -0,0 +1,149 @@
+import base64
+import struct
+from collections import OrderedDict
+
+# ========== CẤU HÌNH ==========
+HISTORY_SIZE = 50          # số ván gần nhất giữ cho mỗi người chơi
+HISTORY_CACHE_SIZE = 10000  # số lịch sử đã giải mã giữ trong bộ nhớ
+
+# Mỗi ván là một bản ghi 10 byte: cờ (thắng/PvP), cấp, số lượt đoán, điểm
+# (âm khi bị phạt), thời gian chơi (giây, tối đa 65535)
+RECORD = struct.Struct("<BBHiH")
+HEADER = struct.Struct("<HH")  # vị trí ghi tiếp theo, số bản ghi đang có
+WON = 1
+PVP = 2
+MAX_SECONDS = 0xFFFF
+
+
+# ========== LỊCH SỬ VÁN CHƠI ==========
+# Vòng đệm kích thước cố định gói bằng struct trong một bytearray; các số
+# tổng hợp (thắng, lượt đoán theo cấp, thời gian giải) được cộng khi thêm ván
+# và trừ phần của ván cũ bị ghi đè, nên đọc thống kê không phải duyệt lại.
+# Lưu vào bản ghi người chơi dưới dạng một chuỗi base64 ngắn (player["history"]).
+class GameHistory:
+    __slots__ = ("size", "buffer", "next", "count", "wins", "solve_seconds", "levels")
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        self.buffer = bytearray(RECORD.size * size)
+        self.next = 0
+        self.count = 0
+        self.wins = 0
+        self.solve_seconds = 0
+        self.levels = {}  # cấp -> [số ván thắng, tổng lượt đoán] (chỉ ván đơn)
+
+    def add(self, won, pvp, level, attempts, points, seconds):
+        offset = self.next * RECORD.size
+        if self.count == self.size:
+            self._account(RECORD.unpack_from(self.buffer, offset), -1)
+        else:
+            self.count += 1
+        record = (
+            (WON if won else 0) | (PVP if pvp else 0), level, min(attempts, 0xFFFF),
+            int(points), min(int(seconds), MAX_SECONDS)
+        )
+        RECORD.pack_into(self.buffer, offset, *record)
+        self._account(record, 1)
+        self.next = (self.next + 1) % self.size
+
+    def _account(self, record, sign):
+        flags, level, attempts, _, seconds = record
+        if not flags & WON:
+            return
+        self.wins += sign
+        self.solve_seconds += sign * seconds
+        if not flags & PVP:
+            stats = self.levels.setdefault(level, [0, 0])
+            stats[0] += sign
+            stats[1] += sign * attempts
+            if not stats[0]:
+                del self.levels[level]
+
+    def records(self):
+        # Các ván từ cũ tới mới: (cờ, cấp, lượt đoán, điểm, giây)
+        start = (self.next - self.count) % self.size
+        for i in range(self.count):
+            yield RECORD.unpack_from(self.buffer, ((start + i) % self.size) * RECORD.size)
+
+    @property
+    def win_rate(self):
+        return self.wins / self.count * 100 if self.count else 0.0
+
+    @property
+    def avg_solve_seconds(self):
+        return self.solve_seconds / self.wins if self.wins else 0.0
+
+    def avg_attempts(self):
+        # cấp -> số lượt đoán trung bình để đoán đúng, xếp theo cấp
+        return {level: total / games for level, (games, total) in sorted(self.levels.items())}
+
+    def encode(self):
+        # Chưa đầy vòng thì các ván nằm liền nhau từ đầu: chỉ lưu phần đã dùng
+        used = self.buffer if self.count == self.size else self.buffer[:self.count * RECORD.size]
+        return base64.b64encode(HEADER.pack(self.next, self.count) + used).decode('ascii')
+
+    @classmethod
+    def decode(cls, text, size=HISTORY_SIZE):
+        history = cls(size)
+        if not text:
+            return history
+        try:
+            data = base64.b64decode(text)
+            next_slot, count = HEADER.unpack_from(data)
+            stored = (len(data) - HEADER.size) // RECORD.size
+        except (ValueError, struct.error):
+            return history
+        if count <= stored <= size and (stored == size or next_slot == count):
+            # Vừa với vòng đệm: chép nguyên, chỉ tính lại số tổng hợp
+            history.buffer[:stored * RECORD.size] = data[HEADER.size:HEADER.size + stored * RECORD.size]
+            history.next = next_slot % size
+            history.count = count
+            for record in history.records():
+                history._account(record, 1)
+            return history
+        # HISTORY_SIZE đã đổi: phát lại các ván theo thứ tự, vòng mới tự bỏ ván cũ
+        start = (next_slot - count) % stored if stored else 0
+        for i in range(min(count, stored)):
+            history.add_record(RECORD.unpack_from(data, HEADER.size + ((start + i) % stored) * RECORD.size))
+        return history
+
+    def add_record(self, record):
+        flags, level, attempts, points, seconds = record
+        self.add(flags & WON, flags & PVP, level, attempts, points, seconds)
+
+
+# ========== BỘ ĐỆM ĐÃ GIẢI MÃ ==========
+# Giữ GameHistory đã giải mã của những người chơi gần đây (LRU có giới hạn).
+# Mỗi mục nhớ kèm chuỗi đã mã hoá; nếu player["history"] không còn là đúng
+# chuỗi đó (bản ghi được nạp lại, chuyển shard...) thì giải mã lại.
+class HistoryCache:
+    def __init__(self, capacity=HISTORY_CACHE_SIZE, size=HISTORY_SIZE):
+        self.capacity = capacity
+        self.size = size
+        self._entries = OrderedDict()
+
+    def get(self, uid, player):
+        text = player.get("history")
+        entry = self._entries.get(uid)
+        if entry is not None and entry[0] is text:
+            self._entries.move_to_end(uid)
+            return entry[1]
+        history = GameHistory.decode(text, self.size)
+        self._store(uid, text, history)
+        return history
+
+    def record(self, uid, player, won, pvp, level, attempts, points, seconds):
+        history = self.get(uid, player)
+        history.add(won, pvp, level, attempts, points, seconds)
+        text = player["history"] = history.encode()
+        self._store(uid, text, history)
+        return history
+
+    def _store(self, uid, text, history):
+        self._entries[uid] = (text, history)
+        self._entries.move_to_end(uid)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,85 @@
+import json
+import random
+from bisect import bisect_right
+from typing import NamedTuple
+
+# ========== CẤU HÌNH ==========
+SECRET_MARGIN = 0.1      # số bí mật tránh 10% ở mỗi biên của phạm vi
+SECRET_BATCH = 1024      # số bí mật sinh sẵn mỗi lần cho một cấp
+
+# Điểm tối thiểu, phạm vi số, số lượt đoán, điểm phạt khi thua
+DEFAULT_LEVELS = (
+    {"min_score": 0, "range": (1, 50), "attempts": 7, "penalty": 5},
+    {"min_score": 100, "range": (1, 100), "attempts": 6, "penalty": 10},
+    {"min_score": 300, "range": (1, 200), "attempts": 6, "penalty": 15},
+    {"min_score": 600, "range": (1, 300), "attempts": 5, "penalty": 20},
+    {"min_score": 1000, "range": (1, 500), "attempts": 5, "penalty": 25},
+    {"min_score": 1500, "range": (1, 750), "attempts": 4, "penalty": 30},
+    {"min_score": 2500, "range": (1, 1000), "attempts": 4, "penalty": 40},
+)
+
+
+class Level(NamedTuple):
+    level: int
+    min_score: int
+    low: int
+    high: int
+    attempts: int
+    penalty: int
+    secret_low: int    # cận của số bí mật ván đơn (đã trừ lề)
+    secret_high: int
+
+
+# ========== BẢNG CẤP ĐỘ ==========
+# Tính sẵn một lần: mỗi cấp là một bản ghi bất biến, tra cấp theo điểm bằng
+# tìm nhị phân trên mảng ngưỡng điểm thay vì chuỗi if.
+class LevelTable:
+    def __init__(self, specs=DEFAULT_LEVELS, margin=SECRET_MARGIN):
+        levels = []
+        for number, spec in enumerate(sorted(specs, key=lambda s: s["min_score"]), 1):
+            low, high = spec["range"]
+            if low > high or spec["attempts"] < 1:
+                raise ValueError(f"Cấu hình cấp {number} không hợp lệ: {spec}")
+            pad = int(margin * (high - low))
+            levels.append(Level(
+                number, spec["min_score"], low, high, spec["attempts"], spec["penalty"],
+                low + pad, high - pad
+            ))
+        if not levels or levels[0].min_score != 0:
+            raise ValueError("Cấp đầu tiên phải bắt đầu từ 0 điểm")
+        self.levels = tuple(levels)
+        self._thresholds = tuple(level.min_score for level in levels)
+
+    def for_score(self, score):
+        return self.levels[max(0, bisect_right(self._thresholds, score) - 1)]
+
+    def __getitem__(self, level):
+        return self.levels[level - 1]
+
+    def __len__(self):
+        return len(self.levels)
+
+
+def load_levels(path=None, margin=SECRET_MARGIN):
+    # File JSON: danh sách {"min_score", "range": [thấp, cao], "attempts", "penalty"}
+    if not path:
+        return LevelTable(DEFAULT_LEVELS, margin)
+    with open(path, encoding='utf-8') as f:
+        return LevelTable(json.load(f), margin)
+
+
+# ========== SINH SỐ BÍ MẬT THEO LÔ ==========
+# Mỗi cấp giữ một lô số bí mật sinh sẵn; khi nhiều ván bắt đầu cùng lúc chỉ
+# cần lấy ra từ list thay vì gọi randint cho từng ván.
+class SecretPool:
+    def __init__(self, batch=SECRET_BATCH, rng=None):
+        self.batch = batch
+        self.rng = rng or random.Random()
+        self._pools = {}
+
+    def solo(self, level):
+        pool = self._pools.get(level.level)
+        if not pool:
+            span = range(level.secret_low, level.secret_high + 1)
+            pool = self._pools[level.level] = self.rng.choices(span, k=self.batch)
+        return pool.pop()
@@ -0,0 +1,72 @@
+import asyncio
+import functools
+
+
+# ========== KHOÁ THEO NGƯỜI CHƠI ==========
+# Mỗi người chơi có một asyncio.Lock, chỉ tồn tại khi đang có ít nhất một
+# coroutine giữ hoặc chờ khoá đó: người cuối cùng nhả khoá sẽ xoá nó khỏi bảng,
+# nên bảng chỉ lớn bằng số người chơi đang được xử lý chứ không phải tổng số
+# người chơi. asyncio.Lock đánh thức theo thứ tự chờ nên update của cùng người
+# chơi vẫn chạy theo thứ tự đến.
+class PlayerLocks:
+    def __init__(self):
+        self._locks = {}  # user_id -> [lock, số coroutine đang giữ hoặc chờ]
+        self.contended = 0
+
+    def hold(self, user_id):
+        return _PlayerLockHold(self, user_id)
+
+    async def _acquire(self, user_id):
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        elif entry[0].locked():
+            self.contended += 1
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._forget(user_id, entry)
+            raise
+
+    def _release(self, user_id):
+        entry = self._locks[user_id]
+        entry[0].release()
+        self._forget(user_id, entry)
+
+    def _forget(self, user_id, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[user_id]
+
+    def locked(self, user_id):
+        entry = self._locks.get(user_id)
+        return entry is not None and entry[0].locked()
+
+    def wrap(self, handler):
+        # Handler của python-telegram-bot chạy trọn vẹn dưới khoá của người gửi update
+        @functools.wraps(handler)
+        async def serialized(update, context):
+            user = update.effective_user
+            if user is None:
+                return await handler(update, context)
+            async with self.hold(user.id):
+                return await handler(update, context)
+        return serialized
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class _PlayerLockHold:
+    __slots__ = ("locks", "user_id")
+
+    def __init__(self, locks, user_id):
+        self.locks = locks
+        self.user_id = user_id
+
+    async def __aenter__(self):
+        await self.locks._acquire(self.user_id)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.locks._release(self.user_id)
@@ -0,0 +1,147 @@
+import time
+from bisect import bisect_left
+from collections import deque
+from itertools import count
+
+# ========== CẤU HÌNH ==========
+WINDOW_BASE = 50        # chênh lệch điểm chấp nhận được khi vừa vào hàng chờ
+WINDOW_STEP = 50        # nới thêm mỗi WIDEN_EVERY giây chờ
+WIDEN_EVERY = 10        # giây
+WINDOW_MAX = 1000
+QUEUE_TIMEOUT = 300     # giây, tự rời hàng chờ nếu không tìm được đối thủ
+WAIT_SAMPLES = 1000     # số mẫu thời gian chờ giữ lại để tính thống kê
+
+
+class QueueTicket:
+    __slots__ = ("user_id", "score", "level", "enqueued", "key")
+
+    def __init__(self, user_id, score, level, enqueued, seq):
+        self.user_id = user_id
+        self.score = score
+        self.level = level
+        self.enqueued = enqueued
+        self.key = (score, seq, user_id)
+
+
+# ========== HÀNG CHỜ GHÉP TRẬN ==========
+# Người chờ được giữ trong một list sắp xếp theo điểm. Khi có người vào hàng,
+# chỉ cần tìm nhị phân vị trí của họ và xét hai người kề bên (gần điểm nhất)
+# nên mỗi lần vào hàng là O(log n). Hai người được ghép nếu chênh lệch điểm
+# không vượt quá cửa sổ của một trong hai; cửa sổ nới rộng dần theo thời gian
+# chờ, và sweep() định kỳ ghép lại các cặp kề nhau vừa lọt vào cửa sổ.
+class MatchmakingQueue:
+    def __init__(self, window_base=WINDOW_BASE, window_step=WINDOW_STEP,
+                 widen_every=WIDEN_EVERY, window_max=WINDOW_MAX, timeout=QUEUE_TIMEOUT):
+        self.window_base = window_base
+        self.window_step = window_step
+        self.widen_every = widen_every
+        self.window_max = window_max
+        self.timeout = timeout
+
+        self._keys = []
+        self._tickets = {}
+        self._seq = count()
+
+        self.matched = 0
+        self.expired = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+
+    def window(self, ticket, now):
+        widened = int((now - ticket.enqueued) // self.widen_every) * self.window_step
+        return min(self.window_max, self.window_base + widened)
+
+    def _compatible(self, a, b, now):
+        return abs(a.score - b.score) <= max(self.window(a, now), self.window(b, now))
+
+    def enqueue(self, user_id, score, level, now=None):
+        # Trả về vé của đối thủ nếu ghép được ngay, ngược lại xếp người chơi vào hàng
+        now = time.monotonic() if now is None else now
+        if user_id in self._tickets:
+            return None
+        ticket = QueueTicket(user_id, score, level, now, next(self._seq))
+        pos = bisect_left(self._keys, ticket.key)
+        best = None
+        for idx in (pos - 1, pos):
+            if 0 <= idx < len(self._keys):
+                other = self._tickets[self._keys[idx][2]]
+                if self._compatible(ticket, other, now):
+                    if best is None or abs(other.score - score) < abs(best.score - score):
+                        best = other
+        if best is not None:
+            self._remove(best)
+            self._record_match(best, now)
+            self._record_match(ticket, now)
+            return best
+        self._keys.insert(pos, ticket.key)
+        self._tickets[user_id] = ticket
+        return None
+
+    def leave(self, user_id):
+        ticket = self._tickets.get(user_id)
+        if ticket is None:
+            return False
+        self._remove(ticket)
+        return True
+
+    def _remove(self, ticket):
+        del self._keys[bisect_left(self._keys, ticket.key)]
+        del self._tickets[ticket.user_id]
+
+    def _record_match(self, ticket, now):
+        self.matched += 1
+        self._waits.append(now - ticket.enqueued)
+
+    def sweep(self, now=None):
+        # Ghép các cặp kề nhau đã lọt vào cửa sổ và loại người chờ quá lâu.
+        # Trả về (danh sách cặp vé, danh sách vé hết hạn)
+        now = time.monotonic() if now is None else now
+        pairs = []
+        expired = []
+        remaining = []
+        tickets = [self._tickets[key[2]] for key in self._keys]
+        i = 0
+        while i < len(tickets):
+            ticket = tickets[i]
+            if now - ticket.enqueued >= self.timeout:
+                expired.append(ticket)
+                i += 1
+                continue
+            if i + 1 < len(tickets):
+                nxt = tickets[i + 1]
+                if now - nxt.enqueued < self.timeout and self._compatible(ticket, nxt, now):
+                    pairs.append((ticket, nxt))
+                    self._record_match(ticket, now)
+                    self._record_match(nxt, now)
+                    i += 2
+                    continue
+            remaining.append(ticket)
+            i += 1
+
+        if pairs or expired:
+            self._keys = [t.key for t in remaining]
+            self._tickets = {t.user_id: t for t in remaining}
+            self.expired += len(expired)
+        return pairs, expired
+
+    def __contains__(self, user_id):
+        return user_id in self._tickets
+
+    def __len__(self):
+        return len(self._keys)
+
+    def stats(self):
+        waits = sorted(self._waits)
+        if waits:
+            p50 = waits[len(waits) // 2]
+            p90 = waits[min(len(waits) - 1, int(len(waits) * 0.9))]
+            avg = sum(waits) / len(waits)
+        else:
+            p50 = p90 = avg = 0.0
+        return {
+            "depth": len(self._keys),
+            "matched": self.matched,
+            "expired": self.expired,
+            "wait_avg": avg,
+            "wait_p50": p50,
+            "wait_p90": p90,
+        }
@@ -0,0 +1,295 @@
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+from bisect import bisect_left
+from collections import Counter as _FrameCounter
+
+logger = logging.getLogger(__name__)
+
+# ========== CẤU HÌNH ==========
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+LOOP_LAG_INTERVAL = 0.5   # giây giữa hai lần đo độ trễ event loop
+PROFILE_INTERVAL = 0.005  # giây giữa hai lần lấy mẫu stack
+PROFILE_DEPTH = 30
+PROFILE_TOP = 200         # số stack nhiều mẫu nhất trả về ở /profile
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+# ========== CÁC LOẠI SỐ ĐO ==========
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, amount=1, *label_values):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self._values.items():
+            yield self.name + _format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    # Giá trị lấy từ hàm fn() lúc xuất số đo, không phải cập nhật ở đường nóng
+    kind = "gauge"
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def samples(self):
+        yield self.name, self.fn()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # nhãn -> [số đếm theo bucket..., tổng, số lần]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+        # Chỉ tăng đúng một ô; phân phối tích luỹ được tính lúc xuất
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def quantile(self, q, *label_values):
+        # Ước lượng phân vị theo cận trên của bucket (đủ để so sánh các handler)
+        series = self._series.get(label_values)
+        if not series or not series[-1]:
+            return 0.0
+        target = q * series[-1]
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        names = self.labels + ("le",)
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket" + _format_labels(names, label_values + (le,)), cumulative
+            yield self.name + "_sum" + _format_labels(self.labels, label_values), series[-2]
+            yield self.name + "_count" + _format_labels(self.labels, label_values), series[-1]
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "started")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+# ========== BẢNG SỐ ĐO ==========
+class MetricsRegistry:
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(self.prefix + name, help, labels))
+
+    def gauge(self, name, help, fn):
+        return self._add(Gauge(self.prefix + name, help, fn))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def render(self):
+        # Định dạng văn bản của Prometheus (text exposition 0.0.4)
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, value in metric.samples():
+                    lines.append(f"{name} {value}")
+            except Exception as e:
+                logger.warning(f"Không đọc được số đo {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def timed(histogram, name, handler):
+    # Bọc handler của python-telegram-bot để đo thời gian xử lý theo tên handler
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await handler(update, context)
+        finally:
+            histogram.observe(time.perf_counter() - started, name)
+    return wrapper
+
+
+# ========== ĐỘ TRỄ EVENT LOOP ==========
+# Ngủ một khoảng cố định rồi đo xem bị đánh thức muộn bao nhiêu: phần muộn
+# chính là thời gian event loop bị một callback nào đó chiếm giữ.
+class LoopLagMonitor:
+    def __init__(self, histogram, interval=LOOP_LAG_INTERVAL):
+        self.histogram = histogram
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, time.perf_counter() - expected)
+            self.max = max(self.max, self.last)
+            self.histogram.observe(self.last)
+
+
+# ========== PROFILER LẤY MẪU ==========
+# Tuỳ chọn bật: một thread định kỳ chụp stack của thread chạy event loop qua
+# sys._current_frames() và đếm theo dạng "folded" (hàm;hàm;hàm số_mẫu) dùng
+# được ngay với flamegraph.pl / speedscope. Không sửa code nào khác.
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, depth=PROFILE_DEPTH):
+        self.interval = interval
+        self.depth = depth
+        self.samples = 0
+        self._stacks = _FrameCounter()
+        self._target = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        if self._thread is not None:
+            return
+        self._target = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self, top=PROFILE_TOP):
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common(top))
+
+    def reset(self):
+        self._stacks.clear()
+        self.samples = 0
+
+
+# ========== HTTP SERVER CHO SỐ ĐO ==========
+# GET /metrics: số đo dạng Prometheus; GET /profile: stack dạng folded (nếu
+# profiler được bật), thêm ?reset=1 để xoá mẫu sau khi đọc.
+class MetricsServer:
+    def __init__(self, registry, host="127.0.0.1", port=9464, profiler=None):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.profiler = profiler
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"📈 Số đo tại http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split(" ")
+            target = parts[1] if len(parts) > 1 else "/"
+            path, _, query = target.partition("?")
+            if path == "/metrics":
+                status, body = "200 OK", self.registry.render()
+            elif path == "/profile" and self.profiler is not None:
+                status, body = "200 OK", self.profiler.folded()
+                if "reset=1" in query:
+                    self.profiler.reset()
+            else:
+                status, body = "404 Not Found", "not found\n"
+            data = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
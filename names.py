@@ -0,0 +1,87 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+# ========== CẤU HÌNH ==========
+NAME_CACHE_SIZE = 50000
+NAME_TTL = 6 * 3600        # giây
+RESOLVE_CONCURRENCY = 5    # số lời gọi get_chat chạy song song tối đa
+
+
+def display_name(user):
+    return user.username or user.first_name
+
+
+# ========== BỘ NHỚ ĐỆM TÊN HIỂN THỊ ==========
+# uid -> (tên, hạn dùng), loại bỏ theo LRU khi đầy. Tên được ghi nhận miễn phí
+# từ mọi update mà người chơi gửi tới, chỉ người chơi vắng lâu mới phải gọi API.
+# Kèm theo bảng username -> uid để thách đấu PvP bằng @username.
+class NameCache:
+    def __init__(self, capacity=NAME_CACHE_SIZE, ttl=NAME_TTL, concurrency=RESOLVE_CONCURRENCY):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self._entries = OrderedDict()
+        self._usernames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def remember(self, uid, name, username=None):
+        if username:
+            key = username.lower()
+            self._usernames[key] = uid
+            self._usernames.move_to_end(key)
+            if len(self._usernames) > self.capacity:
+                self._usernames.popitem(last=False)
+        if not name:
+            return
+        self._entries[uid] = (name, time.monotonic() + self.ttl)
+        self._entries.move_to_end(uid)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def find_username(self, username):
+        return self._usernames.get(username.lstrip("@").lower())
+
+    def get(self, uid):
+        entry = self._entries.get(uid)
+        if entry is None:
+            return None
+        name, expires = entry
+        if expires < time.monotonic():
+            del self._entries[uid]
+            return None
+        self._entries.move_to_end(uid)
+        return name
+
+    async def resolve(self, uids, fetch):
+        # fetch(uid) trả về tên hoặc None; các uid chưa có trong cache được
+        # tra cứu song song, tối đa self.concurrency lời gọi cùng lúc
+        names = {}
+        missing = []
+        for uid in uids:
+            name = self.get(uid)
+            if name is None:
+                missing.append(uid)
+            else:
+                names[uid] = name
+        self.hits += len(names)
+        self.misses += len(missing)
+        if not missing:
+            return names
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_one(uid):
+            async with semaphore:
+                return await fetch(uid)
+
+        results = await asyncio.gather(*(fetch_one(uid) for uid in missing))
+        for uid, name in zip(missing, results):
+            if name:
+                self.remember(uid, name)
+                names[uid] = name
+        return names
+
+    def __len__(self):
+        return len(self._entries)
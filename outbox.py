@@ -0,0 +1,289 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+from telegram.error import RetryAfter, TimedOut, NetworkError, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# ========== CẤU HÌNH ==========
+# Giới hạn của Telegram: ~30 tin/giây cho cả bot, ~1 tin/giây cho mỗi chat
+# riêng, ~20 tin/phút cho mỗi nhóm
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+GROUP_RATE = 20 / 60
+MAX_IN_FLIGHT = 16       # số lời gọi Bot API chạy song song tối đa
+MAX_RETRIES = 3          # thử lại khi lỗi mạng
+MAX_MESSAGE_LENGTH = 4096
+
+# Làn ưu tiên: trả lời trực tiếp cho người chơi đi trước thông báo
+REPLY = 0
+NOTIFY = 1
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        # now có thể được đọc trước khi bucket được tạo: bỏ qua khoảng thời gian âm
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now):
+        # Số giây phải chờ để có một token (0 nếu có ngay)
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class OutboundMessage:
+    __slots__ = ("method", "chat_id", "text", "kwargs", "mergeable", "attempts", "queued")
+
+    def __init__(self, method, chat_id, text, kwargs, mergeable):
+        self.method = method
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.mergeable = mergeable
+        self.attempts = 0
+        self.queued = time.monotonic()
+
+
+class _ChatQueue:
+    __slots__ = ("lanes", "queued", "busy", "bucket")
+
+    def __init__(self, bucket):
+        self.lanes = (deque(), deque())
+        self.queued = [False, False]  # chat đang nằm trong hàng sẵn sàng của làn đó
+        self.busy = False             # đang có tin gửi dở (giữ thứ tự trong một chat)
+        self.bucket = bucket
+
+
+# ========== HÀNG ĐỢI TIN NHẮN GỬI ĐI ==========
+# Handler chỉ gọi send()/edit() rồi trả về ngay; một task nền gửi tin theo
+# thứ tự ưu tiên, tôn trọng token bucket toàn cục và của từng chat. Mỗi chat
+# chỉ có một tin đang gửi nên thứ tự tin trong một làn được giữ nguyên. Các
+# thông báo (merge=True) chưa kịp gửi cho cùng một chat được gộp thành một tin,
+# các lần sửa cùng một tin nhắn chưa kịp gửi chỉ giữ nội dung mới nhất.
+# Gặp RetryAfter (429) thì tạm dừng toàn bộ việc gửi rồi gửi lại đúng tin đó.
+class Outbox:
+    def __init__(self, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST,
+                 group_rate=GROUP_RATE, max_in_flight=MAX_IN_FLIGHT):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_in_flight = max_in_flight
+        self._global = TokenBucket(global_rate, max(1, global_rate))
+        self._chats = {}
+        self._ready = (deque(), deque())
+        self._idle = deque()  # (thời điểm, chat_id) chờ dọn khỏi self._chats
+        self._bot = None
+        self._task = None
+        self._wakeup = None
+        self._sending = set()
+        self._paused_until = 0.0
+        self._closing = False
+
+        self.pending = 0
+        self.sent = 0
+        self.merged = 0
+        self.failed = 0
+        self.retry_after = 0
+        # observer(method, giây chờ trong hàng, giây gọi API) sau mỗi tin gửi thành công
+        self.observer = None
+
+    # ---------- phía handler ----------
+    def send(self, chat_id, text, priority=REPLY, merge=False, **kwargs):
+        queue = self._chat(chat_id)
+        lane = queue.lanes[priority]
+        if merge and lane:
+            last = lane[-1]
+            if (last.mergeable and last.attempts == 0
+                    and len(last.text) + len(text) + 2 <= MAX_MESSAGE_LENGTH):
+                last.text += "\n\n" + text
+                self.merged += 1
+                return
+        lane.append(OutboundMessage("send_message", chat_id, text, kwargs, merge and not kwargs))
+        self._mark_ready(chat_id, queue, priority)
+
+    def edit(self, chat_id, message_id, text, **kwargs):
+        kwargs["message_id"] = message_id
+        queue = self._chat(chat_id)
+        # Lần sửa cũ của cùng tin nhắn chưa kịp gửi thì chỉ cần thay nội dung:
+        # tin trạng thái được sửa định kỳ không dồn hàng khi bucket của nhóm chậm
+        for pending in queue.lanes[REPLY]:
+            if (pending.method == "edit_message_text" and pending.attempts == 0
+                    and pending.kwargs["message_id"] == message_id):
+                pending.text = text
+                pending.kwargs = kwargs
+                self.merged += 1
+                return
+        queue.lanes[REPLY].append(OutboundMessage("edit_message_text", chat_id, text, kwargs, False))
+        self._mark_ready(chat_id, queue, REPLY)
+
+    def _chat(self, chat_id):
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            # chat_id âm là nhóm/kênh, có giới hạn chặt hơn chat riêng
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            queue = self._chats[chat_id] = _ChatQueue(bucket)
+        return queue
+
+    def _mark_ready(self, chat_id, queue, priority):
+        self.pending += 1
+        if not queue.queued[priority]:
+            queue.queued[priority] = True
+            self._ready[priority].append(chat_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ---------- task gửi ----------
+    def start(self, bot):
+        self._bot = bot
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="outbox")
+
+    async def stop(self):
+        # Gửi nốt các tin còn trong hàng rồi dừng
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    def _pick(self, now):
+        # Trả về (chat_id, làn) được gửi tiếp theo, hoặc (None, thời gian chờ)
+        wait = None
+        for priority, ready in enumerate(self._ready):
+            for _ in range(len(ready)):
+                chat_id = ready.popleft()
+                queue = self._chats[chat_id]
+                if not queue.lanes[priority]:
+                    queue.queued[priority] = False
+                    self._schedule_evict(chat_id, queue, now)
+                    continue
+                ready.append(chat_id)
+                if queue.busy:
+                    continue
+                delay = queue.bucket.wait_time(now)
+                if delay > 0:
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+                return chat_id, priority
+        return None, wait
+
+    def _schedule_evict(self, chat_id, queue, now):
+        if not queue.busy and not any(queue.queued):
+            # Sau chừng này giây bucket chắc chắn đã đầy lại
+            self._idle.append((now + queue.bucket.capacity / queue.bucket.rate, chat_id))
+
+    def _evict_idle(self, now):
+        # Bỏ hàng đợi của các chat đã rảnh và có bucket đầy lại, để bảng chỉ lớn
+        # theo số chat đang nhận tin chứ không theo tổng số người chơi
+        idle = self._idle
+        while idle and idle[0][0] <= now:
+            _, chat_id = idle.popleft()
+            queue = self._chats.get(chat_id)
+            if queue is not None and not queue.busy and not any(queue.queued):
+                del self._chats[chat_id]
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            wait = self._global.wait_time(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            if len(self._sending) >= self.max_in_flight:
+                await asyncio.wait(set(self._sending), return_when=asyncio.FIRST_COMPLETED)
+                continue
+            self._evict_idle(now)
+            chat_id, info = self._pick(now)
+            if chat_id is None:
+                if self._closing and self.pending == 0:
+                    return
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), info)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            queue = self._chats[chat_id]
+            message = queue.lanes[info].popleft()
+            queue.busy = True
+            queue.bucket.take(now)
+            self._global.take(now)
+            task = asyncio.create_task(self._deliver(queue, info, message))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, queue, priority, message):
+        message.attempts += 1
+        started = time.monotonic()
+        try:
+            await getattr(self._bot, message.method)(
+                chat_id=message.chat_id, text=message.text, **message.kwargs
+            )
+            self.sent += 1
+            self.pending -= 1
+            if self.observer is not None:
+                self.observer(message.method, started - message.queued, time.monotonic() - started)
+        except RetryAfter as e:
+            # Telegram bắt chờ: dừng cả hàng đợi, đưa tin về đầu làn để gửi lại
+            self.retry_after += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            queue.lanes[priority].appendleft(message)
+            logger.warning(f"Bị giới hạn tốc độ gửi tin, tạm dừng {e.retry_after}s")
+        except (TimedOut, NetworkError) as e:
+            if message.attempts < MAX_RETRIES:
+                await asyncio.sleep(message.attempts)
+                queue.lanes[priority].appendleft(message)
+            else:
+                self.failed += 1
+                self.pending -= 1
+                logger.warning(f"Không gửi được tin cho chat {message.chat_id}: {e}")
+        except TelegramError as e:
+            # Người chơi chặn bot, chat không tồn tại...: bỏ tin, không thử lại
+            self.failed += 1
+            self.pending -= 1
+            logger.warning(f"Không gửi được tin cho chat {message.chat_id}: {e}")
+        finally:
+            queue.busy = False
+            if queue.lanes[priority] and not queue.queued[priority]:
+                queue.queued[priority] = True
+                self._ready[priority].append(message.chat_id)
+            else:
+                self._schedule_evict(message.chat_id, queue, time.monotonic())
+            self._wakeup.set()
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "chats": len(self._chats),
+            "in_flight": len(self._sending),
+            "sent": self.sent,
+            "merged": self.merged,
+            "failed": self.failed,
+            "retry_after": self.retry_after,
+        }
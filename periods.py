@@ -0,0 +1,188 @@
+import os
+import json
+import logging
+from collections import deque
+from datetime import datetime
+
+from quests import period_key
+from ranking import RankIndex
+
+logger = logging.getLogger(__name__)
+
+# ========== CẤU HÌNH ==========
+PERIODS = ("daily", "weekly", "season")
+ARCHIVE_TOP = 10   # số người giữ lại trong bản lưu của một kỳ đã kết thúc
+ARCHIVE_KEEP = 30  # số kỳ đã kết thúc giữ trong bộ nhớ cho mỗi loại
+
+
+def load_timezone(name):
+    # None: giờ địa phương của máy chủ
+    if not name:
+        return None
+    from zoneinfo import ZoneInfo
+    return ZoneInfo(name)
+
+
+# ========== BẢNG XẾP HẠNG THEO KỲ ==========
+# Mỗi kỳ (ngày/tuần/mùa) chỉ chứa những người đã có điểm trong kỳ đó, cộng
+# dồn mỗi khi được thưởng điểm. Sang kỳ mới thì bảng cũ được lưu lại (top
+# ARCHIVE_TOP) rồi thay bằng bảng rỗng, tốn O(số người trong bảng), không
+# phải duyệt lại toàn bộ người chơi.
+class PeriodBoard:
+    __slots__ = ("period", "key", "points", "index")
+
+    def __init__(self, period, key):
+        self.period = period
+        self.key = key
+        self.points = {}
+        self.index = RankIndex()
+
+    def load(self, points):
+        self.points = dict(points)
+        self.index.load(self.points.items())
+
+    def set(self, uid, points):
+        self.points[uid] = points
+        self.index.update(uid, points)
+
+    def snapshot(self, top=ARCHIVE_TOP):
+        return {
+            "period": self.period, "key": self.key,
+            "players": len(self.points), "top": self.index.top(top),
+        }
+
+    def __len__(self):
+        return len(self.points)
+
+
+# Điểm của người chơi trong kỳ hiện tại lưu ngay trong bản ghi người chơi
+# (player["period_points"][kỳ] = [khoá kỳ, điểm]) nên được ghi cùng log của
+# người chơi; các kỳ đã kết thúc được thêm vào file archive, mỗi kỳ một dòng.
+class PeriodBoards:
+    def __init__(self, archive_path=None, tz=None, periods=PERIODS):
+        self.archive_path = archive_path
+        self.tz = tz
+        self.periods = periods
+        self.boards = {}
+        self.archives = {period: deque(maxlen=ARCHIVE_KEEP) for period in periods}
+        self.version = 0
+        now = self.now()
+        for period in periods:
+            self.boards[period] = PeriodBoard(period, period_key(period, now))
+
+    def now(self):
+        return datetime.now(self.tz)
+
+    def keys(self, now=None):
+        now = now or self.now()
+        return {period: period_key(period, now) for period in self.periods}
+
+    # ---------- khởi động ----------
+    def load(self, players):
+        # players: các cặp (uid, bản ghi). Kỳ hiện tại nạp vào bảng; kỳ gần nhất
+        # đã kết thúc mà chưa có trong archive (bot tắt lúc sang kỳ) được lưu bù
+        archived = self._read_archive()
+        current = self.keys()
+        live = {period: {} for period in self.periods}
+        stale = {period: {} for period in self.periods}
+        for uid, player in players:
+            for period, (key, points) in player.get("period_points", {}).items():
+                if period not in live:
+                    continue
+                if key == current[period]:
+                    live[period][uid] = points
+                elif (period, key) not in archived:
+                    stale[period].setdefault(key, {})[uid] = points
+        for period in self.periods:
+            board = self.boards[period] = PeriodBoard(period, current[period])
+            board.load(live[period])
+            if stale[period]:
+                key = max(stale[period])
+                old = PeriodBoard(period, key)
+                old.load(stale[period][key])
+                self._archive(old)
+        self.version += 1
+
+    def _read_archive(self):
+        archived = set()
+        if not self.archive_path or not os.path.exists(self.archive_path):
+            return archived
+        try:
+            with open(self.archive_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    archived.add((entry["period"], entry["key"]))
+                    if entry["period"] in self.archives:
+                        self.archives[entry["period"]].append(entry)
+        except OSError as e:
+            logger.error(f"Lỗi khi đọc archive bảng xếp hạng: {e}")
+        return archived
+
+    # ---------- cập nhật ----------
+    def add(self, uid, player, delta, now=None):
+        # Cộng điểm thưởng vào mọi kỳ hiện tại của người chơi
+        if delta <= 0:
+            return
+        stored = player.setdefault("period_points", {})
+        for period, key in self.keys(now).items():
+            board = self._current(period, key)
+            entry = stored.get(period)
+            if entry is None or entry[0] != key:
+                # Điểm kỳ trước của người chơi (nếu có) đã nằm trong archive
+                entry = stored[period] = [key, 0]
+            entry[1] += delta
+            board.set(uid, entry[1])
+        self.version += 1
+
+    def _current(self, period, key):
+        board = self.boards[period]
+        if board.key != key:
+            self._archive(board)
+            board = self.boards[period] = PeriodBoard(period, key)
+            self.version += 1
+        return board
+
+    def _archive(self, board):
+        if not board.points:
+            return
+        entry = board.snapshot()
+        self.archives[board.period].append(entry)
+        if self.archive_path:
+            try:
+                with open(self.archive_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+            except OSError as e:
+                logger.error(f"Lỗi khi ghi archive bảng xếp hạng: {e}")
+        logger.info(f"Đã chốt bảng xếp hạng {board.period} {board.key} ({len(board)} người chơi)")
+
+    # ---------- đọc ----------
+    def board(self, period, now=None):
+        # Bảng của kỳ hiện tại; sang kỳ mới mà chưa ai được cộng điểm thì chốt ngay lúc đọc
+        return self._current(period, period_key(period, now or self.now()))
+
+    def top(self, period, k, now=None):
+        return self.board(period, now).index.top(k)
+
+    def rank(self, period, uid, now=None):
+        return self.board(period, now).index.rank(uid)
+
+    def last_archive(self, period):
+        archives = self.archives[period]
+        return archives[-1] if archives else None
+
+    # ---------- chuyển người chơi giữa shard ----------
+    def remove(self, uid):
+        for board in self.boards.values():
+            if board.points.pop(uid, None) is not None:
+                board.index.remove(uid)
+        self.version += 1
+
+    def restore(self, uid, player):
+        for period, (key, points) in player.get("period_points", {}).items():
+            board = self.boards.get(period)
+            if board is not None and board.key == key and points > 0:
+                board.set(uid, points)
+        self.version += 1
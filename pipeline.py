@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# ========== CẤU HÌNH ==========
+PIPELINE_CONCURRENCY = 32    # số update được xử lý song song tối đa
+PIPELINE_MAX_PENDING = 1000  # số update đã nhận nhưng chưa xử lý xong tối đa
+
+
+def update_key(update):
+    # Update của cùng một người chơi phải chạy tuần tự; không có người gửi thì theo chat
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+# ========== HÀNG ĐỢI XỬ LÝ UPDATE ==========
+# Tối đa `concurrency` worker lấy update từ một hàng đợi chung. Nếu người chơi
+# của update đang được một worker khác xử lý, update được gửi vào hàng chờ
+# riêng của người đó và chính worker kia xử lý tiếp sau khi xong update hiện
+# tại, nên update của cùng một người luôn theo đúng thứ tự, còn người khác
+# nhau chạy song song. submit() chờ khi số update chưa xong đạt max_pending
+# (áp lực ngược), try_submit() trả về False thay vì chờ.
+class UpdatePipeline:
+    def __init__(self, process, concurrency=PIPELINE_CONCURRENCY, max_pending=PIPELINE_MAX_PENDING,
+                 key=update_key):
+        self.process = process
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.key = key
+
+        self._queue = None
+        self._room = None
+        self._busy = {}  # key -> deque update đang chờ sau update đang chạy
+        self._workers = []
+        self._idle = None
+
+        self.pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._room = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"pipeline-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    @property
+    def full(self):
+        return self.pending >= self.max_pending
+
+    async def submit(self, update):
+        if self.full:
+            async with self._room:
+                await self._room.wait_for(lambda: not self.full)
+                self._enqueue(update)
+                return
+        self._enqueue(update)
+
+    def try_submit(self, update):
+        if self.full:
+            self.rejected += 1
+            return False
+        self._enqueue(update)
+        return True
+
+    def _enqueue(self, update):
+        self.pending += 1
+        self._idle.clear()
+        self._queue.put_nowait(update)
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            key = self.key(update)
+            if key is not None:
+                waiting = self._busy.get(key)
+                if waiting is not None:
+                    waiting.append(update)
+                    continue
+                waiting = self._busy[key] = deque()
+            await self._run(update)
+            if key is not None:
+                while waiting:
+                    await self._run(waiting.popleft())
+                del self._busy[key]
+
+    async def _run(self, update):
+        try:
+            await self.process(update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Lỗi khi xử lý update: {e}")
+        finally:
+            self.pending -= 1
+            if self.pending == 0:
+                self._idle.set()
+            if self.pending == self.max_pending - 1:
+                async with self._room:
+                    self._room.notify_all()
+
+    async def join(self):
+        await self._idle.wait()
+
+    async def stop(self):
+        # Xử lý nốt các update đã nhận rồi dừng worker
+        await self.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "active_users": len(self._busy),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
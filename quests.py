@@ -0,0 +1,70 @@
+from datetime import datetime
+
+# ========== NHIỆM VỤ ==========
+# event: sự kiện làm tiến triển nhiệm vụ
+# mode: "count" cộng dồn số lần; "value" lấy giá trị mới nhất (điểm, streak...)
+# period: None (một lần), "daily" hoặc "weekly" (làm lại mỗi ngày/tuần)
+QUESTS = {
+    "win_3_games": {"event": "solo_win", "mode": "count", "goal": 3, "reward": 50, "desc": "Thắng 3 trò chơi"},
+    "reach_1000": {"event": "score", "mode": "value", "goal": 1000, "reward": 100, "desc": "Đạt 1000 điểm"},
+    "win_5_pvp": {"event": "pvp_win", "mode": "count", "goal": 5, "reward": 150, "desc": "Thắng 5 trận PvP"},
+    "daily_streak_7": {"event": "daily_streak", "mode": "value", "goal": 7, "reward": 200, "desc": "Nhận quà 7 ngày liên tiếp"},
+    "daily_win_3": {"event": "solo_win", "mode": "count", "goal": 3, "reward": 30, "desc": "Thắng 3 ván trong ngày", "period": "daily"},
+    "weekly_pvp_3": {"event": "pvp_win", "mode": "count", "goal": 3, "reward": 100, "desc": "Thắng 3 trận PvP trong tuần", "period": "weekly"},
+}
+
+
+def _index_by_event(quests):
+    index = {}
+    for quest_id, quest in quests.items():
+        index.setdefault(quest["event"], []).append((quest_id, quest))
+    return {event: tuple(items) for event, items in index.items()}
+
+
+# Sự kiện -> các nhiệm vụ liên quan, tính sẵn một lần nên mỗi sự kiện chỉ xét
+# đúng những nhiệm vụ của nó thay vì duyệt toàn bộ QUESTS
+QUESTS_BY_EVENT = _index_by_event(QUESTS)
+
+
+def period_key(period, now):
+    if period == "daily":
+        return now.date().isoformat()
+    if period == "weekly":
+        year, week, _ = now.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == "season":
+        # Mỗi mùa giải là một tháng dương lịch
+        return f"{now.year}-{now.month:02d}"
+    return None
+
+
+def apply_event(player, event, amount, now=None):
+    # Cập nhật tiến độ các nhiệm vụ của sự kiện; trả về list (quest_id, quest)
+    # vừa hoàn thành. Không cộng thưởng, không ghi dữ liệu: việc đó của người gọi
+    quests = QUESTS_BY_EVENT.get(event)
+    if not quests:
+        return []
+    progress = player.setdefault("quest_progress", {})
+    completed = player.setdefault("completed_quests", {})
+    finished = []
+    for quest_id, quest in quests:
+        period = quest.get("period")
+        if period is not None:
+            # Nhiệm vụ ngày/tuần được làm mới lười biếng khi sang kỳ mới
+            key = period_key(period, now or datetime.now())
+            periods = player.setdefault("quest_periods", {})
+            if periods.get(quest_id) != key:
+                periods[quest_id] = key
+                progress.pop(quest_id, None)
+                completed.pop(quest_id, None)
+        if completed.get(quest_id):
+            continue
+        if quest["mode"] == "count":
+            value = progress.get(quest_id, 0) + amount
+        else:
+            value = amount
+        progress[quest_id] = min(value, quest["goal"])
+        if value >= quest["goal"]:
+            completed[quest_id] = True
+            finished.append((quest_id, quest))
+    return finished
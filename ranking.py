@@ -0,0 +1,289 @@
+from bisect import bisect_left, insort
+
+# ========== CẤU HÌNH ==========
+SEGMENT_SIZE = 512  # số khoá mỗi đoạn; đoạn dài gấp đôi thì được tách
+
+
+# ========== DANH SÁCH ĐÃ SẮP XẾP ==========
+# Danh sách đã sắp xếp chia thành nhiều đoạn ngắn: thêm/xoá chỉ dịch bộ nhớ
+# trong một đoạn có tối đa 2 * SEGMENT_SIZE phần tử, còn vị trí của một khoá
+# tính bằng cây Fenwick trên độ dài các đoạn. Mỗi thao tác là O(log n); cây
+# chỉ được dựng lại khi số đoạn thay đổi (tách đoạn đầy, bỏ đoạn rỗng).
+class SortedKeys:
+    def __init__(self, keys=(), segment_size=SEGMENT_SIZE):
+        self.segment_size = segment_size
+        keys = sorted(keys)
+        self._lists = [keys[i:i + segment_size] for i in range(0, len(keys), segment_size)]
+        self._maxes = [segment[-1] for segment in self._lists]
+        self._len = len(keys)
+        self._rebuild_tree()
+
+    def _rebuild_tree(self):
+        tree = [0] + [len(segment) for segment in self._lists]
+        for i in range(1, len(tree)):
+            j = i + (i & -i)
+            if j < len(tree):
+                tree[j] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, index, delta):
+        tree = self._tree
+        i = index + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _count_before(self, index):
+        # Tổng số khoá trong các đoạn đứng trước đoạn `index`
+        tree = self._tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def add(self, key):
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            self._rebuild_tree()
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            self._lists[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._lists[i], key)
+        self._len += 1
+        keys = self._lists[i]
+        if len(keys) > 2 * self.segment_size:
+            tail = keys[self.segment_size:]
+            del keys[self.segment_size:]
+            self._lists.insert(i + 1, tail)
+            self._maxes.insert(i + 1, tail[-1])
+            self._maxes[i] = keys[-1]
+            self._rebuild_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, key):
+        # key phải đang có trong danh sách
+        i = bisect_left(self._maxes, key)
+        keys = self._lists[i]
+        del keys[bisect_left(keys, key)]
+        self._len -= 1
+        if keys:
+            self._maxes[i] = keys[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+            self._rebuild_tree()
+
+    def position(self, key):
+        # Số khoá nhỏ hơn key
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return self._len
+        return self._count_before(i) + bisect_left(self._lists[i], key)
+
+    def first(self, k):
+        result = []
+        for segment in self._lists:
+            if len(result) >= k:
+                break
+            result.extend(segment[:k - len(result)])
+        return result
+
+    def __len__(self):
+        return self._len
+
+
+# ========== BẢNG XẾP HẠNG ==========
+# Các khoá (-điểm, uid) luôn được sắp xếp, cập nhật mỗi khi điểm thay đổi.
+# top(k) lấy k khoá đầu, rank() đếm số khoá đứng trước; đều là O(log n).
+class RankIndex:
+    def __init__(self):
+        self._keys = SortedKeys()
+        self._scores = {}
+        self.version = 0
+
+    def load(self, scores):
+        self._scores = {uid: score for uid, score in scores}
+        self._keys = SortedKeys((-score, uid) for uid, score in self._scores.items())
+        self.version += 1
+
+    def update(self, uid, score):
+        old = self._scores.get(uid)
+        if old == score:
+            return
+        if old is not None:
+            self._keys.remove((-old, uid))
+        self._scores[uid] = score
+        self._keys.add((-score, uid))
+        self.version += 1
+
+    def remove(self, uid):
+        old = self._scores.pop(uid, None)
+        if old is not None:
+            self._keys.remove((-old, uid))
+            self.version += 1
+
+    def top(self, k):
+        return [(uid, -neg_score) for neg_score, uid in self._keys.first(k)]
+
+    def rank(self, uid):
+        # Hạng = số người chơi có điểm cao hơn hẳn + 1 (đồng điểm thì đồng hạng)
+        score = self._scores.get(uid)
+        if score is None:
+            return None
+        return self.count_above(score) + 1
+
+    def count_above(self, score):
+        return self._keys.position((-score,))
+
+    def score(self, uid):
+        return self._scores.get(uid)
+
+    def uids(self):
+        return self._scores.keys()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+# ========== ĐẾM THEO MỨC ĐIỂM ==========
+# Cây Fenwick trên các mức điểm 0..size-1: số người chơi có điểm cao hơn một
+# mức là O(log điểm tối đa). Điểm vượt kích thước thì cây được nhân đôi tại
+# chỗ (nút mới cuối cùng phủ cả nửa cũ nên chỉ cần đặt tổng cũ vào đó).
+class ScoreCounts:
+    def __init__(self, scores=()):
+        counts = {}
+        for score in scores:
+            counts[score] = counts.get(score, 0) + 1
+        size = 1
+        while size <= max(counts, default=0):
+            size *= 2
+        tree = [0] * (size + 1)
+        for score, count in counts.items():
+            tree[score + 1] = count
+        for i in range(1, size + 1):
+            j = i + (i & -i)
+            if j <= size:
+                tree[j] += tree[i]
+        self._tree = tree
+        self._total = sum(counts.values())
+
+    def add(self, score, delta):
+        tree = self._tree
+        while score >= len(tree) - 1:
+            size = len(tree) - 1
+            tree.extend([0] * size)
+            tree[2 * size] = tree[size]
+        i = score + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+        self._total += delta
+
+    def count_above(self, score):
+        tree = self._tree
+        i = min(score + 1, len(tree) - 1)
+        at_most = 0
+        while i > 0:
+            at_most += tree[i]
+            i -= i & -i
+        return self._total - at_most
+
+    def __len__(self):
+        return self._total
+
+
+# ========== BẢNG XẾP HẠNG TRÊN CSDL ==========
+# Backend không giữ mọi người chơi trong RAM (SQLite) thì chỉ giữ số người
+# chơi theo từng mức điểm (ScoreCounts, nạp một lần từ cột score lúc khởi
+# động) và một RankIndex nhỏ cho những người chơi có điểm đổi trong lúc nằm
+# trong cache. Với người chơi khác, điểm đã lưu trong CSDL chính là điểm đang
+# được đếm. Người chơi rời cache thì đã được ghi xuống CSDL nên được prune()
+# bỏ khỏi RankIndex; người chơi bị chuyển sang shard khác (remove) không còn
+# được đếm dù bản ghi cũ vẫn nằm trong CSDL.
+class StoreRanking:
+    def __init__(self, store, is_cached):
+        self.store = store
+        self.is_cached = is_cached
+        self.version = 0
+        self._counts = ScoreCounts()
+        self._recent = RankIndex()
+        self._removed = set()
+
+    def load(self, scores):
+        self._counts = ScoreCounts(scores)
+        self._recent = RankIndex()
+        self._removed = set()
+        self.version += 1
+
+    def _counted(self, uid):
+        # Điểm của uid đang được đếm, None nếu không được đếm
+        if uid in self._removed:
+            return None
+        score = self._recent.score(uid)
+        if score is None:
+            record = self.store.load_one(uid)
+            if record is not None:
+                score = record.get("score", 0)
+        return score
+
+    def update(self, uid, score):
+        old = self._counted(uid)
+        if old == score:
+            return
+        if old is not None:
+            self._counts.add(old, -1)
+        self._counts.add(score, 1)
+        self._recent.update(uid, score)
+        self._removed.discard(uid)
+        self.version += 1
+
+    def remove(self, uid):
+        old = self._counted(uid)
+        if old is not None:
+            self._counts.add(old, -1)
+            self._recent.remove(uid)
+            self._removed.add(uid)
+            self.version += 1
+
+    def prune(self):
+        # Gọi sau mỗi lần ghi xuống CSDL
+        for uid in [uid for uid in self._recent.uids() if not self.is_cached(uid)]:
+            self._recent.remove(uid)
+
+    def top(self, k):
+        # Bản ghi trong CSDL của người chơi trong _recent/_removed có thể đã cũ:
+        # bỏ qua họ và lấy thêm hàng cho tới khi đủ k người có điểm đúng
+        limit = k
+        while True:
+            rows = self.store.top(limit)
+            stored = [
+                (uid, record.get("score", 0)) for uid, record in rows
+                if uid not in self._removed and self._recent.score(uid) is None
+            ]
+            if len(stored) >= k or len(rows) < limit:
+                break
+            limit += k - len(stored)
+        ranked = stored[:k] + self._recent.top(k)
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked[:k]
+
+    def rank(self, uid):
+        score = self._counted(uid)
+        if score is None:
+            return None
+        return self.count_above(score) + 1
+
+    def count_above(self, score):
+        return self._counts.count_above(score)
+
+    def __len__(self):
+        return len(self._counts)
@@ -0,0 +1,118 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ========== CẤU HÌNH ==========
+TICK_SECONDS = 1.0
+WHEEL_SLOTS = 512
+
+
+# ========== BÁNH XE HẸN GIỜ ==========
+# Hashed timer wheel: mỗi ô là một dict key -> [số vòng còn lại, callback].
+# Đặt, đặt lại và huỷ hẹn giờ đều là O(1); chỉ một task nền quay bánh xe mỗi
+# tick, callback (hàm async không tham số) chỉ được tạo task khi hết hạn.
+class TimerWheel:
+    def __init__(self, tick=TICK_SECONDS, slots=WHEEL_SLOTS):
+        self.tick = tick
+        self._slots = [{} for _ in range(slots)]
+        self._where = {}
+        self._cursor = 0
+        self._task = None
+        self._running = set()
+
+        self.armed = 0
+        self.fired = 0
+        self.cancelled = 0
+
+    def arm(self, key, delay, callback):
+        # Đặt hẹn giờ mới, thay thế hẹn giờ cũ cùng key nếu có
+        self._remove(key)
+        ticks = max(1, -int(-delay // self.tick))
+        slot = (self._cursor + ticks) % len(self._slots)
+        self._slots[slot][key] = [(ticks - 1) // len(self._slots), callback]
+        self._where[key] = slot
+        self.armed += 1
+
+    def rearm(self, key, delay):
+        # Lùi thời điểm hết hạn, giữ nguyên callback (dùng cho hết giờ do không hoạt động)
+        slot = self._where.get(key)
+        if slot is None:
+            return False
+        self.arm(key, delay, self._slots[slot][key][1])
+        return True
+
+    def cancel(self, key):
+        if self._remove(key):
+            self.cancelled += 1
+            return True
+        return False
+
+    def _remove(self, key):
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        return True
+
+    def __contains__(self, key):
+        return key in self._where
+
+    @property
+    def pending(self):
+        return len(self._where)
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "armed": self.armed,
+            "fired": self.fired,
+            "cancelled": self.cancelled,
+            "running": len(self._running),
+        }
+
+    # ========== VÒNG QUAY ==========
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            # Nếu event loop bị chậm thì quay bù các tick đã lỡ
+            while next_tick <= time.monotonic():
+                self._advance()
+                next_tick += self.tick
+
+    def _advance(self):
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        bucket = self._slots[self._cursor]
+        expired = []
+        for key, entry in bucket.items():
+            if entry[0] > 0:
+                entry[0] -= 1
+            else:
+                expired.append((key, entry[1]))
+        for key, callback in expired:
+            del bucket[key]
+            del self._where[key]
+            self.fired += 1
+            task = asyncio.create_task(callback())
+            self._running.add(task)
+            task.add_done_callback(self._on_done)
+
+    def _on_done(self, task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Lỗi trong callback hẹn giờ", exc_info=task.exception())
@@ -0,0 +1,11 @@
+# ========== TÍNH ĐIỂM ==========
+def calculate_points(attempts_used, max_attempts, streak=0, difficulty_level=1, is_pvp=False):
+    base_points = max(10, (100 - attempts_used * 10) * difficulty_level)
+    streak_bonus = streak * 5
+    
+    # Điểm thưởng cho PvP
+    if is_pvp:
+        base_points *= 1.5
+    
+    # Áp dụng double points nếu có
+    return int(base_points + streak_bonus)
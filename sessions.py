@@ -0,0 +1,234 @@
+import time
+import base64
+import binascii
+import random
+import struct
+import asyncio
+
+# Cờ gợi ý đã dùng trong một ván (lưu thành bitmask thay vì list)
+HINT_TYPE = 1
+HINT_RANGE = 2
+
+
+# ========== ĐỊNH DẠNG LƯU VÁN ==========
+# Ván đang chơi được lưu thành một chuỗi base64 ngắn gói bằng struct (như lịch
+# sử ván), không kèm hẹn giờ hay khoá: đọc lại trăm nghìn chuỗi nhanh hơn nhiều
+# so với list số JSON. Mốc thời gian monotonic không còn ý nghĩa sau khi khởi
+# động lại nên được đổi sang giờ hệ thống (epoch) bằng offset. Hạn chót = lần
+# hoạt động cuối + thời gian chờ, nên from_record cần cùng timeout với to_record.
+# Ván đơn: user_id, bí mật, lượt đã đoán, lượt tối đa, thấp, cao, cấp, phạt,
+#          gợi ý đã dùng, bắt đầu, hạn chót
+SOLO_RECORD = struct.Struct("<qiiiiiiiBdd")
+# PvP: người thách, đối thủ, bí mật, lượt người thách, lượt đối thủ, lượt tối đa,
+#      thấp, cao, cấp, bắt đầu, hạn chót
+PVP_RECORD = struct.Struct("<qqiiiiiiidd")
+# Lời mời: người thách, đối thủ, hạn chót
+CHALLENGE_RECORD = struct.Struct("<qqd")
+
+
+def wall_offset():
+    return time.time() - time.monotonic()
+
+
+def _pack(layout, *fields):
+    return base64.b64encode(layout.pack(*fields)).decode('ascii')
+
+
+def _unpack(layout, text):
+    # Bản ghi hỏng luôn báo ValueError (binascii.Error là lớp con của ValueError)
+    try:
+        return layout.unpack(binascii.a2b_base64(text))
+    except struct.error as e:
+        raise ValueError(f"bản ghi ván không hợp lệ: {e}") from None
+
+
+# ========== VÁN CHƠI ĐƠN ==========
+class GameSession:
+    __slots__ = (
+        "user_id", "secret", "attempts", "max_attempts", "low", "high",
+        "level", "penalty", "used_hints", "started", "last_active",
+    )
+    kind = "solo"
+
+    def __init__(self, user_id, secret, level):
+        # level: bản ghi levels.Level của ván
+        self.user_id = user_id
+        self.secret = secret
+        self.attempts = 0
+        self.max_attempts = level.attempts
+        self.low = level.low
+        self.high = level.high
+        self.level = level.level
+        self.penalty = level.penalty
+        self.used_hints = 0
+        self.started = self.last_active = time.monotonic()
+
+    @property
+    def attempts_left(self):
+        return self.max_attempts - self.attempts
+
+    def to_record(self, offset, timeout):
+        return _pack(
+            SOLO_RECORD, self.user_id, self.secret, self.attempts, self.max_attempts, self.low,
+            self.high, self.level, self.penalty, self.used_hints,
+            self.started + offset, self.last_active + timeout + offset,
+        )
+
+    @classmethod
+    def from_record(cls, record, offset, timeout):
+        session = cls.__new__(cls)
+        (session.user_id, session.secret, session.attempts, session.max_attempts, session.low,
+         session.high, session.level, session.penalty, session.used_hints,
+         started, deadline) = _unpack(SOLO_RECORD, record)
+        session.started = started - offset
+        session.last_active = deadline - timeout - offset
+        return session
+
+
+# ========== HỆ THỐNG PvP ==========
+class PvPChallenge:
+    __slots__ = ("challenger_id", "opponent_id", "created")
+
+    def __init__(self, challenger_id, opponent_id):
+        self.challenger_id = challenger_id
+        self.opponent_id = opponent_id
+        self.created = time.monotonic()
+
+    def to_record(self, offset, timeout):
+        return _pack(CHALLENGE_RECORD, self.challenger_id, self.opponent_id, self.created + timeout + offset)
+
+    @classmethod
+    def from_record(cls, record, offset, timeout):
+        challenge = cls.__new__(cls)
+        challenge.challenger_id, challenge.opponent_id, deadline = _unpack(CHALLENGE_RECORD, record)
+        challenge.created = deadline - timeout - offset
+        return challenge
+
+
+class PvPGame:
+    __slots__ = (
+        "challenger_id", "opponent_id", "secret", "low", "high", "level",
+        "challenger_attempts", "opponent_attempts", "max_attempts",
+        "winner", "started", "last_active", "lock",
+    )
+    kind = "pvp"
+
+    def __init__(self, challenger_id, opponent_id, level):
+        self.challenger_id = challenger_id
+        self.opponent_id = opponent_id
+        self.low = level.low
+        self.high = level.high
+        self.level = level.level
+        self.secret = random.randint(self.low, self.high)
+        self.challenger_attempts = 0
+        self.opponent_attempts = 0
+        self.max_attempts = level.attempts
+        self.winner = None
+        self.started = self.last_active = time.monotonic()
+        # Hai người chơi có thể đoán cùng lúc: mọi thay đổi trạng thái trận đi qua khoá này
+        self.lock = asyncio.Lock()
+
+    @property
+    def game_id(self):
+        return (self.challenger_id, self.opponent_id)
+
+    def players(self):
+        return (self.challenger_id, self.opponent_id)
+
+    def opponent_of(self, player_id):
+        return self.opponent_id if player_id == self.challenger_id else self.challenger_id
+
+    def attempts_of(self, player_id):
+        return self.challenger_attempts if player_id == self.challenger_id else self.opponent_attempts
+
+    def attempts_left(self, player_id):
+        return self.max_attempts - self.attempts_of(player_id)
+
+    @property
+    def exhausted(self):
+        return (self.challenger_attempts >= self.max_attempts
+                and self.opponent_attempts >= self.max_attempts)
+
+    def make_guess(self, player_id, guess):
+        self.last_active = time.monotonic()
+        if player_id == self.challenger_id:
+            self.challenger_attempts += 1
+        else:
+            self.opponent_attempts += 1
+
+        if guess == self.secret:
+            self.winner = player_id
+            return "win"
+        elif guess < self.secret:
+            return "higher"
+        else:
+            return "lower"
+
+    def to_record(self, offset, timeout):
+        return _pack(
+            PVP_RECORD, self.challenger_id, self.opponent_id, self.secret, self.challenger_attempts,
+            self.opponent_attempts, self.max_attempts, self.low, self.high, self.level,
+            self.started + offset, self.last_active + timeout + offset,
+        )
+
+    @classmethod
+    def from_record(cls, record, offset, timeout):
+        game = cls.__new__(cls)
+        (game.challenger_id, game.opponent_id, game.secret, game.challenger_attempts,
+         game.opponent_attempts, game.max_attempts, game.low, game.high, game.level,
+         started, deadline) = _unpack(PVP_RECORD, record)
+        game.winner = None
+        game.started = started - offset
+        game.last_active = deadline - timeout - offset
+        game.lock = asyncio.Lock()
+        return game
+
+
+# ========== CHỈ MỤC NGƯỜI CHƠI -> VÁN ==========
+# Một dict duy nhất user_id -> ván đang chơi (đơn hoặc PvP), nên mọi update
+# được định tuyến tới đúng ván bằng một lần tra cứu.
+class SessionIndex:
+    def __init__(self):
+        self._by_user = {}
+        self.pvp_count = 0
+
+    def get(self, user_id):
+        return self._by_user.get(user_id)
+
+    def solo(self, user_id):
+        session = self._by_user.get(user_id)
+        return session if session is not None and session.kind == "solo" else None
+
+    def pvp(self, user_id):
+        session = self._by_user.get(user_id)
+        return session if session is not None and session.kind == "pvp" else None
+
+    def add(self, session):
+        if session.kind == "pvp":
+            for user_id in session.players():
+                self._by_user[user_id] = session
+            self.pvp_count += 1
+        else:
+            self._by_user[session.user_id] = session
+
+    def remove(self, session):
+        # Chỉ gỡ nếu người chơi vẫn đang trỏ tới đúng ván này
+        removed = False
+        users = session.players() if session.kind == "pvp" else (session.user_id,)
+        for user_id in users:
+            if self._by_user.get(user_id) is session:
+                del self._by_user[user_id]
+                removed = True
+        if removed and session.kind == "pvp":
+            self.pvp_count -= 1
+        return removed
+
+    def __contains__(self, user_id):
+        return user_id in self._by_user
+
+    def __len__(self):
+        return len(self._by_user)
+
+    @property
+    def solo_count(self):
+        return len(self._by_user) - 2 * self.pvp_count
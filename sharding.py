@@ -0,0 +1,579 @@
+import os
+import re
+import sys
+import time
+import zlib
+import asyncio
+import logging
+import threading
+import multiprocessing
+
+from names import NameCache
+from outbox import GLOBAL_RATE, GROUP_RATE
+from pipeline import UpdatePipeline
+
+logger = logging.getLogger(__name__)
+
+# ========== CẤU HÌNH ==========
+CLAIM_TIMEOUT = 5.0      # giây chờ shard khác nhả người chơi trước khi coi là "bận"
+QUERY_TIMEOUT = 2.0      # giây chờ các shard khác trả lời truy vấn bảng xếp hạng
+IDLE_CHECK_INTERVAL = 1.0
+MATCHMAKING_SHARD = 0    # shard giữ hàng chờ /pvp queue của cả bot
+POLL_TIMEOUT = 30
+
+# ========== GIAO THỨC ==========
+# front -> worker:
+#   ("update", dict)               update Telegram dạng dict
+#   ("release", uid, to_shard)     nhả người chơi cho shard khác (xử lý theo thứ tự cùng update)
+#   ("adopt", uid, record, guest)  nhận bản ghi người chơi (guest=True nếu không phải shard nhà)
+#   ("claim_failed", uid)          không mượn được người chơi
+#   ("usernames", {username: uid}) các @username được nhắc tới trong update kế tiếp
+#   ("query", qid, from, kind, period, value)  shard khác hỏi top/hạng của shard này
+#   ("answer", qid, result)        câu trả lời cho truy vấn qid của shard này
+#   ("stop",)
+# worker -> front:
+#   ("request", uid, to_shard)     xin chuyển người chơi về to_shard (mượn hoặc trả về nhà)
+#   ("handoff", uid, record, to)   bản ghi người chơi vừa được nhả (record=None: từ chối vì đang bận)
+#   ("query", qid, from, kind, period, value)  hỏi mọi shard khác (front chuyển tiếp)
+#   ("answer", qid, to, result)    trả lời truy vấn của shard to
+#   ("tournament", chat_id, active) nhóm chat_id bắt đầu/kết thúc giải đấu
+#   ("sent", shard, method, params) chỉ ở chế độ giả lập: lời gọi Bot API của worker
+#   ("stopped", shard)
+#
+# Mỗi người chơi có một shard nhà = crc32(user_id) % N. Trận PvP giữa hai shard
+# được chơi trên shard của người thách đấu: người kia được "mượn" sang (bản ghi
+# đi kèm, update của họ được định tuyến sang đó) và được trả về nhà khi rảnh.
+# Trong lúc chuyển, front giữ lại update của người chơi đó rồi gửi tiếp theo
+# đúng thứ tự sau khi bản ghi đã tới shard mới.
+#
+# Front thấy mọi update nên giữ bảng @username -> uid cho cả bot và báo cho
+# worker các username được nhắc tới ngay trước update đó. Bảng xếp hạng tổng
+# và theo kỳ được gộp từ câu trả lời "query" của tất cả các shard.
+#
+# Giải đấu nhóm chạy trên shard của nhóm (crc32(chat_id) % N): /tournament
+# được định tuyến theo chat id, và trong lúc giải đấu diễn ra thì tin nhắn
+# thường của nhóm cũng vậy. Người thắng được mượn về shard đó để cộng điểm.
+#
+# Hàng chờ /pvp queue chỉ có ở MATCHMAKING_SHARD: lệnh được định tuyến tới
+# đó và người chơi được mượn về, nên người chờ ở mọi shard ghép được với
+# nhau; họ ở lại đó (không rảnh) cho tới khi rời hàng chờ hoặc hết trận.
+#
+# Worker xử lý update song song qua UpdatePipeline theo khoá người chơi, nên
+# một handler đang chờ mượn người chơi hay chờ shard khác trả lời chỉ làm
+# chậm chính người chơi đó. Lệnh "release" đi cùng khoá nên vẫn chạy sau mọi
+# update của người chơi đã nhận trước nó.
+
+
+def shard_for(user_id, shards):
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+def update_sender(data):
+    # Lấy người gửi từ update dạng dict mà không cần dựng đối tượng Update
+    for key in ("message", "edited_message", "callback_query", "inline_query",
+                "chosen_inline_result", "my_chat_member", "chat_member"):
+        obj = data.get(key)
+        if obj is not None and "from" in obj:
+            return obj["from"]
+    return None
+
+
+def update_user_id(data):
+    sender = update_sender(data)
+    return None if sender is None else sender["id"]
+
+
+MENTION = re.compile(r"@(\w{3,32})")
+
+
+def message_key(message):
+    # Update và lệnh nhả của cùng một người chơi chạy tuần tự theo thứ tự nhận
+    if message[0] == "release":
+        return message[1]
+    user_id = update_user_id(message[1])
+    if user_id is not None:
+        return user_id
+    chat = (message[1].get("message") or {}).get("chat")
+    return None if chat is None else chat["id"]
+
+
+def update_group_message(data):
+    # Tin nhắn trong nhóm (không phải chat riêng), hoặc None
+    message = data.get("message")
+    if message is None or message["chat"]["type"] == "private":
+        return None
+    return message
+
+
+def update_mentions(data):
+    message = data.get("message") or data.get("edited_message")
+    if message is None:
+        return []
+    return MENTION.findall(message.get("text", ""))
+
+
+# ========== PROCESS NHẬN UPDATE ==========
+class ShardRouter:
+    def __init__(self, shards, token, fake=False, data_dir='.', on_sent=None):
+        self.shards = shards
+        self.token = token
+        self.fake = fake
+        self.data_dir = data_dir
+        self.on_sent = on_sent
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._inboxes = [self._ctx.Queue() for _ in range(shards)]
+        self._outbox = self._ctx.Queue()
+        self._workers = []
+        self._pump = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self._owner = {}      # user_id -> shard đang giữ (nếu khác shard nhà)
+        self._moving = {}     # user_id -> (shard đích, update bị giữ lại)
+        self.names = NameCache()  # chỉ dùng bảng username -> uid
+        self._tournaments = set()  # chat_id nhóm đang có giải đấu
+        self.routed = [0] * shards
+        self.handoffs = 0
+
+    def owner(self, user_id):
+        return self._owner.get(user_id, shard_for(user_id, self.shards))
+
+    def start(self):
+        for shard in range(self.shards):
+            worker = self._ctx.Process(
+                target=run_worker,
+                args=(shard, self.shards, self._inboxes[shard], self._outbox,
+                      self.token, self.fake, self.data_dir),
+                name=f"shard-{shard}",
+            )
+            worker.start()
+            self._workers.append(worker)
+        self._pump = threading.Thread(target=self._pump_outbox, name="shard-outbox", daemon=True)
+        self._pump.start()
+
+    def route(self, data):
+        sender = update_sender(data)
+        user_id = None if sender is None else sender["id"]
+        with self._lock:
+            if sender is not None:
+                self.names.remember(str(user_id), None, sender.get("username"))
+            shard = self._fixed_shard(data)
+            if shard is not None:
+                self._send(shard, data)
+                return
+            if user_id is None:
+                shard = 0
+            elif user_id in self._moving:
+                self._moving[user_id][1].append(data)
+                return
+            else:
+                shard = self.owner(user_id)
+            self._send(shard, data)
+
+    def _fixed_shard(self, data):
+        # Shard xử lý update không phụ thuộc người gửi: giải đấu nhóm và hàng chờ ghép trận
+        message = data.get("message")
+        if message is None:
+            return None
+        text = message.get("text", "")
+        words = text.split()
+        command = words[0].split("@")[0] if text.startswith("/") else None
+        if command == "/pvp" and words[1:2] == ["queue"]:
+            return MATCHMAKING_SHARD
+        if update_group_message(data) is None:
+            return None
+        chat_id = message["chat"]["id"]
+        if command == "/tournament" or (command is None and chat_id in self._tournaments):
+            return shard_for(chat_id, self.shards)
+        return None
+
+    def _send(self, shard, data):
+        # Người được nhắc tới có thể thuộc shard khác: báo uid của họ trước update
+        usernames = {}
+        for username in update_mentions(data):
+            uid = self.names.find_username(username)
+            if uid is not None:
+                usernames[username] = uid
+        if usernames:
+            self._inboxes[shard].put(("usernames", usernames))
+        self.routed[shard] += 1
+        self._inboxes[shard].put(("update", data))
+
+    def _pump_outbox(self):
+        stopped = 0
+        while stopped < self.shards:
+            message = self._outbox.get()
+            kind = message[0]
+            if kind == "request":
+                self._on_request(*message[1:])
+            elif kind == "handoff":
+                self._on_handoff(*message[1:])
+            elif kind == "query":
+                from_shard = message[2]
+                for shard in range(self.shards):
+                    if shard != from_shard:
+                        self._inboxes[shard].put(message)
+            elif kind == "answer":
+                query_id, to_shard, result = message[1:]
+                self._inboxes[to_shard].put(("answer", query_id, result))
+            elif kind == "tournament":
+                with self._lock:
+                    if message[2]:
+                        self._tournaments.add(message[1])
+                    else:
+                        self._tournaments.discard(message[1])
+            elif kind == "sent":
+                if self.on_sent is not None:
+                    self.on_sent(*message[1:])
+            elif kind == "stopped":
+                stopped += 1
+        self._stopped.set()
+
+    def _on_request(self, user_id, to_shard):
+        with self._lock:
+            if user_id in self._moving:
+                self._inboxes[to_shard].put(("claim_failed", user_id))
+                return
+            current = self.owner(user_id)
+            if current == to_shard:
+                # Đã ở đúng shard (ví dụ hai yêu cầu trùng nhau)
+                self._inboxes[to_shard].put(("adopt", user_id, None, False))
+                return
+            self._moving[user_id] = (to_shard, [])
+            self._inboxes[current].put(("release", user_id, to_shard))
+
+    def _on_handoff(self, user_id, record, to_shard):
+        with self._lock:
+            target, held = self._moving.pop(user_id, (to_shard, []))
+            if record is None:
+                # Shard đang giữ từ chối vì người chơi đang bận: update giữ lại quay về chỗ cũ
+                current = self.owner(user_id)
+                self._inboxes[target].put(("claim_failed", user_id))
+            else:
+                self.handoffs += 1
+                home = shard_for(user_id, self.shards)
+                if target == home:
+                    self._owner.pop(user_id, None)
+                else:
+                    self._owner[user_id] = target
+                current = target
+                self._inboxes[target].put(("adopt", user_id, record, target != home))
+            for data in held:
+                self._send(current, data)
+
+    def stop(self, timeout=30):
+        for inbox in self._inboxes:
+            inbox.put(("stop",))
+        self._stopped.wait(timeout)
+        for worker in self._workers:
+            worker.join(timeout)
+
+
+# ========== PROCESS WORKER ==========
+def run_worker(shard, shards, inbox, outbox, token, fake, data_dir):
+    # Process spawn không kế thừa cấu hình logging của process chính
+    logging.basicConfig(
+        format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    # Mỗi shard có file dữ liệu riêng; phải đặt trước khi import bot
+    os.environ["SCORE_FILE"] = os.path.join(data_dir, f"score_data.shard{shard}.json")
+    os.environ["SQLITE_FILE"] = os.path.join(data_dir, f"score_data.shard{shard}.db")
+    os.environ["SESSIONS_FILE"] = os.path.join(data_dir, f"score_data.shard{shard}.sessions.json")
+    os.environ.setdefault("BOT_TOKEN", token)
+    if os.getenv("METRICS_PORT"):
+        # Mỗi worker có cổng /metrics riêng: METRICS_PORT + 1 + số shard
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + 1 + shard)
+    if fake:
+        # Bot API giả và người chơi mô phỏng không bị giới hạn tốc độ
+        os.environ.setdefault("OUTBOX_GLOBAL_RATE", "1000000")
+        os.environ.setdefault("OUTBOX_CHAT_RATE", "1000000")
+        os.environ.setdefault("OUTBOX_GROUP_RATE", "1000000")
+        os.environ.setdefault("FLOOD_RATE", "1000000")
+    else:
+        # Giới hạn của Telegram tính cho cả bot chứ không cho từng process:
+        # mỗi shard chỉ được 1/N hạn mức chung và hạn mức của mỗi nhóm (tin
+        # riêng thì chat nào cũng chỉ do shard của người đó gửi)
+        global_rate = float(os.getenv("OUTBOX_GLOBAL_RATE", GLOBAL_RATE))
+        group_rate = float(os.getenv("OUTBOX_GROUP_RATE", GROUP_RATE))
+        os.environ["OUTBOX_GLOBAL_RATE"] = str(global_rate / shards)
+        os.environ["OUTBOX_GROUP_RATE"] = str(group_rate / shards)
+    asyncio.run(ShardWorker(shard, shards, inbox, outbox, token, fake).run())
+
+
+class ShardWorker:
+    def __init__(self, shard, shards, inbox, outbox, token, fake):
+        self.shard = shard
+        self.shards = shards
+        self.inbox = inbox
+        self.outbox = outbox
+        self.token = token
+        self.fake = fake
+        self._claims = {}
+        self._away = set()  # người chơi nhà đang được shard khác mượn
+        self._queries = {}  # qid -> (future, các câu trả lời đã nhận)
+        self._next_query = 0
+
+    async def run(self):
+        import guess_number_bot as bot
+        self.bot = bot
+
+        request = None
+        if self.fake:
+            from fake_telegram import FakeTelegramRequest
+            request = FakeTelegramRequest(
+                sink=lambda method, params: self.outbox.put(("sent", self.shard, method, params))
+            )
+        bot.claim_user = self.claim
+        bot.query_shards = self.query
+        bot.tournament_router = lambda chat_id, active: self.outbox.put(("tournament", chat_id, active))
+        bot.is_home = lambda user_id: shard_for(user_id, self.shards) == self.shard
+        bot.load_data()
+        app = bot.build_application(self.token, request=request, polling=False)
+        await app.initialize()
+        await bot.on_startup(app)
+
+        work = asyncio.Queue()
+        processor = asyncio.create_task(self._process(app, work))
+        idle_checker = asyncio.create_task(self._release_idle_guests())
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self.inbox.get)
+            kind = message[0]
+            if kind == "adopt":
+                # Xử lý ngay để handler đang chờ claim() không bị kẹt sau hàng đợi
+                self._on_adopt(*message[1:])
+            elif kind == "claim_failed":
+                self._resolve_claim(message[1], False)
+            elif kind == "usernames":
+                # Tới trước update nhắc tới họ nên ghi nhận ngay
+                for username, uid in message[1].items():
+                    bot.name_cache.remember(uid, None, username)
+            elif kind == "query":
+                # Trả lời ngay, không xếp sau update: shard hỏi đang chờ trong handler
+                query_id, from_shard, query, period, value = message[1:]
+                try:
+                    result = bot.answer_query(query, period, value)
+                except Exception as e:
+                    logger.error(f"Shard {self.shard}: lỗi khi trả lời truy vấn {query}: {e}")
+                    continue
+                self.outbox.put(("answer", query_id, from_shard, result))
+            elif kind == "answer":
+                self._on_answer(*message[1:])
+            elif kind == "stop":
+                await work.put(None)
+                break
+            else:
+                await work.put(message)
+
+        await processor
+        idle_checker.cancel()
+        await bot.on_shutdown(app)
+        await app.shutdown()
+        self.outbox.put(("stopped", self.shard))
+
+    async def _process(self, app, work):
+        pipeline = UpdatePipeline(
+            lambda message: self._handle(app, message),
+            concurrency=self.bot.PIPELINE_CONCURRENCY, max_pending=self.bot.PIPELINE_MAX_PENDING,
+            key=message_key,
+        )
+        pipeline.start()
+        while True:
+            message = await work.get()
+            if message is None:
+                break
+            await pipeline.submit(message)
+        await pipeline.stop()
+
+    async def _handle(self, app, message):
+        from telegram import Update
+        if message[0] == "update":
+            await app.process_update(Update.de_json(message[1], app.bot))
+        elif message[0] == "release":
+            self._on_release(*message[1:])
+
+    # ========== TRUY VẤN CÁC SHARD KHÁC ==========
+    async def query(self, kind, period, value):
+        # Trả về câu trả lời của các shard khác; shard nào quá QUERY_TIMEOUT
+        # chưa trả lời thì bị bỏ qua thay vì làm treo lệnh
+        if self.shards == 1:
+            return []
+        self._next_query += 1
+        query_id = self._next_query
+        future = asyncio.get_running_loop().create_future()
+        answers = []
+        self._queries[query_id] = (future, answers)
+        self.outbox.put(("query", query_id, self.shard, kind, period, value))
+        try:
+            await asyncio.wait_for(future, QUERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Shard {self.shard}: chỉ {len(answers)}/{self.shards - 1} shard trả lời truy vấn {kind}")
+        finally:
+            del self._queries[query_id]
+        return answers
+
+    def _on_answer(self, query_id, result):
+        entry = self._queries.get(query_id)
+        if entry is None:
+            return
+        future, answers = entry
+        answers.append(result)
+        if len(answers) == self.shards - 1 and not future.done():
+            future.set_result(None)
+
+    # ========== MƯỢN / TRẢ NGƯỜI CHƠI ==========
+    async def claim(self, user_id):
+        if shard_for(user_id, self.shards) == self.shard and str(user_id) not in self._away:
+            return True
+        if str(user_id) in self.bot.guest_players:
+            return True
+        future = self._claims.get(user_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._claims[user_id] = future
+            self.outbox.put(("request", user_id, self.shard))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), CLAIM_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Bản ghi có thể tới muộn; khi đó người chơi được trả về nhà lúc rảnh
+            return False
+
+    def _resolve_claim(self, user_id, ok):
+        future = self._claims.pop(user_id, None)
+        if future is not None and not future.done():
+            future.set_result(ok)
+
+    def _on_adopt(self, user_id, record, guest):
+        self._away.discard(str(user_id))
+        self.bot.import_player(user_id, record, guest)
+        self._resolve_claim(user_id, True)
+
+    def _on_release(self, user_id, to_shard):
+        if not self.bot.is_idle(user_id):
+            self.outbox.put(("handoff", user_id, None, to_shard))
+            return
+        # get_player nạp lại bản ghi nếu đã bị đẩy khỏi cache
+        self.bot.get_player(user_id)
+        record = self.bot.export_player(user_id)
+        if shard_for(user_id, self.shards) == self.shard:
+            self._away.add(str(user_id))
+        self.outbox.put(("handoff", user_id, record, to_shard))
+
+    async def _release_idle_guests(self):
+        # Trả người chơi được mượn về shard nhà khi họ không còn ván/lời mời nào
+        requested = set()
+        while True:
+            await asyncio.sleep(IDLE_CHECK_INTERVAL)
+            for uid in list(self.bot.guest_players):
+                user_id = int(uid)
+                if uid in requested or not self.bot.is_idle(user_id):
+                    continue
+                requested.add(uid)
+                self.outbox.put(("request", user_id, shard_for(user_id, self.shards)))
+            requested &= self.bot.guest_players
+
+
+# ========== ĐẦU VÀO UPDATE ==========
+async def poll_updates(router, token):
+    # Long polling như run_polling(), nhưng chỉ chuyển tiếp update dạng dict cho worker
+    from telegram import Bot
+    async with Bot(token) as bot:
+        offset = None
+        while True:
+            updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT)
+            for update in updates:
+                router.route(update.to_dict())
+                offset = update.update_id + 1
+
+
+def run_front(shards, token):
+    router = ShardRouter(shards, token)
+    router.start()
+    logger.info(f"✅ Bot đang chạy với {shards} shard...")
+    try:
+        asyncio.run(poll_updates(router, token))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        router.stop()
+
+
+def run_fake(shards, players, guesses, data_dir):
+    # Chạy offline: nguồn update giả, worker dùng Bot API giả và báo lại tin đã gửi
+    from fake_telegram import FAKE_TOKEN, FakeUpdateSource, make_message_update
+    sent = [0] * shards
+    texts = {}  # chat_id -> các tin nhắn bot đã gửi
+
+    def on_sent(shard, method, params):
+        sent[shard] += 1
+        if "text" in params:
+            texts.setdefault(int(params["chat_id"]), []).append(params["text"])
+
+    router = ShardRouter(shards, FAKE_TOKEN, fake=True, data_dir=data_dir, on_sent=on_sent)
+    started = time.perf_counter()
+    router.start()
+    for data in FakeUpdateSource(players, guesses, seed=1):
+        router.route(data)
+    # Một trận PvP giữa hai người chơi thuộc hai shard khác nhau
+    a, b = 1000, next(u for u in range(1001, 1000 + players) if shard_for(u, shards) != shard_for(1000, shards))
+    router.route(make_message_update(a, "/giveup"))
+    router.route(make_message_update(b, "/giveup"))
+    router.route(make_message_update(a, f"/pvp @player{b}"))
+    deadline = time.monotonic() + 30
+    while router.owner(b) != shard_for(a, shards) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    router.route(make_message_update(b, "/pvp accept"))
+    router.route(make_message_update(b, "/giveup"))
+    time.sleep(IDLE_CHECK_INTERVAL * 3)
+    # Hạng và bảng xếp hạng được gộp từ mọi shard
+    router.route(make_message_update(a, "/stats"))
+    time.sleep(0.5)
+    rank_line = next((line for line in texts[a][-1].splitlines() if "Hạng" in line), "-")
+    router.route(make_message_update(a, "/leaderboard"))
+    time.sleep(0.5)
+    board_size = texts[a][-1].count("điểm\n")
+    # Giải đấu trong một nhóm, người đoán thuộc mọi shard
+    group = -1000
+    router.route(make_message_update(a, "/tournament 1", chat_id=group, chat_type="group"))
+    time.sleep(0.5)
+    for value in range(1, 51):
+        router.route(make_message_update(1000 + value % players, str(value), chat_id=group, chat_type="group"))
+    time.sleep(1)
+    result = next((text for text in texts.get(group, ()) if "giải đấu" in text and "🏁" not in text), "-").splitlines()
+    # Hàng chờ ghép trận chung: hai người chơi mới thuộc hai shard khác nhau
+    c = 1000 + players
+    d = next(u for u in range(c + 1, c + 100) if shard_for(u, shards) != shard_for(c, shards))
+    router.route(make_message_update(c, "/pvp queue"))
+    router.route(make_message_update(d, "/pvp queue"))
+    time.sleep(1)
+    matched = any("Trận đấu PvP đã bắt đầu" in text for text in texts.get(d, ()))
+    router.route(make_message_update(c, "/giveup"))
+    router.route(make_message_update(d, "/giveup"))
+    time.sleep(0.5)
+    router.stop()
+    elapsed = time.perf_counter() - started
+    print(f"{players} người chơi, {shards} shard, {elapsed:.2f}s")
+    print(f"update theo shard: {router.routed}")
+    print(f"tin nhắn gửi theo shard: {sent}")
+    print(f"số lần chuyển người chơi giữa shard: {router.handoffs}")
+    print(f"/stats của {a}: {rank_line.strip()}; /leaderboard: {board_size} người")
+    print(f"giải đấu: {' '.join(result[:2])}")
+    print(f"/pvp queue ở hai shard: {'đã ghép trận' if matched else 'không ghép được'}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if len(sys.argv) > 1 and sys.argv[1] == "--fake":
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            run_fake(int(os.getenv("BOT_SHARDS", "2")), int(sys.argv[2]) if len(sys.argv) > 2 else 200, 5, tmp)
+    else:
+        token = os.getenv("BOT_TOKEN")
+        if not token:
+            raise ValueError("Vui lòng cung cấp BOT_TOKEN trong biến môi trường")
+        run_front(int(os.getenv("BOT_SHARDS", "2")), token)
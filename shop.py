@@ -0,0 +1,91 @@
+from typing import NamedTuple
+
+# ========== CỬA HÀNG ==========
+# charges: vật phẩm kích hoạt ngay khi mua, cộng vào active_bonuses số ván
+# được hưởng thay vì nằm trong inventory
+SHOP_ITEMS = {
+    "extra_attempt": {"price": 30, "desc": "+1 lượt đoán", "type": "game"},
+    "hint_type": {"price": 20, "desc": "Gợi ý chẵn/lẻ", "type": "hint"},
+    "hint_range": {"price": 40, "desc": "Gợi ý khoảng ±50", "type": "hint"},
+    "change_secret": {"price": 50, "desc": "Đổi số bí mật", "type": "game"},
+    "streak_protector": {"price": 100, "desc": "Bảo vệ streak khi thua", "type": "bonus"},
+    "double_points": {"price": 150, "desc": "Nhận 2x điểm trong 3 ván", "type": "bonus", "charges": 3},
+}
+SHOP_CATEGORIES = (("game", "Vật phẩm trò chơi"), ("hint", "Gợi ý"), ("bonus", "Bonus"))
+MAX_BUY_QUANTITY = 99
+
+
+class Item(NamedTuple):
+    item_id: str
+    price: int
+    desc: str
+    category: str
+    charges: int    # 0: vào inventory, >0: số ván bonus được cộng khi mua
+
+
+ITEMS = {
+    item_id: Item(item_id, spec["price"], spec["desc"], spec["type"], spec.get("charges", 0))
+    for item_id, spec in SHOP_ITEMS.items()
+}
+# Danh mục -> các vật phẩm, tính sẵn một lần cho menu cửa hàng
+ITEMS_BY_CATEGORY = {
+    category: tuple(item for item in ITEMS.values() if item.category == category)
+    for category, _ in SHOP_CATEGORIES
+}
+
+
+# ========== SỔ VẬT PHẨM VÀ BONUS ==========
+# player["inventory"]: item_id -> số lượng còn lại
+# player["active_bonuses"]: item_id -> số ván bonus còn lại
+# Các hàm dưới đây là chỗ duy nhất sửa hai dict này. Mỗi hàm trả về việc có
+# thay đổi hay không để người gọi chỉ ghi dữ liệu khi thật sự có thay đổi;
+# mục về 0 bị xoá nên bản ghi chỉ chứa những gì người chơi đang có.
+def quote(item, quantity):
+    # Tổng giá, hoặc None nếu số lượng không hợp lệ
+    if not 1 <= quantity <= MAX_BUY_QUANTITY:
+        return None
+    return item.price * quantity
+
+
+def grant(player, item, quantity):
+    if item.charges:
+        bonuses = player.setdefault("active_bonuses", {})
+        bonuses[item.item_id] = bonuses.get(item.item_id, 0) + item.charges * quantity
+    else:
+        inventory = player.setdefault("inventory", {})
+        inventory[item.item_id] = inventory.get(item.item_id, 0) + quantity
+
+
+def count(player, item_id):
+    return player.get("inventory", {}).get(item_id, 0)
+
+
+def consume(player, item_id):
+    # Dùng một vật phẩm; False nếu không còn
+    return _take(player.get("inventory"), item_id)
+
+
+def has_bonus(player, item_id):
+    return player.get("active_bonuses", {}).get(item_id, 0) > 0
+
+
+def use_bonus(player, item_id):
+    # Trừ một ván bonus; False nếu bonus không còn hiệu lực
+    return _take(player.get("active_bonuses"), item_id)
+
+
+def _take(ledger, item_id):
+    if not ledger:
+        return False
+    left = ledger.get(item_id, 0)
+    if left <= 0:
+        return False
+    if left == 1:
+        del ledger[item_id]
+    else:
+        ledger[item_id] = left - 1
+    return True
+
+
+def total_items(player):
+    return sum(player.get("inventory", {}).values())
@@ -0,0 +1,522 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# ========== CẤU HÌNH ==========
+WAL_SUFFIX = '.wal'
+COMPACTING_SUFFIX = '.wal.compacting'
+FSYNC_BATCH = 64             # fsync sau mỗi N bản ghi
+FSYNC_INTERVAL = 1.0         # hoặc sau N giây kể từ lần fsync trước
+COMPACT_THRESHOLD = 4 * 1024 * 1024  # nén log khi vượt 4MB
+FLUSH_INTERVAL = 2.0         # ghi các thay đổi dồn lại sau mỗi N giây
+FLUSH_BATCH_SIZE = 500       # hoặc ngay khi có N người chơi thay đổi
+CACHE_SIZE = 10000           # số người chơi "nóng" giữ trong RAM với backend SQLite
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def _fsync_dir(path):
+    # Đảm bảo thao tác rename được ghi xuống đĩa (bỏ qua trên hệ thống không hỗ trợ)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _read_snapshot(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _replay_log(path, data):
+    # Mỗi dòng là một bản ghi {"u": uid, "d": dữ liệu}; dòng cuối bị ghi dở sẽ bị bỏ qua
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.endswith('\n'):
+                logger.warning(f"Bỏ qua bản ghi ghi dở ở cuối {path} (dòng {lineno})")
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"Bỏ qua bản ghi hỏng trong {path} (dòng {lineno})")
+                continue
+            data[entry["u"]] = entry["d"]
+            count += 1
+    return count
+
+
+def _write_snapshot(path, data):
+    # Ghi ra file tạm rồi os.replace để snapshot không bao giờ bị ghi dở
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(_dumps(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+# ========== GIAO DIỆN LƯU TRỮ ==========
+# Mỗi backend tự cài encode(items), chạy trên event loop để chụp lại bản ghi,
+# và write_encoded(payload, count), chạy trong thread executor. Backend có
+# in_memory = True giữ toàn bộ người chơi trong RAM (load_all) và xếp hạng bằng
+# RankIndex; ngược lại người chơi được đọc theo yêu cầu qua load_one và backend
+# tự trả lời top(k) từ chỉ mục điểm của mình.
+class StorageBackend:
+    in_memory = True
+
+    def load_all(self):
+        return {}
+
+    def load_one(self, uid):
+        return None
+
+    def iter_records(self, marker):
+        # (uid, bản ghi) của những người chơi có trường `marker`
+        return iter(())
+
+    def payload_size(self, payload):
+        # Kích thước (byte, xấp xỉ) của payload đã mã hoá, dùng cho số đo
+        return len(payload)
+
+    def compact(self, wait=False):
+        return False
+
+    def close(self):
+        pass
+
+
+# ========== WRITE-AHEAD LOG ==========
+# Snapshot JSON (cùng định dạng score_data.json cũ) + log chỉ ghi thêm bản ghi
+# của những người chơi vừa thay đổi. Log được nén vào snapshot ở luồng nền.
+# prune_empty: bản ghi rỗng đánh dấu khoá đã bị xoá và được bỏ khi nén.
+class WalStore(StorageBackend):
+    def __init__(self, path, fsync_batch=FSYNC_BATCH, fsync_interval=FSYNC_INTERVAL,
+                 compact_threshold=COMPACT_THRESHOLD, prune_empty=False):
+        self.path = path
+        self.log_path = path + WAL_SUFFIX
+        self.compacting_path = path + COMPACTING_SUFFIX
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.prune_empty = prune_empty
+
+        self._log = None
+        self._log_size = 0
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._lock = threading.Lock()
+        self._compactor = None
+
+    def load_all(self):
+        data = _read_snapshot(self.path)
+        # Log đang nén dở từ lần chạy trước được phát lại trước log hiện tại
+        replayed = _replay_log(self.compacting_path, data)
+        replayed += _replay_log(self.log_path, data)
+        if replayed:
+            logger.info(f"Đã phát lại {replayed} bản ghi từ log")
+        self._open_log()
+        if os.path.exists(self.compacting_path):
+            self.compact()
+        return data
+
+    def _open_log(self):
+        self._truncate_torn_tail()
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        self._log_size = self._log.tell()
+
+    def _truncate_torn_tail(self):
+        # Cắt bỏ bản ghi ghi dở ở cuối log để bản ghi mới không bị dính vào nó
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                idx = chunk.rfind(b'\n')
+                if idx != -1:
+                    pos = pos - step + idx + 1
+                    break
+                pos -= step
+            f.truncate(pos)
+
+    def append(self, uid, record):
+        self.append_many([(uid, record)])
+
+    def append_many(self, items):
+        if items:
+            self.write_encoded(self.encode(items), len(items))
+
+    def encode(self, items):
+        return ''.join(_dumps({"u": uid, "d": record}) + '\n' for uid, record in items)
+
+    def write_encoded(self, lines, count):
+        # Có thể gọi từ luồng khác: mọi thao tác với file đều nằm trong self._lock
+        with self._lock:
+            if self._log is None:
+                self._open_log()
+            self._log.write(lines)
+            self._log.flush()
+            self._log_size += len(lines)
+            self._unsynced += count
+            now = time.monotonic()
+            if self._unsynced >= self.fsync_batch or now - self._last_fsync >= self.fsync_interval:
+                self._fsync_locked(now)
+            if self._log_size >= self.compact_threshold:
+                self._start_compaction_locked()
+
+    def sync(self):
+        with self._lock:
+            if self._log is not None and self._unsynced:
+                self._fsync_locked(time.monotonic())
+
+    def _fsync_locked(self, now):
+        os.fsync(self._log.fileno())
+        self._unsynced = 0
+        self._last_fsync = now
+
+    # ========== NÉN LOG ==========
+    def compact(self, wait=False):
+        with self._lock:
+            started = self._start_compaction_locked()
+            compactor = self._compactor
+        if wait and compactor is not None:
+            compactor.join()
+        return started
+
+    def _start_compaction_locked(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return False
+        # Nếu lần nén trước chưa xong (process bị kill) thì nén nốt file cũ trước
+        if not os.path.exists(self.compacting_path):
+            if self._log is None or self._log_size == 0:
+                return False
+            self._fsync_locked(time.monotonic())
+            self._log.close()
+            os.replace(self.log_path, self.compacting_path)
+            self._open_log()
+
+        self._compactor = threading.Thread(
+            target=self._compact_worker, name='wal-compactor', daemon=True
+        )
+        self._compactor.start()
+        return True
+
+    def _compact_worker(self):
+        # Chỉ đọc các file trên đĩa nên không đụng tới dữ liệu đang được event loop sửa
+        started = time.monotonic()
+        try:
+            data = _read_snapshot(self.path)
+            count = _replay_log(self.compacting_path, data)
+            if self.prune_empty:
+                data = {key: record for key, record in data.items() if record}
+            _write_snapshot(self.path, data)
+            os.remove(self.compacting_path)
+            logger.info(
+                f"Đã nén {count} bản ghi vào snapshot ({len(data)} người chơi, "
+                f"{time.monotonic() - started:.2f}s)"
+            )
+        except Exception as e:
+            logger.error(f"Lỗi khi nén log dữ liệu: {e}")
+
+    def close(self):
+        with self._lock:
+            compactor = self._compactor
+            if self._log is not None:
+                self._fsync_locked(time.monotonic())
+                self._log.close()
+                self._log = None
+        if compactor is not None:
+            compactor.join()
+
+
+# ========== SQLITE ==========
+# Mỗi người chơi là một dòng; cột score được tách riêng và đánh chỉ mục để lấy
+# bảng xếp hạng mà không cần đọc toàn bộ dữ liệu. Các câu lệnh là hằng số có
+# tham số nên được sqlite3 chuẩn bị một lần và dùng lại từ statement cache.
+SQL_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS players ("
+    " uid TEXT PRIMARY KEY,"
+    " score INTEGER NOT NULL DEFAULT 0,"
+    " data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_players_score ON players (score DESC)",
+)
+SQL_SELECT_ONE = "SELECT data FROM players WHERE uid = ?"
+SQL_SELECT_TOP = "SELECT uid, data FROM players ORDER BY score DESC LIMIT ?"
+SQL_SELECT_SCORES = "SELECT score FROM players"
+SQL_SELECT_MARKED = "SELECT uid, data FROM players WHERE instr(data, ?) > 0"
+SQL_UPSERT = (
+    "INSERT INTO players (uid, score, data) VALUES (?, ?, ?) "
+    "ON CONFLICT(uid) DO UPDATE SET score = excluded.score, data = excluded.data"
+)
+
+
+class SqliteStore(StorageBackend):
+    in_memory = False
+
+    def __init__(self, path, import_from=None):
+        self.path = path
+        self.import_from = import_from
+        self._lock = threading.Lock()
+        self._reader = None
+        self._writer = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=16)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load_all(self):
+        # Một kết nối đọc cho event loop, một kết nối ghi cho thread executor;
+        # chế độ WAL cho phép đọc trong lúc đang ghi
+        self._writer = self._connect()
+        for statement in SQL_SCHEMA:
+            self._writer.execute(statement)
+        self._writer.commit()
+        self._reader = self._connect()
+
+        # Không nạp người chơi nào; chỉ nhập dữ liệu JSON cũ ở lần chạy đầu tiên
+        if self.import_from and os.path.exists(self.import_from):
+            empty = self._reader.execute("SELECT 1 FROM players LIMIT 1").fetchone() is None
+            if empty:
+                data = _read_snapshot(self.import_from)
+                _replay_log(self.import_from + WAL_SUFFIX, data)
+                self.write_encoded(self.encode(data.items()), len(data))
+                logger.info(f"Đã nhập {len(data)} người chơi từ {self.import_from}")
+        return {}
+
+    def load_one(self, uid):
+        row = self._reader.execute(SQL_SELECT_ONE, (uid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def top(self, k):
+        return [(uid, json.loads(data)) for uid, data in self._reader.execute(SQL_SELECT_TOP, (k,))]
+
+    def iter_scores(self):
+        # Chỉ đọc cột điểm, để dựng bảng đếm xếp hạng lúc khởi động
+        return (score for score, in self._reader.execute(SQL_SELECT_SCORES))
+
+    def iter_records(self, marker):
+        # Lọc thô bằng instr trong SQLite để chỉ giải mã JSON của bản ghi có trường này
+        rows = self._reader.execute(SQL_SELECT_MARKED, (f'"{marker}"',))
+        return ((uid, json.loads(data)) for uid, data in rows)
+
+    def encode(self, items):
+        return [(uid, record.get("score", 0), _dumps(record)) for uid, record in items]
+
+    def write_encoded(self, payload, count):
+        with self._lock:
+            with self._writer:
+                self._writer.executemany(SQL_UPSERT, payload)
+
+    def payload_size(self, payload):
+        return sum(len(row[2]) for row in payload)
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._writer.close()
+                self._reader = self._writer = None
+
+
+def open_backend(kind, json_path, sqlite_path):
+    if kind == "sqlite":
+        return SqliteStore(sqlite_path, import_from=json_path)
+    if kind == "json":
+        return WalStore(json_path)
+    raise ValueError(f"Backend lưu trữ không hợp lệ: {kind}")
+
+
+# ========== BỘ NHỚ ĐỆM NGƯỜI CHƠI ==========
+# Với backend in_memory, cache chứa toàn bộ người chơi và không bao giờ loại bỏ.
+# Với SQLite, chỉ giữ tối đa `capacity` người chơi dùng gần nhất (LRU); người
+# chơi còn thay đổi chưa ghi (is_pinned) không bao giờ bị loại khỏi cache.
+class PlayerCache:
+    def __init__(self, backend, capacity=CACHE_SIZE, is_pinned=None):
+        self.backend = backend
+        self.capacity = None if backend.in_memory else capacity
+        self.is_pinned = is_pinned or (lambda uid: False)
+        self._records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        self._records = OrderedDict(self.backend.load_all())
+
+    def get(self, uid):
+        record = self._records.get(uid)
+        if record is not None:
+            self.hits += 1
+            if self.capacity is not None:
+                self._records.move_to_end(uid)
+            return record
+        self.misses += 1
+        record = self.backend.load_one(uid)
+        if record is not None:
+            self.put(uid, record)
+        return record
+
+    def peek(self, uid):
+        return self._records.get(uid)
+
+    def pop(self, uid):
+        return self._records.pop(uid, None)
+
+    def put(self, uid, record):
+        self._records[uid] = record
+        if self.capacity is not None:
+            self._records.move_to_end(uid)
+            if len(self._records) > self.capacity:
+                self.trim()
+
+    def trim(self):
+        if self.capacity is None:
+            return
+        excess = len(self._records) - self.capacity
+        for uid in list(self._records):
+            if excess <= 0:
+                break
+            if not self.is_pinned(uid):
+                del self._records[uid]
+                excess -= 1
+
+    def scores(self):
+        # (uid, điểm) của mọi người chơi, chỉ dùng với backend in_memory; backend
+        # còn lại xếp hạng thẳng trên CSDL (ranking.StoreRanking)
+        return ((uid, r.get("score", 0)) for uid, r in self._records.items())
+
+    def records(self, marker):
+        # Các bản ghi có trường `marker`, kể cả người chơi chưa nạp vào cache
+        if self.backend.in_memory:
+            return ((uid, r) for uid, r in self._records.items() if marker in r)
+        return self.backend.iter_records(marker)
+
+    def __len__(self):
+        return len(self._records)
+
+    def items(self):
+        return self._records.items()
+
+
+# ========== GHI TRỄ (WRITE-BEHIND) ==========
+# Gom các người chơi thay đổi vào một tập "bẩn" và ghi chúng theo lô từ một task
+# nền. Bản ghi được mã hoá trên event loop (để không bị sửa giữa chừng), còn việc
+# ghi file và fsync chạy trong thread executor.
+class WriteBehindFlusher:
+    def __init__(self, store, get_record, interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH_SIZE,
+                 on_flushed=None):
+        self.store = store
+        self.get_record = get_record
+        self.on_flushed = on_flushed
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self.dirty = set()
+        self.in_flight = set()
+        self.flush_count = 0
+        self.records_written = 0
+        self.bytes_written = 0
+        # observer(giây, số bản ghi, số byte) được gọi sau mỗi lần ghi thành công
+        self.observer = None
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+
+    def mark_dirty(self, uid):
+        self.dirty.add(uid)
+        if len(self.dirty) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Lỗi khi lưu file dữ liệu: {e}")
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self.dirty:
+                return 0
+            uids, self.dirty = self.dirty, set()
+            items = []
+            for uid in uids:
+                record = self.get_record(uid)
+                if record is not None:
+                    items.append((uid, record))
+            started = time.perf_counter()
+            payload = self.store.encode(items)
+            size = self.store.payload_size(payload)
+            loop = asyncio.get_running_loop()
+            # Giữ người chơi trong cache cho tới khi ghi xong để không đọc lại bản cũ
+            self.in_flight = uids
+            try:
+                await loop.run_in_executor(None, self.store.write_encoded, payload, len(items))
+            except Exception:
+                # Ghi lỗi thì giữ lại để lần sau thử lại
+                self.dirty |= uids
+                raise
+            finally:
+                self.in_flight = set()
+            if self.on_flushed is not None:
+                self.on_flushed()
+            self.flush_count += 1
+            self.records_written += len(items)
+            self.bytes_written += size
+            if self.observer is not None:
+                self.observer(time.perf_counter() - started, len(items), size)
+            return len(items)
+
+    async def stop(self):
+        # Dừng task nền rồi luôn ghi nốt những gì còn lại
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
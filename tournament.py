@@ -0,0 +1,78 @@
+import time
+import random
+
+# ========== CẤU HÌNH ==========
+TOURNAMENT_DURATION = 300  # giây, giải kết thúc nếu chưa ai đoán đúng
+STATUS_INTERVAL = 5        # giây giữa hai lần sửa tin trạng thái (nhóm chỉ ~20 tin/phút)
+
+# Kết quả của một lượt đoán
+WIN = "win"
+HIGHER = "higher"
+LOWER = "lower"
+OUT_OF_RANGE = "range"
+NO_ATTEMPTS = "quota"
+FINISHED = "over"
+
+
+# ========== GIẢI ĐẤU NHÓM ==========
+# Cả nhóm cùng đoán một số bí mật. Lượt đoán không được trả lời riêng: giải
+# chỉ cộng dồn số liệu (người tham gia, số lượt, khoảng đã thu hẹp) và đánh
+# dấu "có thay đổi" để tin trạng thái được sửa định kỳ. guess() là hàm đồng bộ,
+# không await, nên dù nhiều update chạy song song thì người đoán đúng đầu tiên
+# luôn là duy nhất: những lượt sau thấy winner đã được đặt và nhận FINISHED.
+class Tournament:
+    __slots__ = (
+        "chat_id", "secret", "low", "high", "level", "quota", "attempts",
+        "lower_bound", "upper_bound", "guesses", "winner", "started", "deadline",
+        "status_message_id", "changed",
+    )
+    kind = "tournament"
+
+    def __init__(self, chat_id, level, duration=TOURNAMENT_DURATION, rng=random):
+        # level: bản ghi levels.Level; số bí mật chọn trong cả phạm vi như PvP
+        self.chat_id = chat_id
+        self.low = level.low
+        self.high = level.high
+        self.level = level.level
+        self.quota = level.attempts
+        self.secret = rng.randint(self.low, self.high)
+        self.attempts = {}  # user_id -> số lượt đã dùng
+        # Khoảng chắc chắn chứa số bí mật, thu hẹp theo các lượt đoán sai
+        self.lower_bound = self.low
+        self.upper_bound = self.high
+        self.guesses = 0
+        self.winner = None
+        self.started = time.monotonic()
+        self.deadline = self.started + duration
+        self.status_message_id = None
+        self.changed = True
+
+    def guess(self, user_id, value):
+        if self.winner is not None:
+            return FINISHED
+        if not self.low <= value <= self.high:
+            return OUT_OF_RANGE
+        used = self.attempts.get(user_id, 0)
+        if used >= self.quota:
+            return NO_ATTEMPTS
+        self.attempts[user_id] = used + 1
+        self.guesses += 1
+        self.changed = True
+        if value == self.secret:
+            self.winner = user_id
+            return WIN
+        if value < self.secret:
+            self.lower_bound = max(self.lower_bound, value + 1)
+            return HIGHER
+        self.upper_bound = min(self.upper_bound, value - 1)
+        return LOWER
+
+    def attempts_of(self, user_id):
+        return self.attempts.get(user_id, 0)
+
+    @property
+    def players(self):
+        return len(self.attempts)
+
+    def seconds_left(self, now=None):
+        return max(0, self.deadline - (now or time.monotonic()))
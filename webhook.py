@@ -0,0 +1,139 @@
+import json
+import signal
+import asyncio
+import logging
+
+from telegram import Update
+
+from pipeline import UpdatePipeline, PIPELINE_CONCURRENCY, PIPELINE_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+# ========== CẤU HÌNH ==========
+MAX_BODY_SIZE = 1 << 20   # Telegram không gửi update nào lớn hơn thế này
+KEEPALIVE_TIMEOUT = 75    # giây chờ request tiếp theo trên cùng kết nối
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+# ========== HTTP SERVER NHẬN WEBHOOK ==========
+# Server HTTP/1.1 tối giản trên asyncio (không cần tornado như run_webhook của
+# python-telegram-bot). Mỗi request POST là một update; update được đưa vào
+# UpdatePipeline và trả lời 200 ngay. Khi pipeline đầy, submit() chờ nên câu
+# trả lời đến chậm hơn và Telegram tự giảm tốc (tối đa max_connections request
+# đồng thời), không update nào bị bỏ.
+class WebhookServer:
+    def __init__(self, bot, pipeline, path="/", secret=None, listen="0.0.0.0", port=8443):
+        self.bot = bot
+        self.pipeline = pipeline
+        self.path = path
+        self.secret = secret
+        self.listen = listen
+        self.port = port
+        self._server = None
+        self.requests = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.listen, self.port)
+        # port=0 -> hệ điều hành chọn cổng trống (dùng khi chạy thử offline)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    self._respond(writer, 413, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status = await self._handle(method, target, headers, body)
+                close = headers.get("connection", "").lower() == "close"
+                self._respond(writer, status, close)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, method, target, headers, body):
+        self.requests += 1
+        if target.split("?", 1)[0] != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        if self.secret and headers.get(SECRET_HEADER) != self.secret:
+            return 403
+        try:
+            update = Update.de_json(json.loads(body), self.bot)
+        except (ValueError, TypeError, KeyError):
+            return 400
+        if update is None:
+            return 400
+        await self.pipeline.submit(update)
+        return 200
+
+    def _respond(self, writer, status, close=False):
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode("latin-1")
+        )
+
+
+# ========== CHẠY BOT Ở CHẾ ĐỘ WEBHOOK ==========
+async def serve_webhook(app, url=None, listen="0.0.0.0", port=8443, path="/", secret=None,
+                        concurrency=PIPELINE_CONCURRENCY, max_pending=PIPELINE_MAX_PENDING,
+                        max_connections=40, stop_event=None, on_ready=None):
+    # app phải được dựng với updater(None); url=None thì không đăng ký webhook
+    # với Telegram (dùng khi chạy offline với fake_telegram)
+    await app.initialize()
+    if app.post_init is not None:
+        await app.post_init(app)
+    pipeline = UpdatePipeline(app.process_update, concurrency, max_pending)
+    pipeline.start()
+    server = WebhookServer(app.bot, pipeline, path, secret, listen, port)
+    await server.start()
+    if url:
+        await app.bot.set_webhook(url, secret_token=secret, max_connections=max_connections)
+    logger.info(f"✅ Bot đang chạy (webhook, cổng {server.port}, {concurrency} luồng xử lý)...")
+    if on_ready is not None:
+        on_ready(server, pipeline)
+
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+    try:
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        await pipeline.stop()
+        if app.post_shutdown is not None:
+            await app.post_shutdown(app)
+        await app.shutdown()
+    return pipeline.stats()